@@ -0,0 +1,117 @@
+"""
+Assisted generation benchmark of the validator LLM.
+
+Runs `src.modules.llms.llama.process` on the challenge prompts with and
+without a draft model, and reports the tokens per second of both, the
+speedup and the acceptance rate of the draft tokens. The model is a tiny
+random-weight Llama of `tiny_models`; the draft model is the same model cut
+to its first `--draft-layers` layers, so it shares the tokenizer. The
+outputs of the layers the draft model lacks are scaled by `--residual-scale`,
+so the draft model agrees with the model on most tokens, as a distilled draft
+model would. Greedy outputs must be the same with and without the draft
+model; the command exits with status 1 otherwise.
+
+Usage:
+    python3 -m benchmarks.assisted [--layers 16] [--draft-layers 1] [--residual-scale 0.02] [--prompts 2] [--output assisted.json]
+"""
+
+import os
+
+# CPU only and offline, before torch and transformers are imported
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+os.environ["HF_HUB_OFFLINE"] = "1"
+
+import copy
+import json
+import logging
+
+import torch
+import typer
+
+from src.modules.llms import assisted, llama
+from src.utils.constants import ASSISTANT_MODELS, LANGUAGES, MODELS, PROMPTS, TOPICS
+from src.utils.utils import logger
+
+from . import tiny_models
+
+DRAFT_ID = "tiny-draft"
+
+
+def draft_model(model, layers: int):
+    """
+    The first `layers` layers of `model`, with its embeddings and head.
+    """
+    draft = copy.deepcopy(model)
+    draft.model.layers = draft.model.layers[:layers]
+    draft.config.num_hidden_layers = layers
+    return draft
+
+
+def scale_residuals(model, first_layer: int, scale: float):
+    """
+    Scale what the layers from `first_layer` on add to the residual stream.
+    """
+    with torch.no_grad():
+        for layer in model.model.layers[first_layer:]:
+            layer.self_attn.o_proj.weight.mul_(scale)
+            layer.mlp.down_proj.weight.mul_(scale)
+
+
+def _run(prompts: list, assistant: bool) -> tuple[list[str], dict]:
+    ASSISTANT_MODELS[llama.__name__] = DRAFT_ID if assistant else None
+    assisted.STATS.clear()
+    outputs = [llama.process(messages, torch.device("cpu")) for messages in prompts]
+    return outputs, dict(assisted.STATS[llama.__name__])
+
+
+def main(
+    hidden_size: int = typer.Option(512, help="Hidden size of the model"),
+    layers: int = typer.Option(16, help="Layers of the model"),
+    draft_layers: int = typer.Option(1, help="Layers of the draft model"),
+    residual_scale: float = typer.Option(0.02, help="Scale of the outputs of the layers missing from the draft model"),
+    prompts: int = typer.Option(2, help="Challenge prompts, alternating stories and translations"),
+    seed: int = typer.Option(0, help="Seed of the weights"),
+    output: str = typer.Option(None, help="Path to write the results as JSON"),
+):
+    # random weights never end an answer before the token budget
+    logger.logger.setLevel(logging.ERROR)
+    model, tokenizer = tiny_models.tiny_llama("cpu", hidden_size=hidden_size, layers=layers, seed=seed)
+    model.generation_config.do_sample = False
+    scale_residuals(model, draft_layers, residual_scale)
+    MODELS["llama"] = (model, tokenizer)
+    MODELS[f"assistant:{DRAFT_ID}"] = draft_model(model, draft_layers)
+
+    conversations = []
+    for index in range(prompts):
+        language = LANGUAGES[index % len(LANGUAGES)]
+        if index % 2 == 0:
+            conversations.append([{"role": "system", "content": PROMPTS["GENERATE_INPUT_DATA"].format(topic=TOPICS[index % len(TOPICS)], source_language=language)}])
+        else:
+            conversations.append([
+                {"role": "system", "content": PROMPTS["GENERATE_OUTPUT_DATA"].format(source_language="English", target_language=language)},
+                {"role": "user", "content": PROMPTS["GENERATE_INPUT_DATA"].format(topic=TOPICS[index % len(TOPICS)], source_language="English")},
+            ])
+
+    _run(conversations[:1], assistant=True)  # warmup
+    baseline_outputs, baseline = _run(conversations, assistant=False)
+    assisted_outputs, stats = _run(conversations, assistant=True)
+
+    same = baseline_outputs == assisted_outputs
+    speedup = stats["tokens_s"] / baseline["tokens_s"] if baseline["tokens_s"] else 0.0
+    print(f"{'':<10} {'tokens':>7} {'tokens/s':>9} {'rounds':>7} {'drafted':>8} {'accepted':>9}")
+    for name, values in (("baseline", baseline), ("assisted", stats)):
+        print(
+            f"{name:<10} {values['new_tokens']:>7} {values['tokens_s']:>9.1f} {values['model_calls']:>7} "
+            f"{values['draft_tokens']:>8} {values['accepted_tokens']:>9}"
+        )
+    print(f"acceptance rate {stats['acceptance_rate'] or 0:.1%}, speedup {speedup:.2f}x, same greedy outputs: {same}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"baseline": baseline, "assisted": stats, "speedup": speedup, "same_outputs": same}, f, indent=2)
+    if not same:
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,201 @@
+"""
+In-process stand-in for the chain and the miners of a subnet.
+
+`FakeCommuneClient` answers the chain queries the validator and the API make
+(`query_map_address`, `query_map_key`, `query_map_weights`) and records the
+votes of `vote_encrypted`, for a synthetic subnet of any size, after a
+configurable latency. Its miners are `FakeMiner` endpoints, reached through
+`FakeModuleClient`, which answer a `forward` call with a synthetic answer
+after their own latency, or fail or time out at configurable rates. Nothing
+goes over the network, so the whole `validate_step` runs offline.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from communex.errors import NetworkTimeoutError  # type: ignore
+from communex.types import Ss58Address  # type: ignore
+from substrateinterface import Keypair  # type: ignore
+
+from src.utils.serialization import audio_encode
+
+from . import synthetic
+
+
+def _ss58(name: str) -> Ss58Address:
+    seed = hashlib.sha256(name.encode()).hexdigest()
+    return Keypair.create_from_seed(seed).ss58_address
+
+
+@dataclass
+class FakeMiner:
+    """
+    A miner endpoint answering after `latency` seconds (+/- `jitter` as a
+    fraction), failing a share `failure_rate` of the calls and letting a share
+    `timeout_rate` of them time out.
+    """
+
+    uid: int
+    key: Ss58Address
+    ip: str
+    port: int
+    latency: float = 0.5
+    jitter: float = 0.5
+    failure_rate: float = 0.0
+    timeout_rate: float = 0.0
+    answer_words: int = 16
+    answer_seconds: float = 4.0
+
+    async def forward(self, synapse: dict, timeout: float, rng: random.Random) -> str:
+        draw = rng.random()
+        if draw < self.timeout_rate:
+            await asyncio.sleep(timeout)
+            raise NetworkTimeoutError(f"The call took longer than the timeout of {timeout} second(s)")
+        latency = self.latency * rng.uniform(1 - self.jitter, 1 + self.jitter)
+        if latency >= timeout:
+            await asyncio.sleep(timeout)
+            raise NetworkTimeoutError(f"The call took longer than the timeout of {timeout} second(s)")
+        await asyncio.sleep(latency)
+        if draw < self.timeout_rate + self.failure_rate:
+            raise Exception("Unexpected status code: 500, response: Internal Server Error")
+
+        request = synapse["translation_request"]
+        return json.dumps({"translation_request": request, "miner_response": self.answer(request)})
+
+    def answer(self, request: dict) -> str:
+        if request["task_string"].endswith("speech"):
+            return _speech_answer(self.answer_seconds, self.uid % 8)
+        if request["task_string"].startswith("text"):
+            return request["input"]
+        return synthetic.text(request["target_language"], self.answer_words, seed=self.uid)
+
+
+_speech_answers: dict[tuple[float, int], str] = {}
+
+
+def _speech_answer(seconds: float, seed: int) -> str:
+    # a few clips are enough, encoding them for every call would dominate the fan-out
+    if (seconds, seed) not in _speech_answers:
+        _speech_answers[(seconds, seed)] = audio_encode(synthetic.speech(seconds, seed=seed))
+    return _speech_answers[(seconds, seed)]
+
+
+class FakeModuleClient:
+    """
+    Drop-in for `ModuleClient`, calling the `FakeMiner` registered at its
+    address instead of a server.
+    """
+
+    def __init__(self, chain: "FakeCommuneClient", host: str, port: int, key: Keypair):
+        self.chain = chain
+        self.host = host
+        self.port = int(port)
+        self.key = key
+
+    async def call(self, fn: str, target_key: Ss58Address, params: dict = {}, timeout: int = 16):
+        miner = self.chain.endpoints.get((self.host, self.port))
+        if miner is None:
+            raise Exception(f"Cannot connect to host {self.host}:{self.port}")
+        if fn != "forward" or miner.key != target_key:
+            raise Exception("Unexpected status code: 401, response: Invalid signature")
+        return await miner.forward(params["synapse"], timeout, self.chain.rng)
+
+
+class FakeCommuneClient:
+    """
+    Drop-in for `CommuneClient` serving a synthetic subnet.
+
+    Every query sleeps for `latency` seconds, the time of a round trip to a
+    node. The validators (`validator_keys`) are registered first, without an
+    address, and already voted for random miners; the miners follow.
+    """
+
+    def __init__(
+        self,
+        miners: list[FakeMiner],
+        validator_keys: list[Ss58Address],
+        netuid: int = 0,
+        latency: float = 0.0,
+        seed: int = 0,
+    ):
+        self.netuid = netuid
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.validator_keys = dict(enumerate(validator_keys))
+        self.miners = {miner.uid: miner for miner in miners}
+        self.endpoints = {(miner.ip, miner.port): miner for miner in miners}
+        miner_uids = list(self.miners)
+        self.weights: dict[int, list[tuple[int, int]]] = {
+            uid: [(miner_uid, self.rng.randint(1, 1000)) for miner_uid in sorted(self.rng.sample(miner_uids, min(len(miner_uids), 64)))]
+            for uid in self.validator_keys
+        }
+        self.votes: list[dict] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def synthetic(
+        cls,
+        size: int,
+        validator_keys: list[Ss58Address],
+        netuid: int = 0,
+        latency: float = 0.0,
+        miner_latency: float = 0.5,
+        jitter: float = 0.5,
+        failure_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        seed: int = 0,
+    ) -> "FakeCommuneClient":
+        """
+        A subnet of `size` miners behind `validator_keys`, all with the same
+        latency and error rates.
+        """
+        offset = len(validator_keys)
+        miners = [
+            FakeMiner(
+                uid=offset + index,
+                key=_ss58(f"miner-{seed}-{index}"),
+                ip=f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+                port=8000 + index % 1000,
+                latency=miner_latency,
+                jitter=jitter,
+                failure_rate=failure_rate,
+                timeout_rate=timeout_rate,
+            )
+            for index in range(size)
+        ]
+        return cls(miners, validator_keys, netuid=netuid, latency=latency, seed=seed)
+
+    def _query(self, netuid: int):
+        if netuid != self.netuid:
+            raise ValueError(f"Subnet {netuid} does not exist")
+        time.sleep(self.latency)
+
+    def query_map_address(self, netuid: int = 0, extract_value: bool = False) -> dict[int, str]:
+        self._query(netuid)
+        return {uid: f"{miner.ip}:{miner.port}" for uid, miner in self.miners.items()}
+
+    def query_map_key(self, netuid: int = 0, extract_value: bool = False) -> dict[int, Ss58Address]:
+        self._query(netuid)
+        return {**self.validator_keys, **{uid: miner.key for uid, miner in self.miners.items()}}
+
+    def query_map_weights(self, netuid: int = 0, extract_value: bool = False) -> dict[int, list[tuple[int, int]]]:
+        self._query(netuid)
+        with self._lock:
+            return {uid: list(weights) for uid, weights in self.weights.items()}
+
+    def vote_encrypted(self, key: Keypair, uids: list[int], weights: list[int], netuid: int = 0):
+        self._query(netuid)
+        validator_uids = [uid for uid, ss58 in self.validator_keys.items() if ss58 == key.ss58_address]
+        if not validator_uids:
+            raise ValueError(f"Key {key.ss58_address} is not a validator of subnet {netuid}")
+        with self._lock:
+            self.weights[validator_uids[0]] = list(zip(uids, weights))
+            self.votes.append({"key": key.ss58_address, "uids": list(uids), "weights": list(weights), "ts": time.time()})
+
+    def module_client(self, host: str, port: int, key: Keypair) -> FakeModuleClient:
+        return FakeModuleClient(self, host, port, key)
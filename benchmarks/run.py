@@ -0,0 +1,261 @@
+"""
+Offline benchmark of the translation, TTS and LLM modules and of the
+validator pipeline.
+
+Every target runs against the tiny random-weight models of `tiny_models`, on
+CPU and without network, over a sweep of task × input length × batch size.
+Every case runs in a fresh process, so its peak RSS is its own. The results
+are written as JSON; `--compare` checks them against a stored baseline and
+exits with status 1 when a case regressed.
+
+Input length is in words; speech inputs last as long as the words take to
+say. Batch size is the number of inputs per call for the TTS, which takes a
+list, and the number of back to back requests for the other targets, which
+take one input per call.
+
+Usage:
+    python3 -m benchmarks.run [--targets translation,tts,llm,validator] [--lengths 8,32,128] [--batches 1,4] [--output results.json]
+    python3 -m benchmarks.run --compare baseline.json [--tolerance 0.2]
+"""
+
+import os
+
+# CPU only and offline, before torch and transformers are imported
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+os.environ["HF_HUB_OFFLINE"] = "1"
+
+import json
+import logging
+import platform
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Optional
+
+import typer
+
+TARGETS = ("translation", "tts", "llm", "validator")
+TASKS = ("text2text", "text2speech", "speech2text", "speech2speech")
+
+# words per second of speech
+SPEECH_RATE = 2.5
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cases(targets: list[str], tasks: list[str], lengths: list[int], batches: list[int]) -> list[dict]:
+    cases = []
+    for target in targets:
+        if target == "translation":
+            cases += [{"target": target, "task": task, "length": length, "batch": batch} for task in tasks for length in lengths for batch in batches]
+        elif target in ("tts", "llm"):
+            cases += [{"target": target, "task": target, "length": length, "batch": batch} for length in lengths for batch in batches]
+        elif target == "validator":
+            # the LLM sets the length of the challenge, one challenge per step
+            cases += [{"target": target, "task": task, "length": None, "batch": 1} for task in tasks]
+        else:
+            raise typer.BadParameter(f"Unknown target {target}")
+    return cases
+
+
+def _case_key(case: dict) -> str:
+    return f"{case['target']}/{case['task']}/{case['length']}/{case['batch']}"
+
+
+def _prepare(case: dict, source_language: str, target_language: str, llm_backend: str):
+    """
+    Build the tiny models and the inputs of a case, and return the function
+    running one measured call.
+    """
+    from src.utils.constants import MODELS, PROMPTS, TOPICS
+    from src.utils.serialization import audio_decode, audio_encode
+
+    from . import synthetic, tiny_models
+
+    tiny_models.install("cpu")
+    model, processor = MODELS["seamless:cpu"]
+    target, task, length, batch = case["target"], case["task"], case["length"], case["batch"]
+
+    if length is not None:
+        texts = [synthetic.text(source_language, length, seed=index) for index in range(batch)]
+        # a translation is about as long as its source
+        reference = synthetic.text(target_language, length)
+        tiny_models.set_output_tokens(model, len(processor.tokenizer(reference).input_ids))
+
+    if target == "translation":
+        from src.modules.translation.translation import Translation
+
+        translation = Translation("cpu")
+        if task.startswith("speech"):
+            inputs = [audio_encode(synthetic.speech(length / SPEECH_RATE, seed=index)) for index in range(batch)]
+        else:
+            inputs = texts
+        requests = [
+            {"input": data, "task_string": task, "source_language": source_language, "target_language": target_language}
+            for data in inputs
+        ]
+        return lambda: [translation.process(dict(request)) for request in requests]
+
+    if target == "tts":
+        from src.modules.tts import seamless as tts
+
+        return lambda: tts.process_batch([(text, source_language) for text in texts], "cpu")
+
+    if target == "llm":
+        from src.modules.llms.backends import load_backends
+
+        llm = load_backends(llm_backend, "cpu")[0]
+        conversations = [
+            [
+                {"role": "system", "content": PROMPTS["GENERATE_OUTPUT_DATA"].format(source_language=source_language, target_language=target_language)},
+                {"role": "user", "content": text},
+            ]
+            for text in texts
+        ]
+        return lambda: [llm.generate(messages) for messages in conversations]
+
+    from src.modules.translation.translation import Translation
+    from src.validator.validator import Validator
+
+    # no chain and no miners: the challenge is answered by a local translation
+    tiny_models.set_output_tokens(model, 32)
+    validator = Validator(key=None, netuid=0, client=None, llm_backend=llm_backend)
+    translation = Translation("cpu")
+
+    def step():
+        query = validator.generate_query(target_language, source_language, task, TOPICS[0])
+        request = dict(query)
+        if task.startswith("speech"):
+            request["input"] = audio_encode(query["input"])
+        answer = translation.process(request)
+        if task.endswith("speech"):
+            answer = audio_decode(answer)
+        return validator.process_validator_output(answer, query["output"], task)
+
+    return step
+
+
+def run_case(case: dict, repeats: int, source_language: str, target_language: str, llm_backend: str, threads: Optional[int], seed: int) -> dict:
+    """
+    Measure one case. Runs in its own process.
+    """
+    import torch
+
+    from src.utils.utils import logger
+
+    torch.manual_seed(seed)
+    if threads:
+        torch.set_num_threads(threads)
+    # the modules log every request, and random weights never end an answer
+    # before the token budget, which would log a warning for every call
+    logger.logger.setLevel(logging.ERROR)
+
+    call = _prepare(case, source_language, target_language, llm_backend)
+    model_rss = _peak_rss()
+    call()  # warmup
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    median = statistics.median(latencies)
+    return {
+        **case,
+        "latency_s": {"p50": median, "min": min(latencies), "max": max(latencies), "mean": statistics.fmean(latencies)},
+        "throughput_items_s": case["batch"] / median,
+        "peak_rss_bytes": _peak_rss(),
+        "model_rss_bytes": model_rss,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    """
+    The cases whose median latency or peak RSS grew by more than `tolerance`
+    (a fraction) over the baseline. Cases missing from either side are skipped.
+    """
+    baseline_cases = {_case_key(case): case for case in baseline}
+    regressions = []
+    for case in results:
+        before = baseline_cases.get(_case_key(case))
+        if before is None:
+            continue
+        for metric, now, then in (
+            ("latency_s.p50", case["latency_s"]["p50"], before["latency_s"]["p50"]),
+            ("peak_rss_bytes", case["peak_rss_bytes"], before["peak_rss_bytes"]),
+        ):
+            change = now / then - 1 if then else 0.0
+            if change > tolerance:
+                regressions.append({"case": _case_key(case), "metric": metric, "baseline": then, "current": now, "change": change})
+    return regressions
+
+
+def _split(value: str, cast=str) -> list:
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main(
+    targets: str = typer.Option(",".join(TARGETS), help="Comma separated targets: translation, tts, llm, validator"),
+    tasks: str = typer.Option(",".join(TASKS), help="Comma separated translation tasks"),
+    lengths: str = typer.Option("8,32,128", help="Comma separated input lengths, in words"),
+    batches: str = typer.Option("1,4", help="Comma separated batch sizes"),
+    repeats: int = typer.Option(5, help="Measured calls per case, after one warmup call"),
+    source_language: str = typer.Option("English", help="Language of the inputs"),
+    target_language: str = typer.Option("French", help="Language to translate to"),
+    llm_backend: str = typer.Option("hf", help="LLM backend of the llm and validator targets: hf, cpu or stub"),
+    threads: int = typer.Option(None, help="Torch threads per case, defaults to torch's default"),
+    seed: int = typer.Option(0, help="Seed of the weights and inputs"),
+    output: str = typer.Option(None, help="Path to write the results as JSON"),
+    baseline: str = typer.Option(None, "--compare", help="Results of a previous run to compare against"),
+    tolerance: float = typer.Option(0.2, help="Relative increase of latency or peak RSS reported as a regression"),
+):
+    cases = _cases(_split(targets), _split(tasks), _split(lengths, int), _split(batches, int))
+    results = []
+    for case in cases:
+        # a fresh process per case, so the peak RSS of one case is not inherited by the next
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(run_case, case, repeats, source_language, target_language, llm_backend, threads, seed).result()
+        results.append(result)
+        print(
+            f"{_case_key(case):<36} p50={result['latency_s']['p50'] * 1000:9.1f}ms "
+            f"items/s={result['throughput_items_s']:8.2f} peak_rss={result['peak_rss_bytes'] / 2**20:7.1f}MiB"
+        )
+
+    import torch
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "machine": platform.machine(),
+            "cpus": len(os.sched_getaffinity(0)),
+            "threads": threads or torch.get_num_threads(),
+        },
+        "settings": {"repeats": repeats, "source_language": source_language, "target_language": target_language, "llm_backend": llm_backend, "seed": seed},
+        "cases": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)["cases"], tolerance)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['case']} {regression['metric']}: "
+                f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['change']:+.1%})"
+            )
+        if regressions:
+            raise typer.Exit(1)
+        print(f"No regression over {tolerance:.0%} against {baseline}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,232 @@
+"""
+Micro-benchmark of the validator scoring.
+
+Times every component of `score_text` (TF-IDF cosine, BLEU, SequenceMatcher)
+and of `score_speech` (MFCC extraction, cosine, euclidean distance)
+separately, on synthetic text pairs in several scripts and lengths and on
+synthetic audio pairs of several durations. The cost per call is the median
+of `--repeats` calls. The cost per step is the cost of scoring every miner of
+a validation step against every reference answer.
+
+Every component is also checked against a reference implementation, which
+calls the libraries as the scoring originally did, so an optimized
+implementation in `src.utils.score` must return matching scores. The command
+exits with status 1 on a mismatch.
+
+Usage:
+    python3 -m benchmarks.scoring [--lengths 8,32,128,512] [--durations 2,8,30] [--miners 32] [--output scoring.json]
+"""
+
+import json
+import logging
+import random
+import statistics
+import time
+from difflib import SequenceMatcher
+
+import numpy as np
+import typer
+
+from src.utils import score
+from src.utils.constants import LLMS
+from src.utils.utils import logger
+
+from . import synthetic
+
+TEXT_COMPONENTS = ("tfidf_cosine", "bleu", "sequence_ratio", "score_text")
+SPEECH_COMPONENTS = ("mfcc_features", "mfcc_cosine", "mfcc_distance", "score_speech")
+
+
+# == Reference implementations ==
+def reference_tfidf_cosine(miner_response: str, sample_output: str) -> float:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    vectorizer = TfidfVectorizer().fit([miner_response, sample_output])
+    vectors = vectorizer.transform([miner_response, sample_output])
+    return cosine_similarity(vectors[0], vectors[1])[0][0]
+
+
+def reference_bleu(miner_response: str, sample_output: str) -> float:
+    from nltk.translate.bleu_score import sentence_bleu
+
+    return sentence_bleu([sample_output.split()], miner_response.split())
+
+
+def reference_sequence_ratio(miner_response: str, sample_output: str) -> float:
+    return SequenceMatcher(None, miner_response, sample_output).ratio()
+
+
+def reference_score_text(miner_response: str, sample_output: str) -> float:
+    return (
+        0.5 * reference_tfidf_cosine(miner_response, sample_output)
+        + 0.3 * reference_bleu(miner_response, sample_output)
+        + 0.2 * reference_sequence_ratio(miner_response, sample_output)
+    )
+
+
+def reference_mfcc_features(audio) -> np.ndarray:
+    import librosa
+
+    mfccs = librosa.feature.mfcc(y=np.array(audio.cpu()), sr=16000, n_mfcc=13)
+    return np.mean(mfccs.T, axis=0).flatten()
+
+
+def reference_mfcc_cosine(miner_mfcc: np.ndarray, sample_mfcc: np.ndarray) -> float:
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    return cosine_similarity([miner_mfcc], [sample_mfcc])[0][0]
+
+
+def reference_mfcc_distance(miner_mfcc: np.ndarray, sample_mfcc: np.ndarray) -> float:
+    from scipy.spatial.distance import euclidean
+
+    return euclidean(miner_mfcc, sample_mfcc)
+
+
+def reference_score_speech(miner_audio, sample_audio) -> float:
+    miner_mfcc = reference_mfcc_features(miner_audio)
+    sample_mfcc = reference_mfcc_features(sample_audio)
+    return 0.7 * reference_mfcc_cosine(miner_mfcc, sample_mfcc) + 0.3 * (1 / (1 + reference_mfcc_distance(miner_mfcc, sample_mfcc)))
+
+
+# == Synthetic pairs ==
+def perturb(text: str, language: str, rate: float = 0.2, seed: int = 0) -> str:
+    """
+    A miner-like answer: the reference with a share `rate` of its words (or
+    characters, for scripts written without spaces) replaced.
+    """
+    rng = random.Random(seed)
+    syllables = synthetic.SYLLABLES[synthetic.script(language)]
+    if synthetic.script(language) in synthetic.UNSPACED_SCRIPTS:
+        return "".join(rng.choice(syllables) if rng.random() < rate else character for character in text)
+    return " ".join(rng.choice(syllables) if rng.random() < rate else word for word in text.split(" "))
+
+
+def text_pairs(languages: list[str], lengths: list[int]) -> list[dict]:
+    pairs = []
+    for language in languages:
+        for length in lengths:
+            reference = synthetic.text(language, length)
+            pairs.append({"language": language, "length": length, "candidate": perturb(reference, language), "reference": reference})
+    return pairs
+
+
+def audio_pairs(durations: list[float]) -> list[dict]:
+    pairs = []
+    for seconds in durations:
+        reference = synthetic.speech(seconds)
+        # the same speech, quieter and mixed with another voice
+        candidate = 0.8 * reference + 0.2 * synthetic.speech(seconds, seed=1)
+        pairs.append({"duration": seconds, "candidate": candidate, "reference": reference})
+    return pairs
+
+
+# == Measurements ==
+def _per_call(function, args: tuple, repeats: int) -> float:
+    function(*args)  # warmup
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def _matches(value, expected, rtol: float) -> bool:
+    return bool(np.allclose(np.asarray(value, dtype=float), np.asarray(expected, dtype=float), rtol=rtol, atol=rtol * 1e-3))
+
+
+def bench_text(pair: dict, repeats: int, calls_per_step: int, rtol: float) -> list[dict]:
+    args = (pair["candidate"], pair["reference"])
+    results = []
+    for name in TEXT_COMPONENTS:
+        function, reference = getattr(score, name), globals()[f"reference_{name}"]
+        per_call = _per_call(function, args, repeats)
+        results.append({
+            "kind": "text",
+            "language": pair["language"],
+            "length": pair["length"],
+            "characters": len(pair["reference"]),
+            "component": name,
+            "per_call_s": per_call,
+            "per_step_s": per_call * calls_per_step,
+            "value": float(function(*args)),
+            "matches_reference": _matches(function(*args), reference(*args), rtol),
+        })
+    return results
+
+
+def bench_speech(pair: dict, repeats: int, calls_per_step: int, rtol: float) -> list[dict]:
+    candidate, reference_audio = pair["candidate"], pair["reference"]
+    features = (score.mfcc_features(candidate), score.mfcc_features(reference_audio))
+    arguments = {
+        "mfcc_features": (candidate,),
+        "mfcc_cosine": features,
+        "mfcc_distance": features,
+        "score_speech": (candidate, reference_audio),
+    }
+    # the features of both waveforms are extracted for every pair
+    calls = {"mfcc_features": 2 * calls_per_step}
+    results = []
+    for name in SPEECH_COMPONENTS:
+        function, reference = getattr(score, name), globals()[f"reference_{name}"]
+        args = arguments[name]
+        per_call = _per_call(function, args, repeats)
+        value = function(*args)
+        results.append({
+            "kind": "speech",
+            "duration": pair["duration"],
+            "component": name,
+            "per_call_s": per_call,
+            "per_step_s": per_call * calls.get(name, calls_per_step),
+            "value": np.asarray(value, dtype=float).tolist(),
+            "matches_reference": _matches(value, reference(*args), rtol),
+        })
+    return results
+
+
+def _split(value: str, cast=str) -> list:
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main(
+    languages: str = typer.Option("English,French,Russian,Modern Standard Arabic,Hindi,Mandarin Chinese,Japanese,Korean", help="Comma separated languages of the text pairs"),
+    lengths: str = typer.Option("8,32,128,512", help="Comma separated lengths of the text pairs, in words"),
+    durations: str = typer.Option("2,8,30", help="Comma separated durations of the audio pairs, in seconds"),
+    miners: int = typer.Option(32, help="Miners scored per validation step"),
+    repeats: int = typer.Option(20, help="Timed calls per component and pair, after one warmup call"),
+    rtol: float = typer.Option(1e-6, help="Relative tolerance of the comparison with the reference implementation"),
+    output: str = typer.Option(None, help="Path to write the results as JSON"),
+):
+    # score_text and score_speech log every call
+    logger.logger.setLevel(logging.WARNING)
+    # every answer is scored against the reference answer of every LLM
+    calls_per_step = miners * len(LLMS)
+
+    results = []
+    for pair in text_pairs(_split(languages), _split(lengths, int)):
+        results += bench_text(pair, repeats, calls_per_step, rtol)
+    for pair in audio_pairs(_split(durations, float)):
+        results += bench_speech(pair, repeats, calls_per_step, rtol)
+
+    print(f"{'pair':<28} {'component':<16} {'per call':>11} {'per step':>11}  reference")
+    for result in results:
+        pair = f"{result['language']}/{result['length']}w" if result["kind"] == "text" else f"speech/{result['duration']:g}s"
+        print(
+            f"{pair:<28} {result['component']:<16} {result['per_call_s'] * 1e6:>9.1f}us "
+            f"{result['per_step_s'] * 1000:>9.2f}ms  {'ok' if result['matches_reference'] else 'MISMATCH'}"
+        )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"settings": {"miners": miners, "references": len(LLMS), "repeats": repeats, "rtol": rtol}, "results": results}, f, indent=2)
+
+    mismatches = [result for result in results if not result["matches_reference"]]
+    if mismatches:
+        print(f"{len(mismatches)} components do not match the reference implementation")
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,88 @@
+"""
+Deterministic synthetic inputs for the benchmarks: text in the scripts of the
+subnet languages and speech-like audio, so no dataset is needed.
+"""
+
+import random
+
+import numpy as np
+import torch
+
+from src.modules.translation.data_models import TARGET_LANGUAGES
+from src.utils.audio_save_load import SAMPLE_RATE
+
+# syllables of every script, words are made of 1 to 4 of them
+SYLLABLES = {
+    "latin": [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"] + ["ch", "qu", "th", "ä", "é", "ø", "ñ"],
+    "cyrillic": [c + v for c in "бвгдзклмнпрстфхцчш" for v in "аеиоуыя"],
+    "arabic": [c + v for c in "بتثجحخدرزسشصطعفقكلمنهو" for v in ("ا", "ي", "")],
+    "devanagari": [c + v for c in "कखगचजटडतदनपबमयरलवसह" for v in ("", "ा", "ि", "ी", "ु", "े", "ो")],
+    "hangul": [chr(0xAC00 + index * 7) for index in range(400)],
+    # scripts written without spaces, one character per syllable
+    "han": list("的一是不了人我在有他这中大来上国个到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里后小么心多天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现分将外但身些与高意进把法此实回二理美点月明其种声全工己话儿者向情部正名定女问力机给等几很业最间新什打便位因重被走电四第门相次东政海口使教西再平真听世气信北少关并内加化由却代军产入先山五太水万市眼体别处总才场师书比住员九笑性通目华报立马命张活难神数件安表原车白应路期叫死常提感金何更反合放做系计或司利受光王果亲界及今京务制解各任至清物台象记边共风战干接它许八特觉望直服毛林题建南度统色字请交爱让认算论百吃义科怎元社术结六功指思非流每青管夫连远资队跟带花快条院变联言权往展该领传近留红治决周保达办运武半候七必城父强步完革深区即求品士转量空甚众技轻程告江语英基派满式李息写呢识极令黄德收脸钱党倒未持取设始版双历越史商千片容研像找友孩站广改议形委早房音火际则首单据导影失拿网香似斯专石若兵弟谁校读志飞观争究包组造落视济留"),
+    "kana": list("あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんがぎぐげござじずぜぞだでどばびぶべぼぱぴぷぺぽアイウエオカキクケコサシスセソタチツテトナニヌネノ"),
+    "thai": list("กขคงจฉชซญดตถทธนบปผพฟภมยรลวศสหอฮ"),
+}
+
+# scripts of the non Latin languages, the others are written with latin syllables
+LANGUAGE_SCRIPTS = {
+    "bel": "cyrillic", "bul": "cyrillic", "kaz": "cyrillic", "khk": "cyrillic", "kir": "cyrillic",
+    "mkd": "cyrillic", "rus": "cyrillic", "srp": "cyrillic", "tgk": "cyrillic", "ukr": "cyrillic",
+    "arb": "arabic", "ary": "arabic", "arz": "arabic", "pbt": "arabic", "pes": "arabic", "snd": "arabic", "urd": "arabic",
+    "hin": "devanagari", "mai": "devanagari", "mar": "devanagari", "npi": "devanagari",
+    "kor": "hangul",
+    "cmn": "han", "cmn_Hant": "han", "yue": "han",
+    "jpn": "kana",
+    "tha": "thai",
+}
+
+UNSPACED_SCRIPTS = {"han", "kana", "thai"}
+
+
+def script(language: str) -> str:
+    """
+    The script a language is written in, by language name or code.
+    """
+    code = TARGET_LANGUAGES.get(language, language)
+    return LANGUAGE_SCRIPTS.get(code, "latin")
+
+
+def text(language: str, words: int, seed: int = 0) -> str:
+    """
+    A sentence of `words` words in the script of `language`. Scripts written
+    without spaces (Chinese, Japanese, Thai) get one or two characters per word.
+    """
+    rng = random.Random(f"{language}:{words}:{seed}")
+    name = script(language)
+    syllables = SYLLABLES[name]
+    if name in UNSPACED_SCRIPTS:
+        return "".join(rng.choice(syllables) for _ in range(words + words // 2)) + "。"
+    tokens = ["".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(words)]
+    return " ".join(tokens).capitalize() + "."
+
+
+def corpus(seed: int = 0) -> list[str]:
+    """
+    Text in every script, to train the benchmark tokenizers on.
+    """
+    # every syllable once, so no character is unknown to the tokenizers
+    lines = [" ".join(syllables) for syllables in SYLLABLES.values()]
+    for name in sorted(set(TARGET_LANGUAGES)):
+        lines.extend(text(name, 64, seed=seed + index) for index in range(4))
+    return lines
+
+
+def speech(seconds: float, seed: int = 0) -> torch.Tensor:
+    """
+    Speech-like audio at 16 kHz, shaped (1, samples) as the TTS returns it:
+    a gliding harmonic tone with about four syllables per second and noise.
+    """
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * SAMPLE_RATE)
+    t = np.arange(samples) / SAMPLE_RATE
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.5 * t + rng.uniform(0, np.pi))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t + rng.uniform(0, np.pi)), 0, None)
+    waveform = 0.3 * voice * envelope + 0.01 * rng.standard_normal(samples)
+    return torch.from_numpy(waveform.astype(np.float32)).unsqueeze(0)
@@ -0,0 +1,212 @@
+"""
+Tiny, randomly initialized models of the same classes as the production
+models (Seamless M4T v2 and Llama), with tokenizers trained on synthetic text.
+
+Nothing is downloaded: the models are built from their configs and the
+tokenizers are trained in memory, so they run offline on any CPU. They are
+installed in `MODELS` under the keys the loaders use, so `Translation`, the
+TTS and LLM modules and the validator pick them up unchanged.
+"""
+
+import math
+
+import torch
+from tokenizers import Regex, Tokenizer, decoders, models, normalizers, pre_tokenizers, trainers
+from transformers import (
+    AddedToken,
+    GenerationConfig,
+    LlamaConfig,
+    LlamaForCausalLM,
+    PreTrainedTokenizerFast,
+    SeamlessM4TFeatureExtractor,
+    SeamlessM4TProcessor,
+    SeamlessM4TTokenizerFast,
+    SeamlessM4Tv2Config,
+    SeamlessM4Tv2Model,
+)
+
+from src.modules.translation.data_models import TARGET_LANGUAGES
+from src.utils.constants import MODELS, PROMPTS, TOPICS
+
+from . import synthetic
+
+# ids 0 to 3, in the order of the Seamless defaults
+SPECIAL_TOKENS = ["<pad>", "<unk>", "<s>", "</s>"]
+LANGUAGE_TOKENS = [f"__{code}__" for code in sorted(set(TARGET_LANGUAGES.values()))]
+CHAT_TOKENS = ["<|im_start|>", "<|im_end|>"]
+
+# units per character and frames per unit of a trained model; random
+# duration predictors would output about one of each
+CHAR_DURATION = 3
+UNIT_DURATION = 1
+
+
+def _train_tokenizer(vocab_size: int, seed: int) -> Tokenizer:
+    """
+    A sentencepiece-style BPE tokenizer ("▁" marks spaces) trained on text in
+    every script and on the validator prompts.
+    """
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.normalizer = normalizers.Replace(Regex(r"\s+"), " ")
+    # no space after the added tokens, "<|im_start|>assistant" decodes as is
+    tokenizer.pre_tokenizer = pre_tokenizers.Metaspace(prepend_scheme="first")
+    tokenizer.decoder = decoders.Metaspace(prepend_scheme="first")
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=SPECIAL_TOKENS + LANGUAGE_TOKENS, show_progress=False)
+    lines = synthetic.corpus(seed) + list(PROMPTS.values()) + TOPICS
+    tokenizer.train_from_iterator(lines, trainer=trainer)
+    return tokenizer
+
+
+def tiny_seamless(device: str = "cpu", hidden_size: int = 64, layers: int = 2, vocab_size: int = 2000, seed: int = 0):
+    """
+    A `SeamlessM4Tv2Model` and `SeamlessM4TProcessor` with the real structure
+    (conformer speech encoder, text encoder and decoder, text-to-unit model,
+    HiFi-GAN vocoder) at a fraction of the width and depth.
+
+    Returns:
+        tuple: (model, processor), as `load_seamless` returns them.
+    """
+    torch.manual_seed(seed)
+    tokenizer = SeamlessM4TTokenizerFast(
+        tokenizer_object=_train_tokenizer(vocab_size, seed),
+        additional_special_tokens=LANGUAGE_TOKENS,
+    )
+    processor = SeamlessM4TProcessor(SeamlessM4TFeatureExtractor(), tokenizer)
+
+    vocab = tokenizer.get_vocab()
+    id_to_text = {str(index): token for token, index in vocab.items()}
+    characters = sorted({character for token in vocab for character in token})
+    char_to_id = {token: index for index, token in enumerate(SPECIAL_TOKENS)}
+    char_to_id.update({character: index + len(SPECIAL_TOKENS) for index, character in enumerate(characters)})
+    language_codes = [token.strip("_") for token in LANGUAGE_TOKENS]
+
+    heads = max(1, hidden_size // 16)
+    unit_vocab_size = 256
+    config = SeamlessM4Tv2Config(
+        vocab_size=len(tokenizer),
+        t2u_vocab_size=unit_vocab_size + 4,
+        char_vocab_size=len(char_to_id),
+        hidden_size=hidden_size,
+        max_position_embeddings=1024,
+        encoder_layers=layers,
+        encoder_ffn_dim=4 * hidden_size,
+        encoder_attention_heads=heads,
+        decoder_layers=layers,
+        decoder_ffn_dim=4 * hidden_size,
+        decoder_attention_heads=heads,
+        speech_encoder_layers=layers,
+        speech_encoder_attention_heads=heads,
+        speech_encoder_intermediate_size=4 * hidden_size,
+        t2u_encoder_layers=layers,
+        t2u_encoder_ffn_dim=4 * hidden_size,
+        t2u_encoder_attention_heads=heads,
+        t2u_decoder_layers=layers,
+        t2u_decoder_ffn_dim=4 * hidden_size,
+        t2u_decoder_attention_heads=heads,
+        t2u_max_position_embeddings=4096,
+        t2u_variance_predictor_embed_dim=hidden_size,
+        t2u_variance_predictor_hidden_dim=hidden_size,
+        upsample_initial_channel=4 * hidden_size,
+        unit_hifi_gan_vocab_size=unit_vocab_size,
+        unit_embed_dim=hidden_size,
+        lang_embed_dim=16,
+        spkr_embed_dim=16,
+        vocoder_num_langs=len(language_codes),
+        vocoder_num_spkrs=1,
+    )
+    model = SeamlessM4Tv2Model(config).eval()
+
+    # the maps the checkpoint's generation_config.json holds
+    generation_config = GenerationConfig.from_model_config(config)
+    generation_config.text_decoder_lang_to_code_id = {code: vocab[f"__{code}__"] for code in language_codes}
+    generation_config.t2u_lang_code_to_id = {code: 0 for code in language_codes}
+    generation_config.vocoder_lang_code_to_id = {code: index for index, code in enumerate(language_codes)}
+    generation_config.id_to_text = id_to_text
+    generation_config.char_to_id = char_to_id
+    # a random decoder would emit control tokens, see `set_output_tokens`
+    generation_config.suppress_tokens = [vocab[token] for token in SPECIAL_TOKENS + LANGUAGE_TOKENS if token != "</s>"]
+    model.generation_config = generation_config
+    _pin_durations(model)
+    _suppress_control_units(model)
+    return model.to(device), processor
+
+
+def _pin_durations(model):
+    # a constant log(1 + duration) makes every character last CHAR_DURATION units
+    for predictor, duration in ((model.t2u_model.model.decoder.duration_predictor, CHAR_DURATION), (model.vocoder.dur_predictor, UNIT_DURATION)):
+        with torch.no_grad():
+            predictor.proj.weight.zero_()
+            predictor.proj.bias.fill_(math.log(1 + duration))
+
+
+def _suppress_control_units(model):
+    # the vocoder has no embedding for the control units below the offset
+    offset = model.config.vocoder_offset
+    keep = (model.config.t2u_pad_token_id, model.config.t2u_eos_token_id)
+
+    def hook(module, inputs, logits):
+        mask = torch.zeros(logits.shape[-1], dtype=torch.bool, device=logits.device)
+        mask[:offset] = True
+        mask[list(keep)] = False
+        return logits.masked_fill(mask, float("-inf"))
+
+    model.t2u_model.lm_head.register_forward_hook(hook)
+
+
+def set_output_tokens(model, tokens: int):
+    """
+    A random decoder never predicts the end of the sentence: make it generate
+    exactly `tokens` tokens, the length a trained model would translate to.
+    """
+    model.generation_config.update(min_new_tokens=tokens, max_new_tokens=tokens)
+
+
+def tiny_llama(device: str = "cpu", hidden_size: int = 64, layers: int = 2, vocab_size: int = 2000, seed: int = 0):
+    """
+    A `LlamaForCausalLM` and its tokenizer, with the ChatML markers of the
+    validator LLM as added tokens.
+
+    Returns:
+        tuple: (model, tokenizer), as `load_llama` returns them.
+    """
+    torch.manual_seed(seed)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=_train_tokenizer(vocab_size, seed),
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        pad_token="<pad>",
+    )
+    # added, not special, as in the real tokenizer: decoding keeps them
+    tokenizer.add_tokens([AddedToken(token, special=False, normalized=False) for token in CHAT_TOKENS])
+
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=4 * hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=max(1, hidden_size // 16),
+        num_key_value_heads=max(1, hidden_size // 32),
+        max_position_embeddings=2048,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config = GenerationConfig.from_model_config(config)
+    return model.to(device), tokenizer
+
+
+def install(device: str = "cpu", **sizes):
+    """
+    Put the tiny models in `MODELS`, where the modules look for them before
+    loading the production weights.
+    """
+    seamless = tiny_seamless(device, **sizes)
+    MODELS["seamless"] = seamless
+    MODELS[f"seamless:{torch.device(device)}"] = seamless
+    MODELS["llama"] = tiny_llama(device, **sizes)
+    # the CPU backend runs its own int8 copy, as `load_llama_cpu` returns it
+    model, tokenizer = tiny_llama(device, **sizes)
+    MODELS["llama:cpu"] = (torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8), tokenizer)
+    return MODELS
@@ -0,0 +1,136 @@
+"""
+Offline profile of the validator step against a synthetic subnet.
+
+Runs the real `Validator.validate_step` with the tiny models of
+`tiny_models`, against the in-process chain and miners of `fake_chain`, so a
+subnet of thousands of miners can be validated without a node or a GPU. Every
+step is recorded in a timeline file like the one the validator writes, and
+the stages are summed up at the end. `--profile` also writes the cProfile
+statistics of the steps, for `python -m pstats` or snakeviz.
+
+Usage:
+    python3 -m benchmarks.validator_step [--miners 1000] [--steps 3] [--miner-latency 0.5] [--chain-latency 0.2] [--profile step.prof]
+"""
+
+import os
+
+# CPU only and offline, before torch and transformers are imported
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+os.environ["HF_HUB_OFFLINE"] = "1"
+
+import asyncio
+import cProfile
+import json
+import logging
+import random
+import statistics
+
+import numpy as np
+import torch
+import typer
+from substrateinterface import Keypair  # type: ignore
+
+from src.utils.constants import MODELS
+from src.utils.utils import logger
+from src.validator._config import ValidatorSettings
+from src.validator.timeline import StepTimeline, TimelineWriter
+from src.validator.validator import Validator
+
+from . import tiny_models
+from .fake_chain import FakeCommuneClient
+
+
+class OfflineValidator(Validator):
+    """
+    Validator calling the miners of its `FakeCommuneClient`.
+    """
+
+    def _module_client(self, module_ip, module_port):
+        return self.client.module_client(module_ip, module_port, self.key)
+
+
+def main(
+    miners: int = typer.Option(1000, help="Number of miners in the subnet"),
+    validators: int = typer.Option(8, help="Number of validators in the subnet, this one included"),
+    steps: int = typer.Option(3, help="Validation steps to run"),
+    chain_latency: float = typer.Option(0.2, help="Latency of every chain query, in seconds"),
+    miner_latency: float = typer.Option(0.5, help="Mean latency of the miners, in seconds"),
+    jitter: float = typer.Option(0.5, help="Spread of the miner latency, as a fraction of the mean"),
+    failure_rate: float = typer.Option(0.05, help="Share of the miner calls failing"),
+    timeout_rate: float = typer.Option(0.01, help="Share of the miner calls timing out"),
+    call_timeout: int = typer.Option(10, help="Timeout of the miner calls, in seconds"),
+    score_interval: float = typer.Option(0.0, help="Pause after scoring each miner, in seconds"),
+    sample_size: int = typer.Option(64, help="Miners queried per step, 0 for all of them"),
+    scores: str = typer.Option("validator_step_scores.npz", help="Rolling score state, kept across runs"),
+    netuid: int = typer.Option(0, help="Netuid of the synthetic subnet"),
+    seed: int = typer.Option(0, help="Seed of the subnet, the models and the challenges"),
+    timeline: str = typer.Option("validator_step_timeline.jsonl", help="Timeline file the step records are appended to"),
+    profile: str = typer.Option(None, help="Path to write the cProfile statistics of the steps"),
+    output: str = typer.Option(None, help="Path to write the step records as JSON"),
+):
+    random.seed(seed)
+    torch.manual_seed(seed)
+    # the modules log every request and the validator every miner, and random
+    # weights never end an answer before the token budget
+    logger.logger.setLevel(logging.ERROR)
+
+    tiny_models.install("cpu")
+    # a challenge of about the length of a sentence
+    tiny_models.set_output_tokens(MODELS["seamless:cpu"][0], 32)
+
+    key = Keypair.create_from_uri("//validator")
+    validator_keys = [key.ss58_address] + [Keypair.create_from_uri(f"//validator-{index}").ss58_address for index in range(1, validators)]
+    client = FakeCommuneClient.synthetic(
+        miners,
+        validator_keys,
+        netuid=netuid,
+        latency=chain_latency,
+        miner_latency=miner_latency,
+        jitter=jitter,
+        failure_rate=failure_rate,
+        timeout_rate=timeout_rate,
+        seed=seed,
+    )
+    validator = OfflineValidator(key, netuid, client, call_timeout)
+    validator.rng = np.random.default_rng(seed)
+    settings = ValidatorSettings(score_interval=score_interval, sample_size=sample_size, scores_path=scores, timeline_path=timeline)  # type: ignore
+    writer = TimelineWriter(settings.timeline_path, settings.timeline_max_bytes, settings.timeline_backups)
+
+    profiler = cProfile.Profile() if profile else None
+    records = []
+    for step in range(steps):
+        validator.timeline = StepTimeline()
+        if profiler:
+            profiler.enable()
+        try:
+            asyncio.run(validator.validate_step(netuid, settings))
+        finally:
+            if profiler:
+                profiler.disable()
+        record = validator.timeline.record(interval_s=settings.iteration_interval, error=None, miners=miners)
+        writer.write(record)
+        records.append(record)
+        stages = " ".join(f"{name}={seconds:.2f}s" for name, seconds in sorted(record["stages"].items(), key=lambda item: -item[1]))
+        print(f"step {step}: total={record['total_s']:.2f}s {stages} counts={record['counts']}")
+
+    # the weights are voted in the background
+    if validator.weight_submitter is not None:
+        validator.weight_submitter.close(timeout=60)
+
+    stage_names = sorted({name for record in records for name in record["stages"]})
+    print(f"{'stage':<12} {'mean':>9} {'share':>7}")
+    total = statistics.fmean(record["total_s"] for record in records)
+    for name in sorted(stage_names, key=lambda name: -sum(record["stages"].get(name, 0.0) for record in records)):
+        mean = statistics.fmean(record["stages"].get(name, 0.0) for record in records)
+        print(f"{name:<12} {mean:>8.2f}s {mean / total:>7.1%}")
+    print(f"{'total':<12} {total:>8.2f}s, {len(client.votes)} votes set")
+
+    if profiler:
+        profiler.dump_stats(profile)
+    if output:
+        with open(output, "w") as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import partial
+from typing import Awaitable, Callable, Optional
+
+from src.utils.utils import logger
+
+WHITESPACE_REGEX = re.compile(r"[ \t\u00a0]+")
+
+
+class _LRUStore:
+    """
+    Least recently used store bounded by the total size of its values in bytes.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[str, int, float]] = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str, size: int):
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (value, size, time.monotonic() + self.ttl)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class TranslationCache:
+    """
+    Gateway level cache of translation responses.
+
+    Requests are keyed by a hash of their normalized content. Text and audio
+    responses live in separate stores with their own size budget, so a few
+    large audio answers cannot evict the many small text ones. Concurrent
+    identical requests share a single miner fan-out (single-flight).
+
+    Args:
+        max_bytes: Size budget of the text responses.
+        max_audio_bytes: Size budget of the audio responses.
+        ttl: Time to live of an entry in seconds.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20, max_audio_bytes: int = 256 * 2**20, ttl: float = 3600):
+        self.text_store = _LRUStore(max_bytes, ttl)
+        self.audio_store = _LRUStore(max_audio_bytes, ttl)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(translation_request: dict, quorum: Optional[int] = None) -> str:
+        """
+        Hash a translation request after normalizing the fields that do not
+        change the translation (case of the languages, unicode form and
+        repeated whitespace of text inputs).
+
+        Args:
+            translation_request: The translation request.
+            quorum: The quorum the request is raced with, None when it is not
+                raced. An answer agreed on by several miners is not the answer
+                of one, so it is part of the key.
+        """
+        task_string = translation_request["task_string"].strip().lower()
+        data_input = translation_request["input"].strip()
+        if not task_string.startswith("speech"):
+            data_input = unicodedata.normalize("NFC", data_input)
+            data_input = WHITESPACE_REGEX.sub(" ", data_input)
+        normalized = [
+            task_string,
+            translation_request["source_language"].strip().title(),
+            translation_request["target_language"].strip().title(),
+            data_input,
+            quorum,
+        ]
+        return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    async def get_or_compute(
+        self,
+        key: str,
+        is_audio: bool,
+        compute: Callable[[], Awaitable[str]],
+        cacheable: Callable[[str], bool] = lambda value: True,
+    ) -> str:
+        """
+        Return the cached response for `key`, or compute it.
+
+        While a response is being computed, identical requests wait for it
+        instead of starting their own fan-out. The computation runs in its own
+        task, so a client disconnecting does not cancel it for the others.
+
+        Args:
+            key: The request key, as returned by `key`.
+            is_audio: Whether the response is audio.
+            compute: Coroutine function producing the response.
+            cacheable: Whether a computed response may be stored.
+
+        Returns:
+            The response.
+        """
+        store = self.audio_store if is_audio else self.text_store
+        value = store.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._on_computed, key, store, cacheable))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def get(self, key: str, is_audio: bool) -> Optional[str]:
+        """
+        Return the cached response for `key`, or None. Counts as a lookup.
+        """
+        value = (self.audio_store if is_audio else self.text_store).get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, is_audio: bool, value: str):
+        store = self.audio_store if is_audio else self.text_store
+        # audio answers are base64, so their length already is their size
+        size = len(value) if is_audio else len(value.encode("utf-8"))
+        store.put(key, value, size + len(key))
+
+    def _on_computed(self, key: str, store: _LRUStore, cacheable: Callable[[str], bool], task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"Failed to compute cached translation: {task.exception()}")
+            return
+        value = task.result()
+        if isinstance(value, str) and cacheable(value):
+            self.put(key, store is self.audio_store, value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            # coalesced requests did not cost a fan-out either
+            "fanout_saved_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "inflight": len(self._inflight),
+            "text": self.text_store.stats(),
+            "audio": self.audio_store.stats(),
+        }
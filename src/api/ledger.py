@@ -0,0 +1,150 @@
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Optional
+
+from src.utils.utils import logger
+
+
+@dataclass
+class MinerStats:
+    samples: int
+    success_rate: float
+    p50: Optional[float]
+    p90: Optional[float]
+    p99: Optional[float]
+    last_seen: Optional[float]
+
+
+class PerformanceLedger:
+    """
+    Local record of how every miner performed on every task.
+
+    Each call to a miner is one observation (latency and whether it gave a
+    valid answer). The most recent `window` observations of every
+    (miner, task) pair are kept in memory to answer routing queries, and all
+    observations are persisted to SQLite in batches, so the statistics
+    survive restarts.
+
+    Args:
+        path: The SQLite database file.
+        window: The number of recent observations kept per (miner, task).
+        retention: Observations older than this many seconds are deleted.
+    """
+
+    def __init__(self, path: str = "miner_ledger.sqlite", window: int = 200, retention: float = 7 * 24 * 3600):
+        self.path = path
+        self.window = window
+        self.retention = retention
+        self._observations: dict[tuple[int, str], deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._pending: list[tuple[int, str, float, float, int]] = []
+        self._last_flush = time.time()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS observations (
+                uid INTEGER NOT NULL,
+                task TEXT NOT NULL,
+                ts REAL NOT NULL,
+                latency REAL NOT NULL,
+                success INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_observations_uid_task_ts ON observations (uid, task, ts);
+            CREATE INDEX IF NOT EXISTS idx_observations_ts ON observations (ts);
+            """
+        )
+        self._load()
+
+    def _load(self):
+        rows = self._db.execute(
+            """
+            SELECT uid, task, ts, latency, success FROM (
+                SELECT uid, task, ts, latency, success,
+                       ROW_NUMBER() OVER (PARTITION BY uid, task ORDER BY ts DESC) AS age
+                FROM observations WHERE ts >= ?
+            ) WHERE age <= ? ORDER BY ts
+            """,
+            (time.time() - self.retention, self.window),
+        ).fetchall()
+        for uid, task, ts, latency, success in rows:
+            self._observations[(uid, task)].append((ts, latency, bool(success)))
+        logger.info(f"Loaded {len(rows)} miner observations from {self.path}")
+
+    def record(self, uid: int, task: str, latency: float, success: bool):
+        ts = time.time()
+        self._observations[(uid, task)].append((ts, latency, success))
+        self._pending.append((uid, task, ts, latency, int(success)))
+
+    def should_flush(self, max_pending: int = 500, max_age: float = 30.0) -> bool:
+        return len(self._pending) >= max_pending or bool(self._pending and time.time() - self._last_flush >= max_age)
+
+    def take_pending(self) -> list[tuple[int, str, float, float, int]]:
+        """
+        Return the observations not persisted yet and forget about them.
+        """
+        pending, self._pending = self._pending, []
+        self._last_flush = time.time()
+        return pending
+
+    def flush(self):
+        self.write(self.take_pending())
+
+    def write(self, pending: list[tuple[int, str, float, float, int]]):
+        """
+        Persist observations. Blocking, run it off the event loop.
+        """
+        if not pending:
+            return
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT INTO observations (uid, task, ts, latency, success) VALUES (?, ?, ?, ?, ?)",
+                pending,
+            )
+            self._db.execute("DELETE FROM observations WHERE ts < ?", (time.time() - self.retention,))
+
+    def stats(self, uid: int, task: str) -> MinerStats:
+        observations = self._observations.get((uid, task))
+        if not observations:
+            return MinerStats(0, 0.0, None, None, None, None)
+        latencies = sorted(latency for _, latency, success in observations if success)
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        return MinerStats(
+            samples=len(observations),
+            success_rate=len(latencies) / len(observations),
+            p50=percentile(0.50),
+            p90=percentile(0.90),
+            p99=percentile(0.99),
+            last_seen=observations[-1][0],
+        )
+
+    def probability_within(self, uid: int, task: str, latency_target: float, prior: tuple[float, float] = (1.0, 1.0)) -> float:
+        """
+        Estimated probability that the miner gives a valid answer within
+        `latency_target` seconds.
+
+        A Beta prior keeps miners without observations at a neutral
+        estimate, so they still get some traffic and are learned about.
+        """
+        observations = self._observations.get((uid, task), ())
+        on_time = sum(1 for _, latency, success in observations if success and latency <= latency_target)
+        alpha, beta = prior
+        return (on_time + alpha) / (len(observations) + alpha + beta)
+
+    def summary(self) -> list[dict]:
+        return [
+            {"uid": uid, "task": task, **vars(self.stats(uid, task))}
+            for uid, task in sorted(self._observations)
+        ]
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,168 @@
+"""
+Load test for a single SubnetAPI process.
+
+Runs the real `SubnetAPI` app under uvicorn, backed by a `ValidatorAPI` whose
+chain queries and miner calls are simulated with fixed latencies, and fires
+increasing numbers of concurrent `/api/translation` requests at it. Because
+the miners are simulated, the measured capacity is the one of the gateway
+itself: the event loop, middlewares, validation and fan-out.
+
+Usage:
+    python3 -m src.api.load_test [--miner-latency 0.5] [--concurrency 1,8,32,128,512]
+"""
+
+import asyncio
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+
+import aiohttp
+import typer
+import uvicorn
+
+from src.utils.protocols import TranslationSynapse
+from .subnet_api import SubnetAPI
+from .validator_api import ValidatorAPI
+
+
+class StubValidatorAPI(ValidatorAPI):
+    """
+    ValidatorAPI answering from simulated miners instead of the chain.
+
+    Every miner call sleeps for `miner_latency` seconds (+/- 50% jitter) and
+    echoes the input back, so only the gateway path is exercised.
+    """
+
+    def __init__(self, n_miners: int = 5, miner_latency: float = 0.5, race: bool = False):
+        super().__init__(key=None, netuid=0, client=None, call_timeout=60, race=race)
+        self.n_miners = n_miners
+        self.miner_latency = miner_latency
+
+    def query_top_miners(self, k = 5):
+        return {
+            uid: (["127.0.0.1", str(20000 + uid)], f"miner-{uid}")
+            for uid in range(min(k, self.n_miners))
+        }
+
+    async def _get_miner_prediction(self, synapse, miner_info):
+        await asyncio.sleep(self.miner_latency * random.uniform(0.5, 1.5))
+        return TranslationSynapse(
+            translation_request=synapse.translation_request,
+            miner_response=synapse.translation_request["input"],
+        )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(app, port: int) -> uvicorn.Server:
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _run_level(url: str, concurrency: int, rounds: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def one_request(index: int):
+            nonlocal errors
+            # unique inputs, so the response cache does not hide the fan-out cost
+            payload = {
+                "input": f"Hello, how are you doing today? ({concurrency}-{index})",
+                "task_string": "text2text",
+                "source_language": "English",
+                "target_language": "French",
+            }
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.post(url, json=payload) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                            return
+                except aiohttp.ClientError:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one_request(index) for index in range(concurrency * rounds)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(q: float) -> float:
+        if not latencies:
+            return float("nan")
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    return {
+        "concurrency": concurrency,
+        "requests": concurrency * rounds,
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_s": percentile(0.50),
+        "p95_s": percentile(0.95),
+        "p99_s": percentile(0.99),
+        "mean_s": statistics.fmean(latencies) if latencies else float("nan"),
+    }
+
+
+def main(
+    concurrency: str = typer.Option("1,8,32,128,512", help="Comma separated concurrency levels"),
+    rounds: int = typer.Option(4, help="Requests per concurrent client at each level"),
+    miners: int = typer.Option(5, help="Number of simulated miners"),
+    miner_latency: float = typer.Option(0.5, help="Mean simulated miner latency in seconds"),
+    race: bool = typer.Option(False, help="Race the miners instead of waiting for all of them"),
+    output: str = typer.Option(None, help="Optional path to write the results as JSON"),
+):
+    port = _free_port()
+    api = SubnetAPI(StubValidatorAPI(miners, miner_latency, race=race))
+    server = _start_server(api.app, port)
+    url = f"http://127.0.0.1:{port}/api/translation"
+
+    # a request that takes no longer than this still counts as served in time
+    latency_budget = miner_latency * 1.5 * 2
+    results = []
+    try:
+        for level in [int(value) for value in concurrency.split(",")]:
+            result = asyncio.run(_run_level(url, level, rounds))
+            results.append(result)
+            print(
+                f"concurrency={result['concurrency']:5d} "
+                f"rps={result['throughput_rps']:8.1f} "
+                f"p50={result['p50_s']:.3f}s p95={result['p95_s']:.3f}s p99={result['p99_s']:.3f}s "
+                f"errors={result['errors']}"
+            )
+    finally:
+        server.should_exit = True
+
+    capacity = max(
+        (r["concurrency"] for r in results if r["errors"] == 0 and r["p95_s"] <= latency_budget),
+        default=0,
+    )
+    print(f"Concurrent request capacity (p95 <= {latency_budget:.2f}s, no errors): {capacity}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"capacity": capacity, "latency_budget_s": latency_budget, "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    typer.run(main)
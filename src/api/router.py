@@ -0,0 +1,89 @@
+import hashlib
+import random
+
+from .ledger import PerformanceLedger
+
+
+class MinerRouter:
+    """
+    Picks the smallest set of miners likely to answer a request in time.
+
+    Every candidate gets the probability, read from the performance ledger,
+    that it gives a valid answer within `latency_target` seconds. Miners are
+    added in decreasing order of that probability until the chance that at
+    least one of them answers in time reaches `target_probability`.
+
+    Miners with similar probabilities are ordered by a rendezvous hash of the
+    language pair, so the same pair keeps going to the same miners and their
+    caches get reused.
+
+    Args:
+        ledger: The performance ledger.
+        latency_target: The latency a request should be answered within, in seconds.
+        target_probability: The wanted probability of getting an answer in time.
+        max_miners: The maximum number of miners a request is sent to.
+        pool_size: The number of top miners (by on-chain weight) routed between.
+        explore: The probability of also sending a request to one random miner
+            outside of the selection, to keep its statistics fresh.
+    """
+
+    def __init__(
+        self,
+        ledger: PerformanceLedger,
+        latency_target: float = 10.0,
+        target_probability: float = 0.95,
+        max_miners: int = 5,
+        pool_size: int = 32,
+        explore: float = 0.05,
+    ):
+        self.ledger = ledger
+        self.latency_target = latency_target
+        self.target_probability = target_probability
+        self.max_miners = max_miners
+        self.pool_size = pool_size
+        self.explore = explore
+
+    @staticmethod
+    def _affinity(uid: int, source_language: str, target_language: str) -> float:
+        digest = hashlib.blake2b(f"{source_language}:{target_language}:{uid}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2**64
+
+    def select(self, modules_info: dict, task: str, source_language: str, target_language: str) -> dict:
+        """
+        Select the miners a request is sent to.
+
+        Args:
+            modules_info: The candidate miners, mapping UIDs to their connection information and key.
+            task: The task string of the request.
+            source_language: The source language of the request.
+            target_language: The target language of the request.
+
+        Returns:
+            The selected subset of `modules_info`.
+        """
+        probabilities = {
+            uid: self.ledger.probability_within(uid, task, self.latency_target)
+            for uid in modules_info
+        }
+        # probabilities are bucketed so the affinity decides between close miners
+        ranked = sorted(
+            modules_info,
+            key=lambda uid: (
+                round(probabilities[uid], 1),
+                self._affinity(uid, source_language, target_language),
+            ),
+            reverse=True,
+        )
+
+        selected = []
+        miss_probability = 1.0
+        for uid in ranked[:self.max_miners]:
+            selected.append(uid)
+            miss_probability *= 1 - probabilities[uid]
+            if 1 - miss_probability >= self.target_probability:
+                break
+
+        others = ranked[len(selected):]
+        if others and random.random() < self.explore:
+            selected.append(random.choice(others))
+        return {uid: modules_info[uid] for uid in selected}
@@ -1,22 +1,28 @@
 import time
+import json
+import asyncio
 import typer
+from functools import partial
 import logging
 import getpass
-from typing import Annotated
-from fastapi import FastAPI, Request
+from typing import Annotated, Optional, List
+from fastapi import FastAPI, Request, HTTPException
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
-from pydantic import BaseModel
+from starlette.responses import JSONResponse, StreamingResponse, Response
+from pydantic import BaseModel, Field
 
-from .validator_api import ValidatorAPI
+from .validator_api import ValidatorAPI, NO_MINER_AVAILABLE
+from .cache import TranslationCache
+from .ledger import PerformanceLedger
+from .router import MinerRouter
 
 from communex._common import get_node_url  # type: ignore
 from communex.client import CommuneClient  # type: ignore
 from communex.compat.key import classic_load_key  # type: ignore
 
-from src.utils.serialization import audio_encode
-from src.utils.audio_save_load import _wav_to_tensor, _save_raw_audio_file
+from src.utils.serialization import audio_encode, audio_decode
+from src.utils.audio_save_load import _read_wav_tensor, _save_raw_audio_file, load_audio, tensor_to_wav_bytes
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO)
@@ -27,16 +33,50 @@ class TranslationInput(BaseModel):
     task_string: str
     source_language: str
     target_language: str
+    # Number of miners that must answer before replying, when racing miners
+    quorum: Optional[int] = Field(None, ge=1)
+
+class BatchTranslationInput(BaseModel):
+    items: List[TranslationInput]
+
+def _encode_speech_input(data: str) -> str:
+    """
+    Converts the base64 PCM input of a request into the miner wire format.
+    """
+    file_path = _save_raw_audio_file(data)
+    input, _, _, _ = _read_wav_tensor(file_path)
+    return audio_encode(input)
+    
+def _encode_audio_input(data: bytes) -> str:
+    """
+    Converts an uploaded audio file into the miner wire format. WAV samples
+    are decoded straight from the request buffer, other formats are streamed
+    through ffmpeg, and the audio is resampled to the 16 kHz miners expect.
+    """
+    return audio_encode(load_audio(data))
+
+def _decode_wav_output(miner_response: str) -> bytearray:
+    """
+    Converts a miner speech answer into the WAV file sent to the user.
+    """
+    return tensor_to_wav_bytes(audio_decode(miner_response))
+
+class WavResponse(Response):
+    """
+    Response sending an in-memory WAV buffer as is, without copying it into `bytes`.
+    """
+    media_type = "audio/wav"
+
+    def render(self, content) -> bytes:
+        return content
     
 class SubnetAPI:
-    def __init__(self, commune_key, netuid, use_testnet):
+    def __init__(self, validator_api: ValidatorAPI, cache: Optional[TranslationCache] = None, max_batch_size: int = 1000):
         self.app = FastAPI()
         
-        password = getpass.getpass(prompt="Enther the password:")
-        keypair = classic_load_key(commune_key, password=password)  # type: ignore
-        c_client = CommuneClient(get_node_url(use_testnet = use_testnet))  # type: ignore
-        
-        self.validator_api = ValidatorAPI(keypair, netuid, c_client, 60)
+        self.validator_api = validator_api
+        self.max_batch_size = max_batch_size
+        self.cache = cache if cache is not None else TranslationCache()
 
         # Add CORS middleware to allow cross-origin requests
         self.app.add_middleware(
@@ -56,23 +96,191 @@ class SubnetAPI:
         # Add exception handling middleware
         self.app.add_middleware(ExceptionHandlingMiddleware)
 
+        @self.app.on_event("shutdown")
+        async def close_ledger():
+            # the observations not flushed yet would be lost
+            await self.validator_api.close_ledger()
+
         # Define routes
         @self.app.post('/api/translation')
         async def get_translation(request: TranslationInput):
             logger.info('request received')
-            if request.task_string.startswith('speech'):
-                file_path = _save_raw_audio_file(request.input)
-                input, _, _, _ = await _wav_to_tensor(file_path)
-                request.input = audio_encode(input)
-            
+            cache_key = self.cache.key(request.dict(), self.race_quorum(request))
+            return await self.cache.get_or_compute(
+                cache_key,
+                request.task_string.endswith('speech'),
+                partial(self.translate, request),
+                cacheable=lambda response: response != NO_MINER_AVAILABLE,
+            )
+
+        @self.app.get('/api/cache/stats')
+        async def get_cache_stats():
+            return self.cache.stats()
+
+        @self.app.get('/api/miners/stats')
+        async def get_miner_stats():
+            if self.validator_api.ledger is None:
+                return []
+            return self.validator_api.ledger.summary()
+
+        @self.app.post('/api/translation/stream')
+        async def stream_translation(request: TranslationInput):
+            logger.info('stream request received')
+            return StreamingResponse(
+                self.stream_events(request),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        @self.app.post('/api/translation/batch')
+        async def get_batch_translation(request: BatchTranslationInput):
+            logger.info(f'batch request received with {len(request.items)} items')
+            if len(request.items) > self.max_batch_size:
+                raise HTTPException(status_code=413, detail=f"A batch holds at most {self.max_batch_size} items")
+            return {"results": await self.translate_batch(request.items)}
+
+        @self.app.post('/api/translation/audio')
+        async def translate_audio(request: Request):
+            """
+            Binary counterpart of `/api/translation`.
+
+            The input is either a multipart form (a `file` upload for speech
+            tasks or an `input` field for text tasks, plus the request fields)
+            or the raw body (WAV, ogg, opus, mp3 or text) with the request
+            fields in the query string. Speech answers are sent back as `audio/wav`.
+            """
+            logger.info('audio request received')
+            params = dict(request.query_params)
+            if request.headers.get('content-type', '').startswith('multipart/form-data'):
+                form = await request.form()
+                upload = form.get('file')
+                params.update({k: v for k, v in form.items() if isinstance(v, str)})
+                data = await upload.read() if upload is not None and not isinstance(upload, str) else params.get('input', '').encode('utf-8')
+            else:
+                data = await request.body()
+
+            missing = [field for field in ('task_string', 'source_language', 'target_language') if not params.get(field)]
+            if missing:
+                raise HTTPException(status_code=422, detail=f"Missing fields: {', '.join(missing)}")
+            task_string = params['task_string']
+            quorum = params.get('quorum') or None
+            if quorum is not None:
+                if not quorum.isdecimal() or int(quorum) < 1:
+                    raise HTTPException(status_code=422, detail=f"Invalid quorum {quorum!r}: expected a positive integer")
+                quorum = int(quorum)
+
+            if task_string.startswith('speech'):
+                try:
+                    input = await asyncio.to_thread(_encode_audio_input, data)
+                except ValueError as e:
+                    raise HTTPException(status_code=415, detail=f"Unsupported audio: {e}")
+            else:
+                try:
+                    input = data.decode('utf-8')
+                except UnicodeDecodeError as e:
+                    raise HTTPException(status_code=400, detail=f"Text input is not valid UTF-8: {e}")
+
             translation_request = {
-                "input": request.input,
-                "task_string": request.task_string,
-                "source_language": request.source_language,
-                "target_language": request.target_language
+                "input": input,
+                "task_string": task_string,
+                "source_language": params['source_language'],
+                "target_language": params['target_language'],
             }
-            
-            return self.validator_api.get_translation(translation_request)
+            answer = await self.validator_api.get_translation_answer(translation_request, quorum=quorum)
+            if answer is None:
+                return JSONResponse(status_code=503, content={"detail": NO_MINER_AVAILABLE})
+            if task_string.endswith('speech'):
+                return WavResponse(await asyncio.to_thread(_decode_wav_output, answer.miner_response))
+            return answer.miner_response
+
+    async def build_translation_request(self, request: TranslationInput) -> dict:
+        input = request.input
+        if request.task_string.startswith('speech'):
+            # audio decoding is CPU bound, keep it off the event loop
+            input = await asyncio.to_thread(_encode_speech_input, input)
+        
+        return {
+            "input": input,
+            "task_string": request.task_string,
+            "source_language": request.source_language,
+            "target_language": request.target_language
+        }
+
+    def race_quorum(self, request: TranslationInput) -> Optional[int]:
+        """
+        The quorum a request is raced with, None when miners are not raced.
+        """
+        if not self.validator_api.race:
+            return None
+        return request.quorum or self.validator_api.quorum
+
+    async def translate(self, request: TranslationInput):
+        translation_request = await self.build_translation_request(request)
+        return await self.validator_api.get_translation(translation_request, quorum=request.quorum)
+
+    async def translate_batch(self, items: List[TranslationInput]) -> list[dict]:
+        """
+        Translate a batch, answering cached items directly and sending the
+        others to the miners in one spread-out fan-out.
+        """
+        results: list[dict | None] = [None] * len(items)
+        pending = []
+        for index, item in enumerate(items):
+            is_audio = item.task_string.endswith('speech')
+            # batch items are never raced, whatever their quorum
+            cache_key = self.cache.key(item.dict())
+            output = self.cache.get(cache_key, is_audio)
+            if output is not None:
+                results[index] = {"index": index, "output": output, "uid": None, "error": None}
+            else:
+                pending.append((index, cache_key, is_audio))
+
+        translation_requests = await asyncio.gather(*[
+            self.build_translation_request(items[index]) for index, _, _ in pending
+        ], return_exceptions=True)
+        # an item that cannot be decoded fails alone, the others are still sent
+        valid = []
+        for (index, cache_key, is_audio), translation_request in zip(pending, translation_requests):
+            if isinstance(translation_request, Exception):
+                results[index] = {"index": index, "output": None, "uid": None, "error": str(translation_request)}
+            else:
+                valid.append(((index, cache_key, is_audio), translation_request))
+        if not valid:
+            return results
+
+        answers = await self.validator_api.get_batch_translation([translation_request for _, translation_request in valid])
+        for ((index, cache_key, is_audio), _), answer in zip(valid, answers):
+            if answer["error"] is None:
+                self.cache.put(cache_key, is_audio, answer["output"])
+            results[index] = {**answer, "index": index}
+        return results
+
+    async def stream_events(self, request: TranslationInput):
+        """
+        Server-sent events for a streamed translation.
+
+        Emits one `answer` event per miner as soon as it answered (or an
+        `error` event when it failed), then a final `done` event.
+        """
+        start = time.time()
+        translation_request = await self.build_translation_request(request)
+        answers = 0
+        miners = 0
+        async for event in self.validator_api.stream_translation(translation_request):
+            miners += 1
+            if event["output"] is None:
+                yield _sse_event("error", event)
+                continue
+            answers += 1
+            yield _sse_event("answer", event)
+        yield _sse_event("done", {
+            "answers": answers,
+            "miners": miners,
+            "elapsed_ms": round((time.time() - start) * 1000, 1),
+        })
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # Middleware to log request processing time
 class RequestTimeLoggingMiddleware(BaseHTTPMiddleware):
@@ -108,10 +316,32 @@ class ExceptionHandlingMiddleware(BaseHTTPMiddleware):
 def serve(
     commune_key: Annotated[str, typer.Argument(help="Name of the key present in `~/.commune/key`")],
     netuid: int = typer.Option(38),
-    use_testnet: bool = typer.Option(True)
+    use_testnet: bool = typer.Option(True),
+    race: bool = typer.Option(False, help="Return the first valid miner answer instead of waiting for all miners"),
+    quorum: int = typer.Option(1, help="Number of valid miner answers to wait for when racing"),
+    cache_size_mb: int = typer.Option(64, help="Size budget of the text response cache in MB"),
+    cache_audio_size_mb: int = typer.Option(256, help="Size budget of the audio response cache in MB"),
+    cache_ttl: int = typer.Option(3600, help="Time to live of cached responses in seconds"),
+    batch_miners: int = typer.Option(16, help="Number of top miners a batch is spread over"),
+    miner_concurrency: int = typer.Option(2, help="Batch items sent to one miner at a time"),
+    routing: bool = typer.Option(True, help="Route requests to the miners most likely to answer in time instead of the top 5"),
+    ledger_path: str = typer.Option("miner_ledger.sqlite", help="SQLite file of the miner performance ledger"),
+    latency_target: float = typer.Option(10.0, help="Latency a request should be answered within, in seconds"),
+    target_probability: float = typer.Option(0.95, help="Wanted probability of an answer within the latency target"),
 ):
     import uvicorn
-    api = SubnetAPI(commune_key, netuid, use_testnet)
+    password = getpass.getpass(prompt="Enther the password:")
+    keypair = classic_load_key(commune_key, password=password)  # type: ignore
+    c_client = CommuneClient(get_node_url(use_testnet = use_testnet))  # type: ignore
+    ledger = PerformanceLedger(ledger_path)
+    router = MinerRouter(ledger, latency_target, target_probability) if routing else None
+    validator_api = ValidatorAPI(
+        keypair, netuid, c_client, 60,
+        race=race, quorum=quorum, batch_miners=batch_miners, miner_concurrency=miner_concurrency,
+        ledger=ledger, router=router,
+    )
+    cache = TranslationCache(cache_size_mb * 2**20, cache_audio_size_mb * 2**20, cache_ttl)
+    api = SubnetAPI(validator_api, cache)
     uvicorn.run(api.app, host="0.0.0.0", port=10125)
 
 if __name__ == "__main__":
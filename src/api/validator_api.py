@@ -1,12 +1,14 @@
 import asyncio
-import concurrent.futures
 import json
+import time
 import io
 import base64
 import random
 from functools import partial
 from datetime import timedelta, datetime, date
 from collections import defaultdict
+from difflib import SequenceMatcher
+from contextlib import aclosing
 
 from communex.client import CommuneClient  # type: ignore
 from communex.module.client import ModuleClient  # type: ignore
@@ -19,6 +21,11 @@ from src.utils.protocols import *
 from src.utils.serialization import audio_decode
 from src.utils.audio_save_load import _tensor_to_wav
 
+from .ledger import PerformanceLedger
+from .router import MinerRouter
+
+NO_MINER_AVAILABLE = "No miner available!"
+
 class ValidatorAPI(Module):
     def __init__(
         self,
@@ -26,6 +33,13 @@ class ValidatorAPI(Module):
         netuid: int,
         client: CommuneClient,
         call_timeout: int = 60,
+        race: bool = False,
+        quorum: int = 1,
+        miners_ttl: int = 60,
+        batch_miners: int = 16,
+        miner_concurrency: int = 2,
+        ledger: PerformanceLedger | None = None,
+        router: MinerRouter | None = None,
     ) -> None:
         super().__init__()
         self.client = client
@@ -33,6 +47,24 @@ class ValidatorAPI(Module):
         self.netuid = netuid
         self.val_model = "foo"
         self.call_timeout = call_timeout
+        # Racing mode returns as soon as `quorum` miners gave a valid answer
+        # instead of waiting for every selected miner to answer or time out.
+        self.race = race
+        self.quorum = quorum
+        # Chain queries are blocking and slow, so the top miners are only
+        # refreshed every `miners_ttl` seconds, off the event loop.
+        self.miners_ttl = miners_ttl
+        self._top_miners: dict[int, tuple[float, dict]] = {}
+        self._top_miners_lock = asyncio.Lock()
+        # Batches are spread over more miners than single requests, each
+        # miner getting at most `miner_concurrency` items at a time.
+        self.batch_miners = batch_miners
+        self.miner_concurrency = miner_concurrency
+        # Every miner call is recorded in the ledger, which the router uses
+        # to send requests to fewer, faster and healthier miners.
+        self.router = router
+        self.ledger = router.ledger if ledger is None and router is not None else ledger
+        self._ledger_flush = None
         
     def get_addresses(self, client: CommuneClient, netuid: int) -> dict[int, str]:
         """
@@ -49,6 +81,12 @@ class ValidatorAPI(Module):
         # Makes a blockchain query for the miner addresses
         module_addreses = client.query_map_address(netuid)
         return module_addreses
+
+    def _module_client(self, module_ip: str, module_port: int) -> ModuleClient:
+        """
+        The client calling the miner module at the given address.
+        """
+        return ModuleClient(module_ip, int(module_port), self.key)
     
     def get_all_miners(self, miner_whitelist = None):
         velora_netuid = self.netuid
@@ -71,7 +109,7 @@ class ValidatorAPI(Module):
             modules_info[module_id] = (module_addr, modules_keys[module_id])
         return modules_info
     
-    def _get_miner_prediction(
+    async def _get_miner_prediction(
         self,
         synapse,
         miner_info: tuple[list[str], Ss58Address],
@@ -79,6 +117,9 @@ class ValidatorAPI(Module):
         """
         Prompt a miner module to generate an answer to the given question.
 
+        The call is awaited on the running event loop, so it can run alongside
+        other miners and be cancelled while still in flight.
+
         Args:
             question: The question to ask the miner module.
             miner_info: A tuple containing the miner's connection information and key.
@@ -88,35 +129,35 @@ class ValidatorAPI(Module):
         """
         connection, miner_key = miner_info
         module_ip, module_port = connection
-        client = ModuleClient(module_ip, int(module_port), self.key)
+        client = self._module_client(module_ip, module_port)
         try:
             # handles the communication with the miner
-            synapse_dict = synapse.dict()
-            synapse_dict['synapse_name'] = synapse.__class__.__name__
-            
-            response = asyncio.run(
-                client.call(
-                    f"forward",
-                    miner_key,
-                    {"synapse": synapse_dict},
-                    timeout=self.call_timeout,  #  type: ignore
-                )
+            response = await client.call(
+                f"forward",
+                miner_key,
+                synapse_params(synapse),
+                timeout=self.call_timeout,  #  type: ignore
             )
             response = json.loads(response)
             miner_answer = synapse.__class__(**response)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Miner {module_ip}:{module_port} failed to generate an answer")
             miner_answer = None
         return miner_answer
     
-    def get_miner_answer(self, modules_info, synapses):
+    async def get_miner_answer(self, modules_info, synapses):
         if not isinstance(synapses, list):
             synapses = [synapses] * len(modules_info)
         logger.info(f"Selected the following miners: {modules_info.keys()}")
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-            it = executor.map(lambda x: self._get_miner_prediction(x[0], x[1]), list(zip(synapses, modules_info.values())))
-            answers = [*it]
+        start = time.perf_counter()
+        answers = await asyncio.gather(*[
+            self._observed_prediction(uid, synapse, miner_info, start)
+            for synapse, (uid, miner_info) in zip(synapses, modules_info.items())
+        ])
+        answers = [answer for answer, _ in answers]
             
         if not answers:
             logger.info("No miner managed to give an answer")
@@ -125,6 +166,135 @@ class ValidatorAPI(Module):
         # print(f'miner answers: {answers}')
         
         return answers
+
+    async def stream_miner_answers(self, modules_info, synapse):
+        """
+        Query all miners concurrently and yield their answers as they arrive.
+
+        Closing the generator early cancels the calls still in flight.
+
+        Args:
+            modules_info: A dictionary mapping miner UIDs to their connection information and key.
+            synapse: The synapse sent to every miner.
+
+        Yields:
+            Tuples of (miner UID, answer or None, seconds since the fan-out started).
+        """
+        start = time.perf_counter()
+
+        async def timed_prediction(uid, miner_info):
+            answer, elapsed = await self._observed_prediction(uid, synapse, miner_info, start)
+            return uid, answer, elapsed
+
+        tasks = [
+            asyncio.create_task(timed_prediction(uid, miner_info))
+            for uid, miner_info in modules_info.items()
+        ]
+        try:
+            for next_answer in asyncio.as_completed(tasks):
+                yield await next_answer
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def race_miner_answers(self, modules_info, synapse, quorum: int = 1):
+        """
+        Query all miners concurrently and stop at the first `quorum` valid answers.
+
+        Calls that are still in flight once the quorum is reached are cancelled.
+
+        Args:
+            modules_info: A dictionary mapping miner UIDs to their connection information and key.
+            synapse: The synapse sent to every miner.
+            quorum: The number of valid answers to wait for.
+
+        Returns:
+            The valid answers in arrival order. Fewer than `quorum` answers are
+            returned when not enough miners answered.
+        """
+        logger.info(f"Racing the following miners: {modules_info.keys()}")
+        quorum = max(1, min(quorum, len(modules_info)))
+        answers = []
+        async with aclosing(self.stream_miner_answers(modules_info, synapse)) as stream:
+            async for _, answer, _ in stream:
+                if not self._is_valid_answer(answer):
+                    continue
+                answers.append(answer)
+                if len(answers) >= quorum:
+                    break
+        if len(answers) < quorum:
+            logger.warning(f"Only {len(answers)} of {quorum} required miners gave a valid answer")
+        return answers
+
+    async def _observed_prediction(self, uid: int, synapse, miner_info, start: float):
+        """
+        `_get_miner_prediction`, recorded in the ledger with the time elapsed
+        since `start`. A call cancelled before the miner answered (a miner
+        losing a race) is recorded as a miss.
+
+        Returns:
+            The answer, or None, and the elapsed time in seconds.
+        """
+        try:
+            answer = await self._get_miner_prediction(synapse, miner_info)
+        except asyncio.CancelledError:
+            self._observe(uid, synapse, time.perf_counter() - start, None)
+            raise
+        elapsed = time.perf_counter() - start
+        self._observe(uid, synapse, elapsed, answer)
+        return answer, elapsed
+
+    def _observe(self, uid: int, synapse, latency: float, answer):
+        if self.ledger is None:
+            return
+        self.ledger.record(uid, synapse.translation_request['task_string'], latency, self._is_valid_answer(answer))
+        if self.ledger.should_flush() and (self._ledger_flush is None or self._ledger_flush.done()):
+            pending = self.ledger.take_pending()
+            self._ledger_flush = asyncio.ensure_future(asyncio.to_thread(self.ledger.write, pending))
+
+    async def close_ledger(self):
+        """
+        Persist the pending observations of the ledger and close it.
+        """
+        if self.ledger is None:
+            return
+        if self._ledger_flush is not None:
+            await self._ledger_flush
+        await asyncio.to_thread(self.ledger.close)
+
+    def _is_valid_answer(self, answer) -> bool:
+        return answer is not None and bool(answer.miner_response)
+
+    def _select_answer(self, answers, task_string: str):
+        """
+        Pick the answer to return to the user.
+
+        A single answer is returned as is. When several text answers are
+        available, the one agreeing the most with the others is picked.
+        Speech answers cannot be compared without decoding, so the first one
+        is used.
+        """
+        if len(answers) == 1 or task_string.endswith('speech'):
+            return answers[0]
+
+        def agreement(answer):
+            return sum(
+                SequenceMatcher(None, answer.miner_response, other.miner_response).ratio()
+                for other in answers if other is not answer
+            )
+
+        return max(answers, key=agreement)
+
+    def _decode_miner_output(self, response, task_string: str) -> str:
+        if not task_string.endswith('speech'):
+            return response.miner_response
+        miner_output_data = audio_decode(response.miner_response)
+        wav_file = _tensor_to_wav(miner_output_data)
+        if isinstance(wav_file, io.BytesIO):
+            miner_output_data = wav_file.getvalue()
+        elif isinstance(wav_file, str):
+            miner_output_data = open(wav_file, 'rb').read()
+        return base64.b64encode(miner_output_data).decode("utf-8")
     
     def get_top_miners_uids(self, k = 5):
         miner_weights = self.client.query_map_weights(netuid=self.netuid)
@@ -142,32 +312,192 @@ class ValidatorAPI(Module):
         
         return [miner_uid for miner_uid, _ in top_k_miners]
 
-    def get_top_miners(self, k = 5):
+    def query_top_miners(self, k = 5):
         miner_uids = self.get_top_miners_uids(k)
         miners = self.get_all_miners(miner_uids)
         
         return miners
+
+    async def get_top_miners(self, k = 5):
+        """
+        Return the top `k` miners, querying the chain at most every `miners_ttl` seconds.
+        """
+        async with self._top_miners_lock:
+            expiry, miners = self._top_miners.get(k, (0.0, None))
+            if miners is None or time.monotonic() >= expiry:
+                miners = await asyncio.to_thread(self.query_top_miners, k)
+                self._top_miners[k] = (time.monotonic() + self.miners_ttl, miners)
+            return miners
+
+    async def select_miners(self, translation_request: dict):
+        """
+        Return the miners a single translation request is sent to: the
+        router's selection when routing is enabled, the top miners otherwise.
+        """
+        if self.router is None:
+            return await self.get_top_miners()
+        candidates = await self.get_top_miners(self.router.pool_size)
+        miners = self.router.select(
+            candidates,
+            translation_request['task_string'],
+            translation_request['source_language'],
+            translation_request['target_language'],
+        )
+        logger.info(f"Routed request to miners {list(miners.keys())} out of {len(candidates)}")
+        return miners
     
-    def get_translation(self, translation_request: dict):
-        modules_info = self.get_top_miners()
+    async def get_translation_answer(self, translation_request: dict, race: bool | None = None, quorum: int | None = None):
+        """
+        Query the miners for a translation request and pick the answer to
+        return, without decoding it.
+
+        Returns:
+            The chosen miner answer, or None if no miner gave a valid answer.
+        """
+        race = self.race if race is None else race
+        quorum = self.quorum if quorum is None else quorum
+        task_string = translation_request['task_string']
+
+        modules_info = await self.select_miners(translation_request)
         synapse = TranslationSynapse(translation_request = translation_request)
-        responses = self.get_miner_answer(modules_info, synapse)
-        
-        result = []
-        for response in responses:
-            if response is not None and response.miner_response is not None:
-                if translation_request['task_string'].endswith('speech'):
-                    miner_output_data = audio_decode(response.miner_response)
-                    wav_file = _tensor_to_wav(miner_output_data)
-                    if isinstance(wav_file, io.BytesIO):
-                        miner_output_data = wav_file.getvalue()
-                    elif isinstance(wav_file, str):
-                        miner_output_data = open(wav_file, 'rb').read()
-                    miner_output_data = base64.b64encode(miner_output_data).decode("utf-8")
+        if race:
+            answers = await self.race_miner_answers(modules_info, synapse, quorum)
+            answer = self._select_answer(answers, task_string) if answers else None
+        else:
+            responses = await self.get_miner_answer(modules_info, synapse) or []
+            answers = [response for response in responses if self._is_valid_answer(response)]
+            answer = random.choice(answers) if answers else None
+        return answer
+
+    async def get_translation(self, translation_request: dict, race: bool | None = None, quorum: int | None = None):
+        task_string = translation_request['task_string']
+        answer = await self.get_translation_answer(translation_request, race, quorum)
+        if answer is None:
+            return NO_MINER_AVAILABLE
+        # only the answer sent back to the user is decoded, off the event loop
+        miner_output_data = await asyncio.to_thread(self._decode_miner_output, answer, task_string)
+        logger.info(f'DECODED OUTPUT DATA: {miner_output_data[:100]}')
+        return miner_output_data
+
+    async def stream_translation(self, translation_request: dict):
+        """
+        Fan a translation request out to the selected miners and yield every answer
+        as soon as it arrives, decoded for the user.
+
+        Args:
+            translation_request: The translation request sent to the miners.
+
+        Yields:
+            One dictionary per miner, with its UID, its arrival rank, the
+            elapsed time in milliseconds and its decoded output (None when the
+            miner failed to answer).
+        """
+        task_string = translation_request['task_string']
+        modules_info = await self.select_miners(translation_request)
+        synapse = TranslationSynapse(translation_request = translation_request)
+
+        rank = 0
+        async with aclosing(self.stream_miner_answers(modules_info, synapse)) as stream:
+            async for uid, answer, elapsed in stream:
+                output = None
+                if self._is_valid_answer(answer):
+                    try:
+                        output = await asyncio.to_thread(self._decode_miner_output, answer, task_string)
+                    except Exception as e:
+                        logger.error(f"Failed to decode the answer of miner {uid}: {e}")
+                yield {
+                    "uid": uid,
+                    "rank": rank,
+                    "elapsed_ms": round(elapsed * 1000, 1),
+                    "output": output,
+                }
+                rank += 1
+
+    async def get_batch_translation(self, translation_requests: list[dict], max_attempts: int = 3, max_failures: int = 3) -> list[dict]:
+        """
+        Translate many requests by spreading them over the available miners.
+
+        Every item is sent to a single miner. Each miner runs up to
+        `miner_concurrency` items at a time, so throughput grows with the
+        number of miners. A failed item is retried on whichever miner is free
+        next, and a miner failing `max_failures` items in a row stops
+        receiving items.
+
+        Args:
+            translation_requests: The translation requests.
+            max_attempts: The number of miners an item is tried on before giving up.
+            max_failures: The number of consecutive failures after which a miner is dropped.
+
+        Returns:
+            One dictionary per request, in order, with the decoded `output`
+            and the `uid` of the miner that answered, or an `error`.
+        """
+        results: list[dict | None] = [None] * len(translation_requests)
+        if not translation_requests:
+            return []
+        modules_info = await self.get_top_miners(self.batch_miners)
+        if not modules_info:
+            return [
+                {"index": index, "output": None, "uid": None, "error": NO_MINER_AVAILABLE}
+                for index in range(len(translation_requests))
+            ]
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for index in range(len(translation_requests)):
+            queue.put_nowait((index, 0))
+        remaining = len(translation_requests)
+        all_done = asyncio.Event()
+        miner_failures = defaultdict(int)
+
+        def resolve(index: int, result: dict):
+            nonlocal remaining
+            results[index] = {"index": index, "output": None, "uid": None, "error": None, **result}
+            remaining -= 1
+            if remaining == 0:
+                all_done.set()
+
+        async def worker(uid, miner_info):
+            while miner_failures[uid] < max_failures:
+                index, attempt = await queue.get()
+                if miner_failures[uid] >= max_failures:
+                    # dropped while waiting, the item goes to another miner
+                    queue.put_nowait((index, attempt))
+                    return
+                translation_request = translation_requests[index]
+                synapse = TranslationSynapse(translation_request = translation_request)
+                answer, _ = await self._observed_prediction(uid, synapse, miner_info, time.perf_counter())
+                if self._is_valid_answer(answer):
+                    miner_failures[uid] = 0
+                    try:
+                        output = await asyncio.to_thread(self._decode_miner_output, answer, translation_request['task_string'])
+                        resolve(index, {"output": output, "uid": uid})
+                    except Exception as e:
+                        resolve(index, {"uid": uid, "error": f"Failed to decode miner answer: {e}"})
+                    continue
+                miner_failures[uid] += 1
+                if attempt + 1 < max_attempts:
+                    queue.put_nowait((index, attempt + 1))
                 else:
-                    miner_output_data = response.miner_response
-                logger.info(f'DECODED OUTPUT DATA: {miner_output_data}')
-                result.append(miner_output_data)
-        if(len(result) == 0):
-            return "No miner available!"
-        return random.choice(result)
\ No newline at end of file
+                    resolve(index, {"error": f"No valid answer after {max_attempts} attempts"})
+
+        logger.info(f"Spreading {len(translation_requests)} requests over miners: {modules_info.keys()}")
+        workers = [
+            asyncio.create_task(worker(uid, miner_info))
+            for uid, miner_info in modules_info.items()
+            for _ in range(self.miner_concurrency)
+        ]
+        waiters = [asyncio.create_task(all_done.wait())]
+        if workers:
+            # every worker returning means every miner was dropped
+            waiters.append(asyncio.ensure_future(asyncio.gather(*workers)))
+        try:
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in workers + waiters:
+                task.cancel()
+            await asyncio.gather(*workers, *waiters, return_exceptions=True)
+
+        for index, result in enumerate(results):
+            if result is None:
+                resolve(index, {"error": NO_MINER_AVAILABLE})
+        return results
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import multiprocessing
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Optional
+
+from communex.module._signer import verify  # type: ignore
+from communex.module._util import try_ss58_decode  # type: ignore
+
+from src.utils.metrics import QUEUE_DEPTH
+from src.utils.utils import logger
+
+from .executor import CALLER_GONE
+
+TASK_REGEX = re.compile(rb'"task_string"\s*:\s*"(\w+)"')
+
+# Initial estimate of the GPU seconds every task takes, refined with the
+# measured inference times. Speech output goes through the vocoder and speech
+# input through the speech encoder, which makes them much more expensive.
+DEFAULT_TASK_COSTS = {
+    "text2text": 1.0,
+    "speech2text": 2.5,
+    "text2speech": 3.0,
+    "speech2speech": 5.0,
+}
+
+
+class AdmissionController:
+    """
+    Decides whether the miner accepts a request, from the work already queued.
+
+    Every model replica runs one request at a time, so a request accepted
+    now waits for the estimated cost of the requests ahead of it, spread
+    over the replicas. When that wait plus
+    its own cost does not fit in the caller's budget, the request is refused
+    right away with a busy response, instead of timing out on the
+    validator's side after holding a slot in the queue.
+
+    Every caller gets a share of `max_wait` that grows with its stake, so
+    when the queue fills up the low stake callers are refused first.
+
+    Args:
+        max_wait: The longest estimated time (queue plus inference) a request
+            of the highest stake caller may be accepted with, in seconds.
+        min_share: The share of `max_wait` given to callers without stake.
+        task_costs: Initial estimate of the inference time of every task.
+        smoothing: Weight of a new measurement in the moving average of the costs.
+        workers: The number of requests processed in parallel (model replicas).
+        queue_state: Shared `multiprocessing.Array('d', 2)` holding the queued
+            cost and number of requests, for HTTP worker processes sharing one
+            inference engine. Private to the controller when not given.
+    """
+
+    def __init__(
+        self,
+        max_wait: float = 30.0,
+        min_share: float = 0.25,
+        task_costs: Optional[dict[str, float]] = None,
+        smoothing: float = 0.2,
+        workers: int = 1,
+        queue_state=None,
+    ):
+        self.max_wait = max_wait
+        self.min_share = min_share
+        self.smoothing = smoothing
+        self.workers = workers
+        self.task_costs = dict(DEFAULT_TASK_COSTS if task_costs is None else task_costs)
+        self._default_cost = max(self.task_costs.values())
+        self._stakes: dict[str, int] = {}
+        self._sorted_stakes: list[int] = []
+        self._queue = multiprocessing.Array('d', 2) if queue_state is None else queue_state
+        QUEUE_DEPTH.set_function(lambda: {(): self._queue[1]})
+        self.admitted = 0
+        self.rejected = 0
+
+    def cost(self, task: Optional[str]) -> float:
+        return self.task_costs.get(task, self._default_cost)
+
+    def share(self, caller: Optional[str]) -> float:
+        """
+        The share of `max_wait` a caller gets, from the rank of its stake
+        among all the stakes on the chain.
+        """
+        stake = self._stakes.get(caller, 0)
+        if not stake or not self._sorted_stakes:
+            return self.min_share
+        rank = bisect_left(self._sorted_stakes, stake) + 1
+        return self.min_share + (1 - self.min_share) * rank / len(self._sorted_stakes)
+
+    def admit(self, task: Optional[str], caller: Optional[str]) -> tuple[bool, float]:
+        """
+        Try to reserve a place in the queue.
+
+        Args:
+            task: The task string of the request.
+            caller: The SS58 address of the caller.
+
+        Returns:
+            Whether the request is admitted, and the reserved cost when it is
+            or the number of seconds to retry after when it is not.
+        """
+        cost = self.cost(task)
+        budget = self.max_wait * self.share(caller)
+        with self._queue.get_lock():
+            queued_cost, queued = self._queue
+            wait = queued_cost / self.workers
+            # an idle replica accepts anything, however long it takes
+            if queued >= self.workers and wait + cost > budget:
+                self.rejected += 1
+                return False, max(wait + cost - budget, cost)
+            self._queue[0] = queued_cost + cost
+            self._queue[1] = queued + 1
+        self.admitted += 1
+        return True, cost
+
+    def release(self, cost: float):
+        with self._queue.get_lock():
+            self._queue[0] = max(0.0, self._queue[0] - cost)
+            self._queue[1] -= 1
+
+    def observe(self, task: str, seconds: float):
+        """
+        Record the measured inference time of a task.
+        """
+        previous = self.task_costs.get(task)
+        if previous is None:
+            self.task_costs[task] = seconds
+        else:
+            self.task_costs[task] = (1 - self.smoothing) * previous + self.smoothing * seconds
+
+    def set_stakes(self, stakes: dict[str, int]):
+        self._stakes = stakes
+        self._sorted_stakes = sorted(stake for stake in stakes.values() if stake > 0)
+
+    def refresh_stakes(self, get_client: Callable, interval: float = 600.0) -> threading.Thread:
+        """
+        Keep the stakes of the callers up to date in a background thread.
+
+        Args:
+            get_client: Callable returning a CommuneClient.
+            interval: The time between two refreshes, in seconds.
+        """
+        def refresh():
+            while True:
+                try:
+                    stake_from = get_client().query_map_stakefrom()
+                    self.set_stakes({key: sum(amount for _, amount in stakers) for key, stakers in stake_from.items()})
+                    logger.info(f"Refreshed the stake of {len(self._stakes)} keys")
+                except Exception as e:
+                    logger.error(f"Failed to refresh the caller stakes: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        return {
+            "queued": int(self._queue[1]),
+            "queued_cost": self._queue[0],
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "task_costs": dict(self.task_costs),
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying an `AdmissionController` to the module endpoints.
+
+    It runs before the signature checks of the module server, so a refused
+    request costs nothing but reading its body. The signature is only checked
+    here when the `x-key` of the caller has stake: any caller may send the key
+    of a validator, and only the key that signed the body gets its share of
+    `max_wait`. The reservation is held until the response is sent.
+
+    Once the body is read, it watches for the caller disconnecting (its
+    timeout passed) and sets `CALLER_GONE` for the endpoint, which cancels
+    the inference nobody will read.
+    """
+
+    def __init__(self, app, controller: AdmissionController, path_prefix: str = "/method/"):
+        self.app = app
+        self.controller = controller
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+
+        # the body is signed JSON, so the task is looked up without parsing it
+        match = TASK_REGEX.search(body)
+        task = match.group(1).decode() if match else None
+        caller = _caller_address(scope)
+        if caller is not None and self.controller.share(caller) > self.controller.min_share and not _signed_by_key(scope, body):
+            # a claimed key, served with the share of callers without stake
+            caller = None
+        admitted, value = self.controller.admit(task, caller)
+        if not admitted:
+            retry_after = f"{value:.1f}"
+            content = json.dumps({"error": "Miner busy", "retry_after": float(retry_after)}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(content)).encode()),
+                    (b"retry-after", retry_after.encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": content})
+            return
+
+        replayed = False
+        caller_gone = asyncio.Event()
+
+        async def watch():
+            # only the disconnect is left to receive once the body is read
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            caller_gone.set()
+
+        async def replay():
+            nonlocal replayed
+            if replayed:
+                await caller_gone.wait()
+                return {"type": "http.disconnect"}
+            replayed = True
+            return {"type": "http.request", "body": bytes(body), "more_body": False}
+
+        watcher = asyncio.ensure_future(watch())
+        token = CALLER_GONE.set(caller_gone)
+        try:
+            await self.app(scope, replay, send)
+        finally:
+            CALLER_GONE.reset(token)
+            watcher.cancel()
+            self.controller.release(value)
+
+
+def _caller_address(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"x-key":
+            return try_ss58_decode(value.decode())
+    return None
+
+
+def _parse_hex(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def _signed_by_key(scope, body: bytes) -> bool:
+    """
+    Whether the body is signed by the `x-key` of the request, checked as the
+    module server checks it (with the legacy `x-timestamp` stamped body too).
+    """
+    headers = {name.decode(): value.decode() for name, value in scope["headers"] if name.startswith(b"x-")}
+    try:
+        key = _parse_hex(headers["x-key"])
+        signature = _parse_hex(headers["x-signature"])
+        crypto = int(headers["x-crypto"])
+        if verify(key, crypto, bytes(body), signature):
+            return True
+        timestamp = headers.get("x-timestamp")
+        if timestamp:
+            stamped_body = json.loads(body)
+            stamped_body["timestamp"] = timestamp
+            return verify(key, crypto, json.dumps(stamped_body).encode(), signature)
+    except Exception:
+        pass
+    return False
@@ -1,19 +1,59 @@
 import typer
 import getpass
 from typing import Annotated
+from communex._common import get_node_url
+from communex.client import CommuneClient
 from communex.compat.key import classic_load_key
+from fastapi import Response
 from keylimiter import TokenBucketLimiter
 from communex.module.server import ModuleServer
 import uvicorn
 import os
+import multiprocessing
+import socket
+import tempfile
+from multiprocessing.connection import wait
 from dotenv import load_dotenv
 
+from .admission import AdmissionController, AdmissionMiddleware
+from .engine import EngineClient, run_engine
 from .miner import Miner
+from .replicas import default_devices
+from src.utils.metrics import REGISTRY, render
 
 load_dotenv()
 
 app = typer.Typer()
 
+def _add_metrics_route(fastapi_app, engine = None):
+    """
+    Serves the Prometheus metrics on `GET /metrics`, outside of the signed
+    module endpoints. With an engine process, its metrics are included.
+    """
+    def metrics():
+        if engine is None:
+            return Response(render(REGISTRY.collect()), media_type="text/plain; version=0.0.4")
+        # both processes have the same families, told apart by a process label
+        content = render(REGISTRY.collect(), engine.metrics(), processes=[f"worker-{os.getpid()}", "engine"])
+        return Response(content, media_type="text/plain; version=0.0.4")
+
+    fastapi_app.add_api_route("/metrics", metrics, methods=["GET"])
+
+def _serve_worker(sock, key, netuid, use_testnet, admission_args, stake_refresh, ip_burst, ip_refill_rate, engine_address, authkey, queue_size, request_timeout):
+    """
+    Runs one HTTP worker process, sending inference to the engine process.
+    """
+    admission = AdmissionController(**admission_args)
+    admission.refresh_stakes(lambda: CommuneClient(get_node_url(use_testnet=use_testnet)), stake_refresh)
+    engine = EngineClient(engine_address, authkey, on_processed=admission.observe)
+    miner = Miner(admission, engine=engine, queue_size=queue_size, request_timeout=request_timeout)
+
+    bucket = TokenBucketLimiter(ip_burst, ip_refill_rate)
+    server = ModuleServer(miner, key, limiter=bucket, subnets_whitelist=[netuid], use_testnet = use_testnet)
+    _add_metrics_route(server.get_fastapi_app(), engine)
+    app = AdmissionMiddleware(server.get_fastapi_app(), admission)
+    uvicorn.Server(uvicorn.Config(app)).run(sockets=[sock])
+
 @app.command("serve-subnet")
 def serve(
     commune_key: str,
@@ -21,19 +61,91 @@ def serve(
     ip: str = typer.Option("0.0.0.0", help="IP to bind the server to"),
     port: int = typer.Option(9999, help="Port to bind the server to"),
     use_testnet: bool = typer.Option(False, help="Network to connect to [`mainnet`, `testnet`]"),
+    max_wait: float = typer.Option(30.0, help="Longest estimated queue wait plus inference time a request is accepted with, in seconds"),
+    min_share: float = typer.Option(0.25, help="Share of --max-wait given to callers without stake"),
+    stake_refresh: float = typer.Option(600.0, help="Seconds between two refreshes of the caller stakes"),
+    ip_burst: int = typer.Option(60, help="Per IP rate limit burst, a flood guard in front of the admission control"),
+    ip_refill_rate: float = typer.Option(2.0, help="Per IP rate limit refill rate, in requests per second"),
+    replicas: int = typer.Option(1, help="Number of model replicas, spread over the GPUs, or over the NUMA nodes of a CPU box"),
+    devices: str = typer.Option(None, help="Comma separated device of every replica, e.g. `cuda:0,cuda:1`, overrides --replicas"),
+    workers: int = typer.Option(1, help="Number of HTTP worker processes; above 1, the models run in a separate engine process shared by the workers"),
+    queue_size: int = typer.Option(64, help="Requests waiting for a replica per HTTP worker, beyond which the miner answers busy"),
+    request_timeout: float = typer.Option(None, help="Longest a request may take, queue included, before it is cancelled; requests are also cancelled when the caller disconnects"),
 ):
     password = getpass.getpass(prompt="Enter the password for your key:")
     key = classic_load_key(commune_key, password=password)
-    miner = Miner()
-    refill_rate = 1 / 4
-    
-    # Implementing custom limit
-    bucket = TokenBucketLimiter(15, refill_rate)
+    devices = devices.split(",") if devices else default_devices(replicas)
+    if workers > 1:
+        _serve_workers(key, netuid, ip, port, use_testnet, max_wait, min_share, stake_refresh, ip_burst, ip_refill_rate, devices, workers, queue_size, request_timeout)
+        return
+
+    admission = AdmissionController(max_wait=max_wait, min_share=min_share, workers=len(devices))
+    admission.refresh_stakes(lambda: CommuneClient(get_node_url(use_testnet=use_testnet)), stake_refresh)
+    miner = Miner(admission, devices, queue_size=queue_size, request_timeout=request_timeout)
+
+    # requests are admitted from the inference queue, the bucket only guards against floods
+    bucket = TokenBucketLimiter(ip_burst, ip_refill_rate)
     server = ModuleServer(miner, key, limiter=bucket, subnets_whitelist=[netuid], use_testnet = use_testnet)
-    app = server.get_fastapi_app()
+    _add_metrics_route(server.get_fastapi_app())
+    app = AdmissionMiddleware(server.get_fastapi_app(), admission)
 
     # Only allow local connections
     uvicorn.run(app, host=ip, port=port)
 
+def _serve_workers(key, netuid, ip, port, use_testnet, max_wait, min_share, stake_refresh, ip_burst, ip_refill_rate, devices, workers, queue_size, request_timeout):
+    """
+    Serves the miner from several HTTP worker processes.
+
+    The model weights are loaded once, by an engine process, and the workers
+    send it the requests over a Unix socket. The workers accept connections
+    on one shared listening socket and share the state of the inference
+    queue, so the admission control sees the requests of all of them.
+    """
+    engine_address = os.path.join(tempfile.mkdtemp(prefix="linguanet-"), "engine.sock")
+    authkey = os.urandom(32)
+    # the engine initializes the GPUs, it must not inherit the parent's state
+    spawn = multiprocessing.get_context("spawn")
+    ready = spawn.Event()
+    engine = spawn.Process(target=run_engine, args=(engine_address, authkey, devices, ready), name="linguanet-engine", daemon=True)
+    engine.start()
+    while not ready.wait(timeout=5):
+        if not engine.is_alive():
+            raise RuntimeError("The inference engine failed to start")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((ip, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # the workers are forked, so they get the loaded key and the shared queue state
+    fork = multiprocessing.get_context("fork")
+    admission_args = {
+        "max_wait": max_wait,
+        "min_share": min_share,
+        "workers": len(devices),
+        "queue_state": fork.Array('d', 2),
+    }
+    processes = [
+        fork.Process(
+            target=_serve_worker,
+            args=(sock, key, netuid, use_testnet, admission_args, stake_refresh, ip_burst, ip_refill_rate, engine_address, authkey, queue_size, request_timeout),
+            name=f"linguanet-worker-{index}",
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # a dead worker or engine takes the whole miner down, for the supervisor to restart it
+    try:
+        wait([engine.sentinel] + [process.sentinel for process in processes])
+    finally:
+        for process in processes + [engine]:
+            if process.is_alive():
+                process.terminate()
+        for process in processes + [engine]:
+            process.join()
+
 if __name__ == "__main__":
     typer.run(serve)
\ No newline at end of file
@@ -0,0 +1,195 @@
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Callable, Optional
+
+from src.utils.metrics import REGISTRY
+from src.utils.utils import logger
+
+from .executor import Cancelled
+
+# sent in place of a translation request to cancel the request with the same id
+CANCEL = "cancel"
+# how often a worker waiting for the engine checks if its request was cancelled, in seconds
+CANCEL_POLL = 0.1
+
+
+class EngineServer:
+    """
+    Inference engine serving the model replicas to the HTTP worker processes.
+
+    The engine is the only process holding the model weights. Every worker
+    keeps one connection to it (a Unix socket by default) and multiplexes its
+    requests over it. Requests and answers are pickled `(request_id, ...)`
+    tuples, so no HTTP, JSON or base64 work is done twice. A request of
+    None asks for the engine's metrics instead, and a request of `CANCEL`
+    cancels the request with the same id.
+
+    Args:
+        pool: The `ReplicaPool` processing the requests.
+        address: The address to listen on, a Unix socket path or a (host, port) tuple.
+        authkey: The key the workers authenticate with.
+    """
+
+    def __init__(self, pool, address, authkey: bytes):
+        self.pool = pool
+        self.listener = Listener(address, authkey=authkey)
+        # enough threads to keep every replica busy with requests from any worker
+        self.executor = ThreadPoolExecutor(max_workers=4 * len(pool), thread_name_prefix="engine")
+
+    def serve_forever(self):
+        logger.info(f"Inference engine listening on {self.listener.address}")
+        while True:
+            connection = self.listener.accept()
+            threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def _serve_connection(self, connection: Connection):
+        send_lock = threading.Lock()
+        # the cancellation events of the requests in progress
+        cancellations: dict[int, threading.Event] = {}
+        while True:
+            try:
+                request_id, translation_request = connection.recv()
+            except (EOFError, OSError):
+                break
+            if translation_request is None:
+                # metrics are answered right away, not behind the inference requests
+                self._process(connection, send_lock, request_id, None)
+            elif translation_request == CANCEL:
+                cancelled = cancellations.get(request_id)
+                if cancelled is not None:
+                    cancelled.set()
+            else:
+                cancellations[request_id] = threading.Event()
+                self.executor.submit(self._process, connection, send_lock, request_id, translation_request, cancellations)
+        # nobody is left to read the answers
+        for cancelled in list(cancellations.values()):
+            cancelled.set()
+        connection.close()
+
+    def _process(self, connection: Connection, send_lock: threading.Lock, request_id: int, translation_request: Optional[dict], cancellations: Optional[dict] = None):
+        try:
+            if translation_request is None:
+                output, elapsed = REGISTRY.collect(), 0.0
+            else:
+                output, elapsed = self.pool.process_timed(translation_request, cancellations[request_id])
+            reply = (request_id, output, None, elapsed)
+        except Cancelled as e:
+            reply = (request_id, None, f"{type(e).__name__}: {e}", 0.0)
+        except Exception as e:
+            logger.error(f"Engine failed to process a request: {e}")
+            reply = (request_id, None, f"{type(e).__name__}: {e}", 0.0)
+        finally:
+            if cancellations is not None:
+                cancellations.pop(request_id, None)
+        try:
+            with send_lock:
+                connection.send(reply)
+        except (EOFError, OSError):
+            pass
+
+
+def run_engine(address, authkey: bytes, devices: list[str], ready=None):
+    """
+    Entry point of the engine process: load the replicas and serve them.
+    """
+    from .replicas import ReplicaPool
+
+    server = EngineServer(ReplicaPool(devices), address, authkey)
+    if ready is not None:
+        ready.set()
+    server.serve_forever()
+
+
+class EngineClient:
+    """
+    Connection of an HTTP worker to the inference engine.
+
+    Has the same `process(translation_request)` interface as `Translation`,
+    and is safe to call from any number of threads: requests are sent over
+    one connection and the answers are matched to them by id.
+
+    Args:
+        address: The address of the engine.
+        authkey: The key to authenticate with.
+        on_processed: Called with the task string and the inference time in
+            seconds of every processed request.
+    """
+
+    def __init__(self, address, authkey: bytes, on_processed: Optional[Callable[[str, float], None]] = None):
+        self.on_processed = on_processed
+        self._connection = Client(address, authkey=authkey)
+        self._send_lock = threading.Lock()
+        self._pending: dict[int, tuple[str, Future]] = {}
+        self._ids = itertools.count()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_replies, daemon=True)
+        self._reader.start()
+
+    def _read_replies(self):
+        while True:
+            try:
+                request_id, output, error, elapsed = self._connection.recv()
+            except (EOFError, OSError):
+                break
+            pending = self._pending.pop(request_id, None)
+            if pending is None:
+                # cancelled, nobody waits for it
+                continue
+            task_string, future = pending
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+                continue
+            if self.on_processed is not None and task_string is not None:
+                self.on_processed(task_string, elapsed)
+            future.set_result(output)
+
+        logger.error("Lost the connection to the inference engine")
+        self._closed = True
+        for _, future in self._pending.values():
+            future.set_exception(ConnectionError("Lost the connection to the inference engine"))
+        self._pending.clear()
+
+    def process(self, translation_request: dict, cancelled: Optional[threading.Event] = None):
+        """
+        Raises `Cancelled` when `cancelled` is set before the answer comes,
+        after asking the engine to stop the request.
+        """
+        return self._call(translation_request, cancelled)
+
+    def metrics(self) -> list[tuple]:
+        """
+        The metrics of the engine process, see `Registry.collect`.
+        """
+        return self._call(None)
+
+    def _call(self, translation_request: Optional[dict], cancelled: Optional[threading.Event] = None):
+        if self._closed:
+            raise ConnectionError("Lost the connection to the inference engine")
+        future = Future()
+        request_id = next(self._ids)
+        task_string = None if translation_request is None else translation_request["task_string"]
+        self._pending[request_id] = (task_string, future)
+        try:
+            with self._send_lock:
+                self._connection.send((request_id, translation_request))
+        except (EOFError, OSError) as e:
+            self._pending.pop(request_id, None)
+            raise ConnectionError("Lost the connection to the inference engine") from e
+        if cancelled is None:
+            return future.result()
+
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL)
+            except TimeoutError:
+                if not cancelled.is_set():
+                    continue
+            self._pending.pop(request_id, None)
+            try:
+                with self._send_lock:
+                    self._connection.send((request_id, CANCEL))
+            except (EOFError, OSError):
+                pass
+            raise Cancelled("cancelled during inference")
@@ -0,0 +1,140 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Optional
+
+from src.utils.utils import logger
+
+# set by `AdmissionMiddleware` when the caller of the current request disconnects
+CALLER_GONE: ContextVar[Optional[asyncio.Event]] = ContextVar("caller_gone", default=None)
+
+
+class Cancelled(Exception):
+    """
+    The caller of a request gave up on it before it was answered.
+    """
+
+
+class QueueFull(Exception):
+    """
+    The inference queue has no room for another request.
+    """
+
+
+class _Job:
+    def __init__(self, translation_request: dict):
+        self.translation_request = translation_request
+        self.future: Future = Future()
+        self.cancelled = threading.Event()
+
+
+class InferenceExecutor:
+    """
+    Runs the inference of the miner endpoint off the HTTP event loop.
+
+    Requests wait in a bounded queue for one of `workers` dedicated threads,
+    which call `backend.process`. The endpoint awaits the result, so the
+    event loop keeps serving the other requests (metrics, refusals,
+    signature checks) meanwhile.
+
+    A request is cancelled when its caller disconnects or after `timeout`
+    seconds: it is dropped if still queued, and a running request is given
+    the cancellation event, with which `ReplicaPool` and `EngineClient` stop
+    it at the next model step.
+
+    Args:
+        backend: A `ReplicaPool` or `EngineClient`, with a
+            `process(translation_request, cancelled)` method.
+        workers: The number of requests processed in parallel (model replicas).
+        queue_size: The number of requests waiting for a worker, beyond which
+            `QueueFull` is raised.
+        timeout: The longest a request may take, queue included, in seconds.
+    """
+
+    def __init__(self, backend, workers: int = 1, queue_size: int = 64, timeout: Optional[float] = None):
+        self.backend = backend
+        self.timeout = timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.rejected = 0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"inference-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            if not job.future.set_running_or_notify_cancel():
+                # cancelled while queued, nobody is waiting for it anymore
+                self.dropped += 1
+                continue
+            with self._lock:
+                self.running += 1
+            try:
+                job.future.set_result(self.backend.process(job.translation_request, cancelled=job.cancelled))
+            except Exception as e:
+                job.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+    async def process(self, translation_request: dict) -> str:
+        """
+        Queue a translation request and wait for its answer.
+
+        Raises:
+            QueueFull: When the queue has no room for the request.
+            Cancelled: When the caller disconnects or the timeout passes first.
+        """
+        job = _Job(translation_request)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFull(f"{self._queue.maxsize} requests already queued") from None
+
+        result = asyncio.wrap_future(job.future)
+        waiters = {result}
+        caller_gone = CALLER_GONE.get()
+        if caller_gone is not None:
+            waiters.add(asyncio.ensure_future(caller_gone.wait()))
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED)
+            if result in done:
+                self.completed += 1
+                return result.result()
+            reason = "the caller disconnected" if caller_gone is not None and caller_gone.is_set() else f"it took more than {self.timeout}s"
+            self.cancelled += 1
+            logger.warning(f"Cancelled a {translation_request.get('task_string')} request: {reason}")
+            raise Cancelled(reason)
+        finally:
+            # also when the endpoint itself is cancelled
+            if not job.future.done():
+                job.cancelled.set()
+            for waiter in waiters:
+                waiter.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
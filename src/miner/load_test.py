@@ -0,0 +1,314 @@
+"""
+Load test of a miner by a simulated swarm of validators.
+
+Sends signed `TranslationSynapse` requests, built as the validator builds
+them, to a running miner. Requests arrive as a Poisson process at every
+rate of `--rates` in turn, each for `--duration` seconds. Every request is
+signed by one of `--validators` generated keys. The task mix and the sizes
+of the text and audio payloads are configurable.
+
+For every rate the test reports the throughput of successful answers, the
+latency percentiles and the errors by kind (timeout, busy, rate limited,
+refused signature...). The saturation point is the first rate the miner
+cannot keep up with.
+
+Without `--host`, the test starts a local miner backed by a stub model
+instead: it answers with outputs of realistic size after sleeping for the
+estimated inference time of every task, and it needs neither a model nor a
+chain.
+
+Usage:
+    python3 -m src.miner.load_test [--rates 1,2,4,8,16] [--duration 30] [--mix text2text=0.4,speech2text=0.2,text2speech=0.2,speech2speech=0.2]
+    python3 -m src.miner.load_test --host <ip> --port <port> --miner-key <ss58 address>
+"""
+
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import random
+import re
+import socket
+import statistics
+import time
+from collections import Counter
+from typing import Optional
+
+import aiohttp
+import torch
+import typer
+from communex.errors import NetworkTimeoutError  # type: ignore
+from communex.key import generate_keypair  # type: ignore
+from communex.module.client import ModuleClient  # type: ignore
+from substrateinterface import Keypair  # type: ignore
+
+from src.utils.audio_save_load import SAMPLE_RATE
+from src.utils.constants import LANGUAGES
+from src.utils.protocols import TranslationSynapse, synapse_params
+from src.utils.serialization import audio_encode
+from src.utils.utils import logger
+
+from .admission import DEFAULT_TASK_COSTS
+
+WORDS = "the a translation network miner validator speech voice language model answer question story river mountain city light night morning".split()
+
+
+class StubTranslation:
+    """
+    Stand-in of `Translation` taking `scale` seconds per unit of the default
+    task cost, and answering with outputs of realistic size: text of the
+    length of the input, or `output_seconds` of encoded audio.
+    """
+
+    def __init__(self, device: str = "cpu", scale: float = 0.05, output_seconds: float = 8.0):
+        self.scale = scale
+        self.audio = audio_encode(torch.zeros(1, int(output_seconds * SAMPLE_RATE)))
+
+    def process(self, translation_request: dict) -> str:
+        task = translation_request["task_string"]
+        time.sleep(self.scale * DEFAULT_TASK_COSTS.get(task, max(DEFAULT_TASK_COSTS.values())))
+        if task.endswith("speech"):
+            return self.audio
+        return translation_request["input"] if task.startswith("text") else " ".join(WORDS)
+
+
+def _serve_local(port: int, mnemonic: str, replicas: int, scale: float, output_seconds: float, max_wait: float):
+    import uvicorn
+    from communex.module.server import ModuleServer  # type: ignore
+    from keylimiter import TokenBucketLimiter
+
+    from .admission import AdmissionController, AdmissionMiddleware
+    from .miner import Miner
+    from .replicas import ReplicaPool
+
+    # the miner logs every answer
+    logger.logger.setLevel(logging.WARNING)
+    admission = AdmissionController(max_wait=max_wait, workers=replicas)
+    pool = ReplicaPool(
+        ["cpu"] * replicas,
+        factory=lambda device: StubTranslation(device, scale, output_seconds),
+        cpu_affinity=False,
+        on_processed=admission.observe,
+    )
+    miner = Miner(admission, engine=pool)
+    # no subnet whitelist, so no chain; the whole swarm comes from one IP
+    server = ModuleServer(miner, Keypair.create_from_mnemonic(mnemonic), limiter=TokenBucketLimiter(10**6, 10**6))
+    app = AdmissionMiddleware(server.get_fastapi_app(), admission)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, process, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError("The local miner failed to start")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("The local miner did not start listening")
+
+
+def _parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        task, _, weight = item.partition("=")
+        weights[task.strip()] = float(weight or 1)
+    return weights
+
+
+def build_payloads(mix: dict[str, float], text_words: list[int], audio_seconds: list[float], variants: int = 4, seed: int = 0) -> dict[str, list[dict]]:
+    """
+    Translation requests of every task of the mix, at every payload size.
+    Built once, before the test, so the load generator only signs and sends.
+    """
+    rng = random.Random(seed)
+    generator = torch.Generator().manual_seed(seed)
+    payloads = {}
+    for task in mix:
+        requests = []
+        for _ in range(variants):
+            if task.startswith("speech"):
+                seconds = rng.choice(audio_seconds)
+                data = audio_encode(0.1 * torch.randn(1, int(seconds * SAMPLE_RATE), generator=generator))
+            else:
+                data = " ".join(rng.choice(WORDS) for _ in range(rng.choice(text_words)))
+            requests.append({
+                "input": data,
+                "task_string": task,
+                "source_language": rng.choice(LANGUAGES),
+                "target_language": rng.choice(LANGUAGES),
+            })
+        payloads[task] = requests
+    return payloads
+
+
+def classify_error(error: BaseException) -> str:
+    if isinstance(error, (NetworkTimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    match = re.match(r"Unexpected status code: (\d+)", str(error))
+    if match:
+        return {"429": "rate_limited", "503": "busy", "401": "refused_signature"}.get(match.group(1), f"http_{match.group(1)}")
+    if isinstance(error, aiohttp.ClientError):
+        return "connection"
+    return type(error).__name__
+
+
+async def _send(host: str, port: int, key: Keypair, miner_key: str, translation_request: dict, timeout: float) -> tuple[float, Optional[str]]:
+    client = ModuleClient(host, port, key)
+    synapse = TranslationSynapse(translation_request=translation_request)
+    start = time.perf_counter()
+    try:
+        response = await client.call("forward", miner_key, synapse_params(synapse), timeout=timeout)
+        if TranslationSynapse(**json.loads(response)).miner_response is None:
+            return time.perf_counter() - start, "empty_response"
+    except Exception as e:
+        return time.perf_counter() - start, classify_error(e)
+    return time.perf_counter() - start, None
+
+
+async def run_level(host: str, port: int, miner_key: str, keys: list[Keypair], payloads: dict[str, list[dict]], mix: dict[str, float], rate: float, duration: float, timeout: float, seed: int) -> dict:
+    """
+    Send requests at `rate` per second for `duration` seconds, and wait for
+    all of them to be answered or to time out.
+    """
+    rng = random.Random(seed)
+    tasks, weights = list(mix), list(mix.values())
+    pending = []
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival - start < duration:
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        task = rng.choices(tasks, weights)[0]
+        request = dict(rng.choice(payloads[task]))
+        pending.append((task, asyncio.create_task(_send(host, port, rng.choice(keys), miner_key, request, timeout))))
+        next_arrival += rng.expovariate(rate)
+    sent_in = time.perf_counter() - start
+    results = [(task, await future) for task, future in pending]
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, (latency, error) in results if error is None)
+    errors = Counter(error for _, (_, error) in results if error is not None)
+    per_task = Counter(task for task, (_, error) in results if error is None)
+    percentile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else math.nan
+    return {
+        "offered_rps": rate,
+        "sent_rps": len(results) / sent_in,
+        "sent": len(results),
+        "ok": len(latencies),
+        "throughput_rps": len(latencies) / elapsed,
+        "error_rate": sum(errors.values()) / len(results) if results else 0.0,
+        "errors": dict(errors),
+        "ok_by_task": dict(per_task),
+        "latency_s": {
+            "p50": percentile(0.50),
+            "p90": percentile(0.90),
+            "p99": percentile(0.99),
+            "max": latencies[-1] if latencies else math.nan,
+            "mean": statistics.fmean(latencies) if latencies else math.nan,
+        },
+    }
+
+
+def saturation_point(levels: list[dict], max_error_rate: float, min_goodput: float) -> Optional[float]:
+    """
+    The first offered rate at which more than `max_error_rate` of the
+    requests fail, or the throughput falls below `min_goodput` of the rate
+    the requests were sent at (Poisson arrivals deviate from the offered rate).
+    """
+    for level in levels:
+        if level["error_rate"] > max_error_rate or level["throughput_rps"] < min_goodput * level["sent_rps"]:
+            return level["offered_rps"]
+    return None
+
+
+def _split(value: str, cast=float) -> list:
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main(
+    host: str = typer.Option(None, help="Host of the miner to test; a local miner with a stub model is started when not given"),
+    port: int = typer.Option(None, help="Port of the miner to test"),
+    miner_key: str = typer.Option(None, help="ss58 address of the miner to test"),
+    rates: str = typer.Option("1,2,4,8,16", help="Comma separated request rates to test, in requests per second"),
+    duration: float = typer.Option(30.0, help="Seconds every rate is sustained"),
+    mix: str = typer.Option("text2text=0.4,speech2text=0.2,text2speech=0.2,speech2speech=0.2", help="Task mix, as task=weight pairs"),
+    text_words: str = typer.Option("16,64,256", help="Comma separated lengths of the text inputs, in words"),
+    audio_seconds: str = typer.Option("2,8,20", help="Comma separated durations of the speech inputs, in seconds"),
+    validators: int = typer.Option(16, help="Number of validator keys the requests are signed with"),
+    timeout: float = typer.Option(60.0, help="Call timeout, as the validator's call_timeout"),
+    max_error_rate: float = typer.Option(0.01, help="Share of failed requests from which the miner counts as saturated"),
+    min_goodput: float = typer.Option(0.95, help="Share of the sent rate the throughput must reach"),
+    stop_at_saturation: bool = typer.Option(True, help="Skip the rates above the saturation point"),
+    replicas: int = typer.Option(1, help="Replicas of the local stub miner"),
+    stub_scale: float = typer.Option(0.05, help="Seconds per unit of task cost of the local stub model"),
+    max_wait: float = typer.Option(30.0, help="Admission --max-wait of the local stub miner"),
+    seed: int = typer.Option(0, help="Seed of the arrivals, the task draws and the payloads"),
+    output: str = typer.Option(None, help="Optional path to write the results as JSON"),
+):
+    weights = _parse_mix(mix)
+    payloads = build_payloads(weights, _split(text_words, int), _split(audio_seconds))
+    keys = [generate_keypair() for _ in range(validators)]
+
+    local = None
+    if host is None:
+        miner_keypair = generate_keypair()
+        host, port, miner_key = "127.0.0.1", _free_port(), miner_keypair.ss58_address
+        local = multiprocessing.get_context("spawn").Process(
+            target=_serve_local,
+            args=(port, miner_keypair.mnemonic, replicas, stub_scale, 8.0, max_wait),
+            daemon=True,
+        )
+        local.start()
+        _wait_for_port(port, local)
+    elif port is None or miner_key is None:
+        raise typer.BadParameter("--port and --miner-key are required with --host")
+
+    levels = []
+    try:
+        for index, rate in enumerate(_split(rates)):
+            level = asyncio.run(run_level(host, port, miner_key, keys, payloads, weights, rate, duration, timeout, seed + index))
+            levels.append(level)
+            errors = " ".join(f"{kind}={count}" for kind, count in sorted(level["errors"].items())) or "-"
+            print(
+                f"offered={rate:7.2f}rps sent={level['sent_rps']:7.2f}rps ok={level['throughput_rps']:7.2f}rps "
+                f"p50={level['latency_s']['p50']:6.2f}s p90={level['latency_s']['p90']:6.2f}s p99={level['latency_s']['p99']:6.2f}s "
+                f"errors={level['error_rate']:6.1%} {errors}"
+            )
+            if stop_at_saturation and saturation_point([level], max_error_rate, min_goodput) is not None:
+                break
+    finally:
+        if local is not None:
+            local.terminate()
+            local.join()
+
+    saturated_at = saturation_point(levels, max_error_rate, min_goodput)
+    sustained = [level["offered_rps"] for level in levels if saturated_at is None or level["offered_rps"] < saturated_at]
+    if saturated_at is None:
+        print(f"Not saturated up to {levels[-1]['offered_rps']:g} requests per second")
+    else:
+        print(f"Saturated at {saturated_at:g} requests per second, highest sustained rate: {max(sustained, default=0):g}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({
+                "target": f"{host}:{port}" if local is None else "local stub miner",
+                "mix": weights,
+                "validators": validators,
+                "duration_s": duration,
+                "saturated_at_rps": saturated_at,
+                "max_sustained_rps": max(sustained, default=None),
+                "levels": levels,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    typer.run(main)
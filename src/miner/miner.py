@@ -1,12 +1,17 @@
 from communex.module import Module, endpoint
+from fastapi import HTTPException
 from communex.key import generate_keypair
 from keylimiter import TokenBucketLimiter
 
 import importlib
+from typing import Optional
 
 from src.utils.protocols import *
 from src.utils.utils import logger
-from src.modules.translation.translation import Translation
+from src.utils.metrics import STAGE_SECONDS, request_labels, timed
+from .admission import AdmissionController
+from .executor import Cancelled, InferenceExecutor, QueueFull
+from .replicas import ReplicaPool, default_devices
 
 class Miner(Module):
     """
@@ -19,13 +24,33 @@ class Miner(Module):
         generate: Generates a response to a given prompt using a specified model.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        admission: Optional[AdmissionController] = None,
+        devices: Optional[list[str]] = None,
+        engine = None,
+        queue_size: int = 64,
+        request_timeout: Optional[float] = None,
+    ):
         super(Miner, self).__init__()
         
-        self.translation = Translation()
+        self.admission = admission
+        if engine is not None:
+            # the replicas run in a separate engine process
+            self.translation = engine
+            workers = len(devices) if devices else admission.workers if admission is not None else 1
+        else:
+            devices = devices or default_devices(1)
+            self.translation = ReplicaPool(
+                devices,
+                on_processed=admission.observe if admission is not None else None,
+            )
+            workers = len(devices)
+        # one inference thread per replica, the event loop only awaits them
+        self.executor = InferenceExecutor(self.translation, workers=workers, queue_size=queue_size, timeout=request_timeout)
     
     @endpoint
-    def forward(self, synapse: dict):
+    async def forward(self, synapse: dict):
         class_name = synapse['synapse_name']
         protocols = importlib.import_module('src.utils.protocols')
         synapse_class = getattr(protocols, class_name)
@@ -38,11 +63,17 @@ class Miner(Module):
             logger.error('Received invalid endpoint')
             return 'Invalid endpoint'
         
-        return endpoint(synapse_class(**synapse)).json()
+        translation_request = synapse.get('translation_request') or {}
+        labels = request_labels(translation_request)
+        with timed(STAGE_SECONDS, "validate", *labels):
+            synapse = synapse_class(**synapse)
+        response = await endpoint(synapse)
+        with timed(STAGE_SECONDS, "serialize", *labels):
+            return response.json()
         
 
     @endpoint
-    def forwardTranslationSynapse(self, synapse: TranslationSynapse):
+    async def forwardTranslationSynapse(self, synapse: TranslationSynapse):
         """
         Generates a response to a given prompt using a specified model.
 
@@ -53,7 +84,13 @@ class Miner(Module):
         Returns:
             None
         """
-        response = self.translation.process(translation_request=synapse.translation_request)
+        try:
+            response = await self.executor.process(synapse.translation_request)
+        except QueueFull as e:
+            raise HTTPException(status_code=503, detail=f"Miner busy: {e}")
+        except Cancelled as e:
+            # the caller is gone or about to give up, the status is for the logs
+            raise HTTPException(status_code=504, detail=f"Cancelled: {e}")
         synapse.miner_response = response
         logger.info(f"synapse.miner_response : {synapse.miner_response[:100]}")
         return synapse
@@ -0,0 +1,113 @@
+"""
+CPU throughput benchmark of the miner model replicas.
+
+Builds a `ReplicaPool` of 1, 2, 4... CPU replicas, each pinned to its own
+group of cores, keeps all of them busy with concurrent requests and reports
+the throughput of every pool size. By default the replicas run a synthetic
+stand-in of the translation model (a stack of linear layers of the size of
+the Seamless text decoder), so the benchmark needs no model download; pass
+`--model seamless` to benchmark the real model.
+
+Usage:
+    python3 -m src.miner.replica_benchmark [--replicas 1,2,4] [--requests 64]
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+import typer
+
+from .replicas import ReplicaPool
+
+SYNTHETIC_WEIGHTS = {}
+
+
+class SyntheticTranslation:
+    """
+    Stand-in of `Translation` running a fixed amount of CPU work per request.
+
+    Replicas share the weights, as the real replicas do on one device.
+    """
+
+    def __init__(self, device: str = "cpu", hidden_size: int = 1024, layers: int = 12, tokens: int = 32):
+        if hidden_size not in SYNTHETIC_WEIGHTS:
+            torch.manual_seed(0)
+            SYNTHETIC_WEIGHTS[hidden_size] = torch.nn.Sequential(
+                *[torch.nn.Linear(hidden_size, hidden_size) for _ in range(layers)]
+            ).eval()
+        self.model = SYNTHETIC_WEIGHTS[hidden_size]
+        self.hidden_size = hidden_size
+        self.tokens = tokens
+
+    def process(self, translation_request: dict) -> str:
+        hidden = torch.randn(1, self.hidden_size)
+        with torch.no_grad():
+            # one decoder pass per generated token, as autoregressive generation does
+            for _ in range(self.tokens):
+                hidden = torch.tanh(self.model(hidden))
+        return str(float(hidden.sum()))
+
+
+def _run_level(pool: ReplicaPool, requests: int) -> float:
+    translation_request = {
+        "input": "Hello, how are you doing today?",
+        "task_string": "text2text",
+        "source_language": "English",
+        "target_language": "French",
+    }
+    # twice as many clients as replicas, so no replica waits for work
+    with ThreadPoolExecutor(max_workers=2 * len(pool)) as clients:
+        pool.process(translation_request)  # warmup
+        start = time.perf_counter()
+        list(clients.map(lambda _: pool.process(dict(translation_request)), range(requests)))
+        return requests / (time.perf_counter() - start)
+
+
+def main(
+    replicas: str = typer.Option(None, help="Comma separated numbers of replicas, defaults to powers of two up to the number of CPUs"),
+    requests: int = typer.Option(64, help="Requests per pool size"),
+    model: str = typer.Option("synthetic", help="`synthetic` or `seamless`"),
+    output: str = typer.Option(None, help="Optional path to write the results as JSON"),
+):
+    cpus = len(os.sched_getaffinity(0))
+    if replicas:
+        levels = [int(value) for value in replicas.split(",")]
+    else:
+        levels = [2 ** power for power in range(cpus.bit_length()) if 2 ** power <= cpus]
+
+    if model == "seamless":
+        factory = None
+    elif model == "synthetic":
+        factory = SyntheticTranslation
+    else:
+        raise typer.BadParameter(f"Unknown model {model}")
+
+    results = []
+    for level in levels:
+        pool = ReplicaPool(["cpu"] * level, factory=factory)
+        try:
+            throughput = _run_level(pool, requests)
+        finally:
+            pool.shutdown()
+        baseline = results[0]["throughput_rps"] if results else throughput
+        results.append({
+            "replicas": level,
+            "threads_per_replica": torch.get_num_threads(),
+            "throughput_rps": throughput,
+            "speedup": throughput / baseline,
+        })
+        print(
+            f"replicas={level:3d} threads/replica={torch.get_num_threads():3d} "
+            f"rps={throughput:8.2f} speedup={throughput / baseline:5.2f}x"
+        )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"cpus": cpus, "model": model, "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,218 @@
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import torch
+
+from src.utils.metrics import IN_FLIGHT, REPLICA_OUTSTANDING, REQUEST_SECONDS, REQUESTS, request_labels
+from src.utils.utils import logger
+
+from .executor import Cancelled
+
+# the cancellation event of the request running on the current replica thread
+_running = threading.local()
+
+
+def _parse_cpu_list(cpu_list: str) -> list[int]:
+    cpus = []
+    for part in cpu_list.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def cpu_partitions(count: int) -> list[list[int]]:
+    """
+    Split the CPUs this process may run on into `count` groups.
+
+    NUMA nodes are used as groups when there are enough of them, so the
+    threads of a replica do not share caches with the others. Otherwise the
+    CPUs are split into contiguous groups of the same size.
+    """
+    available = sorted(os.sched_getaffinity(0))
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        with open(path) as f:
+            cpus = [cpu for cpu in _parse_cpu_list(f.read()) if cpu in available]
+        if cpus:
+            nodes.append(cpus)
+    if len(nodes) >= count:
+        return nodes[:count]
+
+    size = max(1, len(available) // count)
+    return [available[index * size:(index + 1) * size] or available for index in range(count)]
+
+
+def default_devices(replicas: int) -> list[str]:
+    """
+    One device per replica: the GPUs in turn, or the CPU.
+    """
+    if torch.cuda.is_available():
+        return [f"cuda:{index % torch.cuda.device_count()}" for index in range(replicas)]
+    return ["cpu"] * replicas
+
+
+def _check_cancelled(module, args):
+    cancelled = getattr(_running, "cancelled", None)
+    if cancelled is not None and cancelled.is_set():
+        raise Cancelled("cancelled during inference")
+
+
+def _make_cancellable(translation):
+    """
+    Check for cancellation before every forward of the top-level submodules
+    of the model (encoders, every decoding step, vocoder), so a cancelled
+    request stops at the next model step.
+    """
+    model = getattr(translation, "model", None)
+    if not isinstance(model, torch.nn.Module) or getattr(model, "_linguanet_cancellable", False):
+        # replicas on the same device share the model
+        return
+    for child in model.children():
+        child.register_forward_pre_hook(_check_cancelled)
+    model._linguanet_cancellable = True
+
+
+class _Replica:
+    def __init__(self, index: int, device: str, cpus: Optional[list[int]]):
+        self.index = index
+        self.device = device
+        self.cpus = cpus
+        self.outstanding = 0
+        self.processed = 0
+        self.translation = None
+        # a single worker thread per replica: the model state is not shared
+        # between requests, and CPU replicas keep their threads on their CPUs
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"replica-{index}", initializer=self._pin)
+
+    def _pin(self):
+        if self.cpus:
+            # only pins the worker thread, and the threads torch starts from it
+            os.sched_setaffinity(0, self.cpus)
+
+
+class ReplicaPool:
+    """
+    Several translation model replicas behind a least-loaded dispatcher.
+
+    Every replica is bound to a device (a GPU, or a group of CPUs such as a
+    NUMA node) and processes one request at a time on its own worker thread.
+    A request goes to the replica with the fewest requests queued or
+    running, so the replicas stay evenly busy. Replicas on the same device
+    share one copy of the weights: CPU replicas split the cores between
+    them, not the memory.
+
+    Args:
+        devices: The device of every replica, e.g. `["cuda:0", "cuda:1"]` or `["cpu", "cpu"]`.
+        factory: Callable building a translation object for a device. The
+            object must have a `process(translation_request)` method.
+        cpu_affinity: Pin the CPU replicas to separate groups of CPUs.
+        on_processed: Called with the task string and the inference time in
+            seconds of every processed request.
+    """
+
+    def __init__(
+        self,
+        devices: list[str],
+        factory: Optional[Callable] = None,
+        cpu_affinity: bool = True,
+        on_processed: Optional[Callable[[str, float], None]] = None,
+    ):
+        if factory is None:
+            from src.modules.translation.translation import Translation
+            factory = Translation
+
+        cpu_replicas = [index for index, device in enumerate(devices) if device.startswith("cpu")]
+        partitions = cpu_partitions(len(cpu_replicas)) if cpu_affinity and len(cpu_replicas) > 1 else []
+        cpus = dict(zip(cpu_replicas, partitions))
+        if partitions:
+            # the intra-op thread count is global, the groups all have the same size
+            torch.set_num_threads(len(partitions[0]))
+
+        self.on_processed = on_processed
+        self.replicas = [_Replica(index, device, cpus.get(index)) for index, device in enumerate(devices)]
+        self._lock = threading.Lock()
+        REPLICA_OUTSTANDING.set_function(
+            lambda: {(replica.index, replica.device): replica.outstanding for replica in self.replicas}
+        )
+        IN_FLIGHT.set_function(lambda: {(): sum(replica.outstanding for replica in self.replicas)})
+        for replica in self.replicas:
+            replica.translation = replica.executor.submit(factory, replica.device).result()
+            _make_cancellable(replica.translation)
+            logger.info(f"Loaded replica {replica.index} on {replica.device}" + (f" (CPUs {replica.cpus[0]}-{replica.cpus[-1]})" if replica.cpus else ""))
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    def _acquire(self) -> _Replica:
+        with self._lock:
+            replica = min(self.replicas, key=lambda replica: (replica.outstanding, replica.processed))
+            replica.outstanding += 1
+        return replica
+
+    def _release(self, replica: _Replica):
+        with self._lock:
+            replica.outstanding -= 1
+            replica.processed += 1
+
+    def process(self, translation_request: dict, cancelled: Optional[threading.Event] = None):
+        """
+        Process a translation request on the least loaded replica, blocking
+        until it is done. Same interface as `Translation.process`.
+
+        Raises `Cancelled` when `cancelled` is set before the request is done.
+        """
+        output, _ = self.process_timed(translation_request, cancelled)
+        return output
+
+    def process_timed(self, translation_request: dict, cancelled: Optional[threading.Event] = None) -> tuple:
+        """
+        Like `process`, but also returns the inference time in seconds,
+        without the time spent waiting for the replica.
+        """
+        labels = request_labels(translation_request)
+        replica = self._acquire()
+        start = time.perf_counter()
+        try:
+            output, elapsed = replica.executor.submit(self._process, replica, translation_request, cancelled).result()
+        except Cancelled:
+            REQUESTS.inc(labels[0], "cancelled")
+            raise
+        except Exception:
+            REQUESTS.inc(labels[0], "error")
+            raise
+        finally:
+            self._release(replica)
+        REQUESTS.inc(labels[0], "ok")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, *labels)
+        return output, elapsed
+
+    def _process(self, replica: _Replica, translation_request: dict, cancelled: Optional[threading.Event]) -> tuple:
+        if cancelled is not None and cancelled.is_set():
+            # cancelled while waiting for the replica
+            raise Cancelled("cancelled before inference")
+        start = time.perf_counter()
+        _running.cancelled = cancelled
+        try:
+            output = replica.translation.process(translation_request)
+        finally:
+            _running.cancelled = None
+        elapsed = time.perf_counter() - start
+        if self.on_processed is not None:
+            self.on_processed(translation_request["task_string"], elapsed)
+        return output, elapsed
+
+    def stats(self) -> list[dict]:
+        return [
+            {"replica": replica.index, "device": replica.device, "outstanding": replica.outstanding, "processed": replica.processed}
+            for replica in self.replicas
+        ]
+
+    def shutdown(self):
+        for replica in self.replicas:
+            replica.executor.shutdown(wait=False)
@@ -0,0 +1,84 @@
+import time
+from contextlib import contextmanager
+
+import torch
+
+from src.utils.constants import MODELS, ASSISTANT_MODELS
+from src.utils.model_load import load_assistant
+from src.utils.utils import logger
+
+
+def get_assistant(module: str, device = torch.device("cuda" if torch.cuda.is_available() else "cpu")):
+    """
+    The draft model of an LLM module for assisted generation, or None when
+    `ASSISTANT_MODELS` sets none for it.
+
+    The draft model has to share the tokenizer of the module model. Greedy
+    decoding gives the same tokens as without it; sampling goes through
+    speculative sampling, which keeps the distribution of the module model.
+    """
+    model_id = ASSISTANT_MODELS.get(module)
+    if model_id is None:
+        return None
+    key = f'assistant:{model_id}'
+    if key not in MODELS:
+        MODELS[key] = load_assistant(model_id, device)
+    return MODELS[key]
+
+
+def _count_calls(model, counter: dict, name: str):
+    def hook(module, args):
+        counter[name] += 1
+    return model.register_forward_pre_hook(hook)
+
+
+# totals of the generations of every LLM module, see `track`
+STATS: dict[str, dict] = {}
+
+
+@contextmanager
+def track(module: str, model, assistant_model = None):
+    """
+    Measure one generation of an LLM module, assisted or not.
+
+    Every forward of the model verifies one round of draft tokens and adds
+    one token of its own; every forward of the draft model proposes one
+    token. Set `stats["new_tokens"]` once generated, and the tokens
+    generated past the end of the answer (`wasted_tokens`) and whether the
+    token budget cut the answer short (`truncated`) when known.
+
+    Yields:
+        dict: new_tokens, wasted_tokens, truncated, seconds, tokens_s,
+        model_calls, draft_tokens, accepted_tokens and acceptance_rate,
+        filled on exit and added to the totals of the module in `STATS`.
+    """
+    stats = {"new_tokens": 0, "wasted_tokens": 0, "truncated": 0, "model_calls": 0, "draft_tokens": 0}
+    hooks = [_count_calls(model, stats, "model_calls")]
+    if assistant_model is not None:
+        hooks.append(_count_calls(assistant_model, stats, "draft_tokens"))
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats["seconds"] = time.perf_counter() - start
+        for hook in hooks:
+            hook.remove()
+    # every round ends with one token of the model itself
+    stats["accepted_tokens"] = max(0, stats["new_tokens"] - stats["model_calls"]) if assistant_model is not None else 0
+
+    stats["truncated"] = int(stats["truncated"])
+    totals = STATS.setdefault(module, {"calls": 0, "new_tokens": 0, "wasted_tokens": 0, "truncated": 0, "seconds": 0.0, "model_calls": 0, "draft_tokens": 0, "accepted_tokens": 0})
+    totals["calls"] += 1
+    for name in ("new_tokens", "wasted_tokens", "truncated", "seconds", "model_calls", "draft_tokens", "accepted_tokens"):
+        totals[name] += stats[name]
+    for values in (stats, totals):
+        values["tokens_s"] = values["new_tokens"] / values["seconds"] if values["seconds"] else 0.0
+        values["acceptance_rate"] = values["accepted_tokens"] / values["draft_tokens"] if values["draft_tokens"] else None
+
+    if stats["truncated"]:
+        logger.warning(f"{module}: the answer was cut at the budget of {stats['new_tokens']} tokens")
+    if assistant_model is not None:
+        logger.info(
+            f"Assisted generation: {stats['new_tokens']} tokens in {stats['model_calls']} rounds, "
+            f"acceptance {stats['acceptance_rate'] or 0:.0%}, {stats['tokens_s']:.1f} tokens/s"
+        )
@@ -0,0 +1,184 @@
+import copy
+import hashlib
+import json
+import random
+from abc import ABC, abstractmethod
+from importlib import import_module
+from typing import List, Dict, Any, Optional
+
+import torch
+from transformers import DynamicCache
+
+from src.utils.constants import MODELS, LLMS, PROMPTS
+from src.utils.model_load import load_llama_cpu
+from src.modules.llms.assisted import track
+from src.modules.llms.stopping import STOP_SEQUENCE, end_token_ids, split_answer, stop_kwargs
+
+
+def chat_prompt(messages: List[Dict[str, Any]]) -> str:
+    """
+    The ChatML prompt of the validator LLM, ready for the assistant answer.
+    """
+    text = [f"<|im_start|>{message['role']}\n{message['content']}<|im_end|>" for message in messages]
+    text = "\n".join(text)
+    return f'{text.strip()}<|im_start|>assistant'
+
+
+class LLMBackend(ABC):
+    """
+    Engine generating the validator challenges: the stories and their
+    reference translations.
+    """
+
+    name: str
+
+    @abstractmethod
+    def generate(self, messages: List[Dict[str, Any]], max_new_tokens: Optional[int] = None) -> str:
+        """
+        Answer a conversation.
+
+        Args:
+            messages (list): The conversation, as `{"role", "content"}` dicts.
+            max_new_tokens (int): The token budget of the answer, the backend default if None.
+
+        Returns:
+            The answer of the assistant.
+        """
+
+
+class HFBackend(LLMBackend):
+    """
+    One of the `LLMS` modules, generating with HF `generate` (4-bit on CUDA).
+    """
+
+    name = "hf"
+
+    def __init__(self, module: str = LLMS[0], device = torch.device("cuda" if torch.cuda.is_available() else "cpu")):
+        self.module = module
+        self.device = device
+
+    def generate(self, messages, max_new_tokens = None):
+        if max_new_tokens is None:
+            return import_module(self.module).process(messages, self.device)
+        return import_module(self.module).process(messages, self.device, max_new_tokens=max_new_tokens)
+
+
+class CPUBackend(LLMBackend):
+    """
+    The validator LLM on CPU, with int8 weights and a KV cache of the prompt
+    prefixes.
+
+    The static start of every prompt template (everything before its first
+    placeholder) is run through the model once; the generations starting
+    with it continue from a copy of its KV cache, so only the rest of the
+    prompt is computed for every challenge.
+    """
+
+    name = "cpu"
+
+    def __init__(self, model=None, tokenizer=None, max_new_tokens: int = 400, quantize: bool = True):
+        if model is None:
+            if 'llama:cpu' not in MODELS:
+                MODELS['llama:cpu'] = load_llama_cpu(quantize)
+            model, tokenizer = MODELS['llama:cpu']
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        self.prefix_hits = 0
+        self._prefixes: dict[tuple[int, ...], DynamicCache] = {}
+        for template in PROMPTS.values():
+            self.add_prefix(chat_prompt([{"role": "system", "content": template.split("{")[0]}]).split(STOP_SEQUENCE)[0])
+
+    def add_prefix(self, text: str) -> None:
+        """
+        Compute the KV cache of a prompt prefix once, for every generation starting with it.
+        """
+        ids = self.tokenizer.encode(text, return_tensors="pt")
+        # the last token may merge with the text that follows it
+        ids = ids[:, :-1]
+        if ids.shape[1] < 2:
+            return
+        cache = DynamicCache()
+        with torch.inference_mode():
+            self.model(ids, past_key_values=cache, use_cache=True)
+        self._prefixes[tuple(ids[0].tolist())] = cache
+
+    def _prefix_cache(self, ids: list[int]) -> DynamicCache | None:
+        best = None
+        for prefix, cache in self._prefixes.items():
+            if len(prefix) < len(ids) and tuple(ids[:len(prefix)]) == prefix and (best is None or len(prefix) > len(best[0])):
+                best = (prefix, cache)
+        if best is None:
+            return None
+        self.prefix_hits += 1
+        # generate extends the cache it is given
+        return copy.deepcopy(best[1])
+
+    def generate(self, messages, max_new_tokens = None):
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        input_ids = self.tokenizer.encode(chat_prompt(messages), return_tensors="pt")
+        cache = self._prefix_cache(input_ids[0].tolist())
+        with torch.inference_mode(), track(f"{__name__}:{self.name}", self.model) as stats:
+            output_ids = self.model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                past_key_values=cache,
+                **stop_kwargs(self.model, self.tokenizer),
+            )
+            new_ids = output_ids[0, input_ids.shape[1]:].tolist()
+            stats["new_tokens"] = len(new_ids)
+            # only the new tokens, up to the end of the assistant turn
+            output_answer, stats["wasted_tokens"], stats["truncated"] = split_answer(
+                self.tokenizer, new_ids, end_token_ids(self.model, self.tokenizer), max_new_tokens
+            )
+        return output_answer
+
+
+STUB_WORDS = (
+    "the river remembered every traveler who crossed it and at dawn a small lantern "
+    "drifted toward the city where nobody had spoken for a hundred years until a child "
+    "asked the old clock why time was afraid of the dark"
+).split()
+
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic answers without a model, for tests and benchmarks.
+
+    A story is a sequence of `words` words drawn with the hash of the
+    conversation as seed; a translation is its input, unchanged.
+    """
+
+    name = "stub"
+
+    def __init__(self, words: int = 120, seed: int = 0):
+        self.words = words
+        self.seed = seed
+
+    def generate(self, messages, max_new_tokens = None):
+        if messages[-1]["role"] == "user":
+            return messages[-1]["content"]
+        digest = hashlib.sha256(json.dumps([self.seed, messages], sort_keys=True).encode()).hexdigest()
+        rng = random.Random(digest)
+        return " ".join(rng.choice(STUB_WORDS) for _ in range(self.words)).capitalize() + "."
+
+
+BACKENDS = {backend.name: backend for backend in (HFBackend, CPUBackend, StubBackend)}
+
+
+def load_backends(name: str, device = torch.device("cuda" if torch.cuda.is_available() else "cpu")) -> list[LLMBackend]:
+    """
+    One backend per reference answer of a challenge, as many as `LLMS`.
+
+    Args:
+        name (str): "hf" for the `LLMS` modules, "cpu" or "stub".
+    """
+    if name == "hf":
+        return [HFBackend(module, device) for module in LLMS]
+    if name == "cpu":
+        # one model, shared by every backend
+        return [CPUBackend() for _ in LLMS]
+    if name == "stub":
+        return [StubBackend(seed=index) for index, _ in enumerate(LLMS)]
+    raise ValueError(f"Unknown LLM backend {name}, expected one of {', '.join(BACKENDS)}")
@@ -1,14 +1,16 @@
 import torch
 
-from src.utils.constants import MODELS 
+from src.utils.constants import MODELS, TOKEN_BUDGETS
 from src.utils.model_load import load_flan_t5_large
+from src.modules.llms.assisted import track
 
-def process(messages, device = torch.device("cuda" if torch.cuda.is_available() else "cpu")):
+def process(messages, device = torch.device("cuda" if torch.cuda.is_available() else "cpu"), max_new_tokens: int = TOKEN_BUDGETS["DEFAULT"]):
     """
     Process a list of messages.
 
     Args:
         messages (list): A list of message objects to process.
+        max_new_tokens (int): The most tokens to generate.
 
     Returns:
         The processed result.
@@ -19,9 +21,13 @@ def process(messages, device = torch.device("cuda" if torch.cuda.is_available()
     model, tokenizer = MODELS['flan_t5_large']
 
     input_text = '\n'.join([message['content'] for message in messages])
-    input_ids = tokenizer(input_text, return_tensors="pt").input_ids.to("cuda")
+    input_ids = tokenizer(input_text, return_tensors="pt").input_ids.to(device)
 
-    outputs = model.generate(input_ids, max_length=1000)
+    with track(__name__, model) as stats:
+        outputs = model.generate(input_ids, max_new_tokens=max_new_tokens)
+        # the decoder starts with the pad token and ends at the end of sequence token
+        stats["new_tokens"] = outputs.shape[1] - 1
+        stats["truncated"] = int(outputs[0, -1] != model.generation_config.eos_token_id)
     return tokenizer.decode(outputs[0], skip_special_tokens=True)  # The output translation
 
 
@@ -1,14 +1,17 @@
-from src.utils.constants import MODELS 
+from src.utils.constants import MODELS, TOKEN_BUDGETS
 from typing import List, Dict, Any
 import torch
 from src.utils.model_load import load_llama
+from src.modules.llms.assisted import get_assistant, track
+from src.modules.llms.stopping import end_token_ids, split_answer, stop_kwargs
 
-def process(messages: List[Dict[str, Any]], device = torch.device("cuda" if torch.cuda.is_available() else "cpu")):
+def process(messages: List[Dict[str, Any]], device = torch.device("cuda" if torch.cuda.is_available() else "cpu"), max_new_tokens: int = TOKEN_BUDGETS["DEFAULT"]):
     """
     Process a list of messages.
 
     Args:
         messages (list): A list of message objects to process.
+        max_new_tokens (int): The most tokens to generate, prompt excluded.
 
     Returns:
         The processed result.
@@ -16,6 +19,8 @@ def process(messages: List[Dict[str, Any]], device = torch.device("cuda" if torc
     if 'llama' not in MODELS:
         MODELS['llama'] = load_llama(device)
     model, tokenizer = MODELS['llama']
+    # a draft model proposes the tokens the model verifies, if one is set
+    assistant_model = get_assistant(__name__, device)
 
     def preprocess(messages):
         text = [f"<|im_start|>{message['role']}\n{message['content']}<|im_end|>" for message in messages]
@@ -27,13 +32,21 @@ def process(messages: List[Dict[str, Any]], device = torch.device("cuda" if torc
     # Prepare the input question
     input_ids = tokenizer.encode(messages, return_tensors="pt").to(device)
 
-    # Generate answer
-    with torch.no_grad():
-        output_ids = model.generate(input_ids, max_length=400, num_return_sequences = 1).to(device)
+    # Generate answer, up to the end of the assistant turn
+    with torch.no_grad(), track(__name__, model, assistant_model) as stats:
+        output_ids = model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=max_new_tokens,
+            num_return_sequences = 1,
+            assistant_model=assistant_model,
+            **stop_kwargs(model, tokenizer),
+        ).to(device)
+        new_ids = output_ids[0, input_ids.shape[1]:].tolist()
+        stats["new_tokens"] = len(new_ids)
 
-    # Decode the generated answer
-    output_answer = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-    output_answer = output_answer.split("<|im_start|>assistant")[1].strip()
+        # Decode the generated answer, from the new tokens only
+        output_answer, stats["wasted_tokens"], stats["truncated"] = split_answer(tokenizer, new_ids, end_token_ids(model, tokenizer), max_new_tokens)
 
     return output_answer
 
@@ -2,15 +2,17 @@ from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 import torch
 from typing import List, Dict, Any
 
-from src.utils.constants import MODELS 
+from src.utils.constants import MODELS, TOKEN_BUDGETS
 from src.utils.model_load import load_meta_llama
+from src.modules.llms.assisted import get_assistant, track
 
-def process(messages: List[Dict[str, Any]], device = torch.device("cuda" if torch.cuda.is_available() else "cpu")):
+def process(messages: List[Dict[str, Any]], device = torch.device("cuda" if torch.cuda.is_available() else "cpu"), max_new_tokens: int = TOKEN_BUDGETS["DEFAULT"]):
     """
     Process a list of messages.
 
     Args:
         messages (list): A list of message objects to process.
+        max_new_tokens (int): The most tokens to generate, prompt excluded.
 
     Returns:
         The processed result.
@@ -18,15 +20,23 @@ def process(messages: List[Dict[str, Any]], device = torch.device("cuda" if torc
     if 'meta-llama' not in MODELS:
         MODELS['meta-llama'] = load_meta_llama(device)
     model, tokenizer = MODELS['meta-llama']
-
-    get_pipeline = pipeline(
-        "text-generation",
-        model=model,
-        tokenizer=tokenizer,
-    )
-
-    response = get_pipeline(messages, max_length = 1000)
-    return response[0]['generated_text'][-1]['content']
+    # built once, next to the model it wraps
+    if 'meta-llama:pipeline' not in MODELS:
+        MODELS['meta-llama:pipeline'] = pipeline(
+            "text-generation",
+            model=model,
+            tokenizer=tokenizer,
+        )
+    get_pipeline = MODELS['meta-llama:pipeline']
+    # a draft model proposes the tokens the model verifies, if one is set
+    assistant_model = get_assistant(__name__, device)
+
+    with track(__name__, model, assistant_model) as stats:
+        response = get_pipeline(messages, max_new_tokens = max_new_tokens, assistant_model=assistant_model)
+        output_answer = response[0]['generated_text'][-1]['content']
+        stats["new_tokens"] = len(tokenizer.encode(output_answer, add_special_tokens=False))
+        stats["truncated"] = int(stats["new_tokens"] >= max_new_tokens)
+    return output_answer
 
 if __name__ == '__main__':
     text = """LinguaNet is an innovative translation module designed to enhance communication across diverse languages. With the ability to translate numerous languages, LinguaNet supports both audio and text inputs and outputs, making it a versatile tool for global interactions.
@@ -0,0 +1,55 @@
+from typing import Optional
+
+# end of an assistant turn in the ChatML prompts of the validator LLM
+STOP_SEQUENCE = "<|im_end|>"
+
+
+def end_token_ids(model, tokenizer, stop: str = STOP_SEQUENCE) -> list[int]:
+    """
+    The tokens ending an answer: the end of sequence tokens of the model,
+    plus `stop` when the tokenizer has it as a single token.
+    """
+    eos = model.generation_config.eos_token_id
+    ids = [] if eos is None else [eos] if isinstance(eos, int) else list(eos)
+    stop_ids = tokenizer.encode(stop, add_special_tokens=False)
+    if len(stop_ids) == 1 and stop_ids[0] not in ids:
+        ids.append(stop_ids[0])
+    return ids
+
+
+def stop_kwargs(model, tokenizer, stop: str = STOP_SEQUENCE) -> dict:
+    """
+    `generate` arguments ending the generation at `stop` or at the end of
+    sequence: as an end token when `stop` is one token, as a stop string
+    otherwise.
+    """
+    if len(tokenizer.encode(stop, add_special_tokens=False)) == 1:
+        return {"eos_token_id": end_token_ids(model, tokenizer, stop)}
+    return {"stop_strings": [stop], "tokenizer": tokenizer}
+
+
+def split_answer(tokenizer, new_ids: list[int], end_ids: list[int], max_new_tokens: Optional[int] = None, stop: str = STOP_SEQUENCE) -> tuple[str, int, bool]:
+    """
+    Cut the new tokens of a generation at the end of the answer.
+
+    Args:
+        new_ids (list): The generated tokens, without the prompt.
+        end_ids (list): The tokens ending an answer (see `end_token_ids`).
+        max_new_tokens (int): The token budget of the generation.
+
+    Returns:
+        tuple: (answer, wasted, truncated): the decoded answer, the number of
+        tokens generated past its end and whether the budget cut it short.
+    """
+    end = next((index for index, token in enumerate(new_ids) if token in end_ids), None)
+    if end is None:
+        # a stop sequence of several tokens, matched on the text
+        text = tokenizer.decode(new_ids, skip_special_tokens=True)
+        if stop in text:
+            end = next(index for index in range(len(new_ids)) if stop in tokenizer.decode(new_ids[:index + 1], skip_special_tokens=True))
+    if end is None:
+        answer = tokenizer.decode(new_ids, skip_special_tokens=True)
+        return answer.strip(), 0, max_new_tokens is not None and len(new_ids) >= max_new_tokens
+
+    answer = tokenizer.decode(new_ids[:end + 1], skip_special_tokens=True).split(stop)[0]
+    return answer.strip(), len(new_ids) - end - 1, False
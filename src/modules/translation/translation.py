@@ -1,3 +1,6 @@
+import threading
+import time
+
 import torch
 import numpy as np
 
@@ -11,11 +14,37 @@ from pydub import AudioSegment
 from .data_models import TARGET_LANGUAGES, TASK_STRINGS
 
 from src.utils.serialization import audio_encode, audio_decode
-from src.utils.audio_save_load import _wav_to_tensor, _tensor_to_wav
+from src.utils.audio_save_load import _wav_to_tensor, SAMPLE_RATE
 
 from src.utils.constants import MODELS
+from src.utils.metrics import STAGE_SECONDS, request_labels, timed
 from src.utils.model_load import load_seamless
 
+# seconds spent in the vocoder by the current thread, see `_instrument_vocoder`
+_VOCODER_TIME = threading.local()
+
+def _instrument_vocoder(model):
+    """
+    Times the vocoder of a Seamless model, which runs inside `generate`.
+    Hooks are installed once per model, replicas sharing weights share them.
+    """
+    vocoder = getattr(model, 'vocoder', None)
+    if vocoder is None or getattr(vocoder, '_linguanet_timed', False):
+        return
+
+    def start(module, inputs):
+        _VOCODER_TIME.start = time.perf_counter()
+
+    def stop(module, inputs, output):
+        _VOCODER_TIME.total = getattr(_VOCODER_TIME, 'total', 0.0) + time.perf_counter() - _VOCODER_TIME.start
+
+    vocoder.register_forward_pre_hook(start)
+    vocoder.register_forward_hook(stop)
+    vocoder._linguanet_timed = True
+
+def _vocoder_seconds() -> float:
+    return getattr(_VOCODER_TIME, 'total', 0.0)
+
 class Translation:
     def __init__(self, device = torch.device("cuda" if torch.cuda.is_available() else "cpu")):
         """
@@ -36,11 +65,14 @@ class Translation:
             - source_language (None): The source language for translation.
             - target_language (None): The target language for translation.
         """
-        self.device = device
+        self.device = torch.device(device)
 
-        if 'seamless' not in MODELS:
-            MODELS['seamless'] = load_seamless()
-        self.model, self.processor = MODELS['seamless']
+        # translations on the same device share one copy of the weights
+        model_key = f'seamless:{self.device}'
+        if model_key not in MODELS:
+            MODELS[model_key] = load_seamless(self.device)
+        self.model, self.processor = MODELS[model_key]
+        _instrument_vocoder(self.model)
 
         self.target_languages: Dict[str, str] = TARGET_LANGUAGES
         self.task_strings: Dict[str, str] = TASK_STRINGS
@@ -82,9 +114,8 @@ class Translation:
         if self.task_string.startswith("speech"):
             logger.info("startswith(speech)")
             try:
-                self.data_input = audio_decode(self.data_input)
-                file_name = "./src/modules/translation/audio_request.wav"
-                _tensor_to_wav(self.data_input, file_name)
+                with timed(STAGE_SECONDS, "decode", *self._stage_labels()):
+                    self.data_input = audio_decode(self.data_input)
             except Exception as e:
                 logger.error(f"Error preprocessing input: {e}")
                 raise ValueError(f"Error preprocessing input: {e}") from e
@@ -97,15 +128,22 @@ class Translation:
                 src_lang=self.target_languages[self.source_language],
                 tgt_lang=self.target_languages[self.target_language]
             )
-        logger.info(f"output before audio processing:{output[:100]}")
+        logger.debug(f"output before audio processing:{output[:100]}")
                 
         if self.task_string.endswith("speech"):
-            file_name = "./src/modules/translation/audio_output.wav"
-            _tensor_to_wav(output, file_name)
-            output = audio_encode(output)
+            with timed(STAGE_SECONDS, "encode", *self._stage_labels()):
+                output = audio_encode(output)
         
         return output
     
+    def _stage_labels(self) -> tuple:
+        # the labels of `STAGE_SECONDS` besides the stage
+        return request_labels({
+            "task_string": self.task_string,
+            "source_language": self.source_language,
+            "target_language": self.target_language,
+        })
+
     def _process_text_inputs(self, input_data: str, src_lang: str) -> Dict[str, torch.Tensor]:
         """
         Processes text inputs by utilizing the processor to convert input data into torch tensors.
@@ -125,16 +163,14 @@ class Translation:
         Processes the audio input data and returns a dictionary of tensors.
 
         Args:
-            input_data (str): The path to the audio file.
+            input_data (torch.Tensor): The audio waveform, already resampled to 16 kHz
+                by the validator or the API gateway.
             src_lang (str): The source language of the audio.
 
         Returns:
             Dict[str, torch.Tensor]: A dictionary containing the processed tensors.
         """
-        # waveform, sample_rate = torchaudio.load(input_data)
-        # if sample_rate != 16000:
-        #     waveform = torchaudio.functional.resample(waveform, sample_rate, 16000)
-        return self.processor(audios=input_data.to('cpu').squeeze(), src_lang=src_lang, sampling_rate=16000, return_tensors="pt")
+        return self.processor(audios=input_data.to('cpu').squeeze(), src_lang=src_lang, sampling_rate=SAMPLE_RATE, return_tensors="pt")
 
     def _generate_audio(self, input_data: Dict[str, torch.Tensor], tgt_lang: str) -> torch.Tensor:
         """
@@ -188,17 +224,25 @@ class Translation:
             src_lang = kwargs['src_lang']
             tgt_lang = kwargs['tgt_lang']
                         
-            if task_str.startswith('s2'):
-                input_data = self._process_audio_input(input_data, src_lang)
-            else:
-                input_data = self._process_text_inputs(input_data, src_lang)
+            with timed(STAGE_SECONDS, "features", *self._stage_labels()):
+                if task_str.startswith('s2'):
+                    input_data = self._process_audio_input(input_data, src_lang)
+                else:
+                    input_data = self._process_text_inputs(input_data, src_lang)
                 
             output = None
             try:
+                vocoder_start = _vocoder_seconds()
+                start = time.perf_counter()
                 if self.task_string.endswith("speech"):
                     output = self._generate_audio(input_data, tgt_lang)
                 else:
                     output = self._generate_text(input_data, tgt_lang)
+                # the vocoder runs inside generate, it is reported as its own stage
+                vocoder = _vocoder_seconds() - vocoder_start
+                STAGE_SECONDS.observe(time.perf_counter() - start - vocoder, "generate", *self._stage_labels())
+                if vocoder:
+                    STAGE_SECONDS.observe(vocoder, "vocoder", *self._stage_labels())
             except AttributeError as e:
                 logger.error(f"Error processing translation: {e}")
                 raise ValueError(f"Error processing translation: {e}") from e
@@ -244,6 +288,13 @@ def text2speech(translation: Translation, miner_request: Optional[dict] = None):
     return translation.process(translation_request)
 
 
+def _sample_speech(translation: Translation) -> str:
+    """
+    An English sentence spoken by the model, encoded as a speech request input.
+    """
+    return text2speech(translation, {"input": "Hello, my name is John Doe.", "task_string": "text2speech", "source_language": "English", "target_language": "English"})
+
+
 def speech2text(translation: Translation, miner_request: Optional[dict] = None):
     """
     A function that converts speech input to text using a given Translation object.
@@ -255,7 +306,7 @@ def speech2text(translation: Translation, miner_request: Optional[dict] = None):
     Returns:
         The processed text output.
     """
-    translation_request = miner_request or {"input": "./src/modules/translation/audio_request.wav", "task_string": "speech2text", "source_language": "English", "target_language": "French"}
+    translation_request = miner_request or {"input": _sample_speech(translation), "task_string": "speech2text", "source_language": "English", "target_language": "French"}
     return translation.process(translation_request)
 
 
@@ -270,7 +321,7 @@ def speech2speech(translation: Translation, miner_request: Optional[dict] = None
     Returns:
         The processed speech output.
     """
-    translation_request = miner_request or {"input": "./src/modules/translation/audio_request.wav", "task_string": "speech2speech", "source_language": "English", "target_language": "French"}
+    translation_request = miner_request or {"input": _sample_speech(translation), "task_string": "speech2speech", "source_language": "English", "target_language": "French"}
     return translation.process(translation_request)
 
 if __name__ == "__main__":
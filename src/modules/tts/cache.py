@@ -0,0 +1,57 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import torch
+
+
+class SpeechCache:
+    """
+    Content-addressed cache of synthesized speech on disk.
+
+    Every waveform is a `torch.save` file named by the SHA-256 of the model
+    version, the language and the text, so a text is synthesized once per
+    model and language, and a new model version never reads the speech of
+    the previous one.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, language: str, model_version: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model_version}\0{language}\0{text_hash}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pt")
+
+    def get(self, text: str, language: str, model_version: str) -> torch.Tensor | None:
+        path = self._path(self.key(text, language, model_version))
+        try:
+            waveform = torch.load(path, weights_only=True)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (EOFError, RuntimeError, pickle.UnpicklingError):
+            # cut short by a crash while written, or not a waveform at all
+            self.misses += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        self.hits += 1
+        return waveform
+
+    def put(self, text: str, language: str, model_version: str, waveform: torch.Tensor) -> None:
+        path = self._path(self.key(text, language, model_version))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written next to the target and renamed, so readers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            torch.save(waveform.detach().cpu().clone(), f)
+        os.replace(tmp_path, path)
@@ -1,9 +1,14 @@
+from collections import defaultdict
 from transformers import AutoProcessor, SeamlessM4Tv2Model, pipeline
 import torch
 
 from src.utils.constants import MODELS 
 from src.utils.model_load import load_seamless
 from src.modules.translation.data_models import TARGET_LANGUAGES
+from src.modules.tts.cache import SpeechCache
+
+# speech caches by directory
+CACHES: dict[str, SpeechCache] = {}
 
 def process(messages, source_language, device = torch.device("cuda" if torch.cuda.is_available() else "cpu")):
     """
@@ -29,6 +34,60 @@ def process(messages, source_language, device = torch.device("cuda" if torch.cud
     input_data = {k: v.to(device) for k, v in input_data.items()}
     return model.generate(**input_data, tgt_lang=src_lang)[0]
 
+def model_version(model):
+    """
+    The checkpoint and revision of a model, which the speech cache is keyed by.
+    """
+    config = model.config
+    return f"{config._name_or_path or type(model).__name__}@{getattr(config, '_commit_hash', None) or 'local'}"
+
+def process_batch(items, device = torch.device("cuda" if torch.cuda.is_available() else "cpu"), cache_dir = None):
+    """
+    Text-to-speech conversion of several texts at once.
+
+    The texts of one language are padded into one `generate` call, as the
+    model speaks one language per call, and every waveform is cut to its
+    own length. A text repeated in the batch is synthesized once.
+
+    Args:
+        items (list): (text, language) pairs.
+        cache_dir (str): Directory of the speech cache, keyed by text,
+            language and model version. None synthesizes every text.
+
+    Returns:
+        list: One waveform of shape (1, samples) per item, as `process` returns for one text.
+    """
+    if 'seamless' not in MODELS:
+        MODELS['seamless'] = load_seamless()
+    model, processor = MODELS['seamless']
+
+    version = model_version(model)
+    cache = CACHES.setdefault(cache_dir, SpeechCache(cache_dir)) if cache_dir else None
+    unique_items = list(dict.fromkeys((text, language) for text, language in items))
+
+    waveforms = {}
+    texts_by_language = defaultdict(list)
+    for text, language in unique_items:
+        waveform = cache.get(text, language, version) if cache else None
+        if waveform is not None:
+            waveforms[(text, language)] = waveform.to(device)
+        else:
+            texts_by_language[language].append(text)
+
+    for language, texts in texts_by_language.items():
+        src_lang = TARGET_LANGUAGES[language]
+        input_data = processor(text=texts, src_lang=src_lang, padding=True, return_tensors="pt")
+        input_data = {k: v.to(device) for k, v in input_data.items()}
+        output = model.generate(**input_data, tgt_lang=src_lang)
+        # a batch of one comes back squeezed
+        waveform, waveform_lengths = output[0].reshape(len(texts), -1), output[1].reshape(-1)
+        for text, padded, length in zip(texts, waveform, waveform_lengths):
+            waveforms[(text, language)] = padded[:int(length)].unsqueeze(0)
+            if cache:
+                cache.put(text, language, version, waveforms[(text, language)])
+
+    return [waveforms[(text, language)] for text, language in items]
+
 if __name__ == '__main__':
     text = """LinguaNet is an innovative translation module designed to enhance communication across diverse languages. With the ability to translate numerous languages, LinguaNet supports both audio and text inputs and outputs, making it a versatile tool for global interactions.
 As our initial step into the Commune AI ecosystem, LinguaNet connects to the network we are building, providing AI tools and linking various blockchain networks together. Our mission is to create a seamless and intuitive translation experience that utilizes advanced AI to promote better understanding and collaboration across different languages and cultures.
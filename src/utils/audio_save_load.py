@@ -1,15 +1,41 @@
+import asyncio
+import math
+import os
+import shutil
+import subprocess
+import threading
 import numpy as np
 import torch
 import wave
+import struct
 from fastapi import File
-from typing import Union
+from functools import lru_cache
+from scipy.signal import firwin, resample_poly
+from typing import Optional, Union
+from src.utils.metrics import register_lru_cache
 import io
 import base64
 
+# Sample rate the Seamless models expect
+SAMPLE_RATE = 16000
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
 async def _wav_to_tensor(file: Union[str, File]) -> torch.Tensor:
     """
     Reads a WAV file and converts it into a PyTorch tensor.
 
+    The file is parsed in a worker thread so the event loop is never blocked.
+    See `_read_wav_tensor` for the arguments and returned values.
+    """
+    return await asyncio.to_thread(_read_wav_tensor, file)
+
+def _read_wav_tensor(file: Union[str, File]) -> torch.Tensor:
+    """
+    Reads a WAV file and converts it into a PyTorch tensor.
+
     Args:
     file_path (str): The path to the input wav file.
 
@@ -17,27 +43,16 @@ async def _wav_to_tensor(file: Union[str, File]) -> torch.Tensor:
     torch.Tensor: A tensor containing the audio data.
     int: The sample rate of the audio.
     """
-    frames, sample_rate, num_channels, sampwidth = _load_raw_audio_file(file)
-    # Convert byte data to numpy array
-    if sampwidth == 2:
-        # 16-bit audio
-        audio_data = np.frombuffer(frames, dtype=np.int16).astype(np.float32)
-        audio_data /= 2**15  # Normalize to [-1, 1] for 16-bit audio
-    elif sampwidth == 4:
-        # 32-bit audio
-        audio_data = np.frombuffer(frames, dtype=np.int32).astype(np.float32)
-        audio_data /= 2**31  # Normalize to [-1, 1] for 32-bit audio
+    if isinstance(file, (str, os.PathLike)):
+        # decode straight from the mapped file, the float32 array is the only copy
+        frames, sample_rate, format_tag, bits_per_sample = map_wav(file)
+        audio_data = _frames_to_mono(frames, format_tag, bits_per_sample)
+        num_channels = frames.shape[1]
     else:
-        raise ValueError(f"Unsupported sample width: {sampwidth}")
-
-    # If stereo, reshape the array to have the correct number of channels
-    if num_channels > 1:
-        audio_data = np.reshape(audio_data, (-1, num_channels))
-        # Average the channels if you want to convert it to mono
-        audio_data = np.mean(audio_data, axis=1)
-
-    # Convert the numpy array to a PyTorch tensor
-    audio_tensor = torch.tensor(audio_data, dtype=torch.float32)
+        buffer = file.getbuffer() if isinstance(file, io.BytesIO) else file.read()
+        audio_data, sample_rate, num_channels, bits_per_sample = _decode_wav(buffer)
+    audio_tensor = torch.from_numpy(audio_data)
+    sampwidth = bits_per_sample // 8
 
     return audio_tensor, sample_rate, num_channels, sampwidth
 
@@ -62,6 +77,9 @@ def _load_raw_audio_file(file_path: str):
     """
     Loads a raw audio file from disk.
 
+    This reads the whole file into memory; use `map_wav` or `iter_wav_chunks`
+    for long recordings.
+
     Args:
         file_path (str): The path to the audio file.
     """
@@ -111,4 +129,347 @@ def _save_raw_audio_file(audio_data, file_path: str = None, sample_rate: int = 1
     if isinstance(file_path, io.BytesIO):
         file_path.seek(0)
 
-    return file_path
\ No newline at end of file
+    return file_path
+
+def _parse_wav_header(buffer) -> tuple[int, int, int, int, int, int]:
+    """
+    Walks the RIFF chunks of a WAV file held in memory.
+
+    Args:
+    buffer (bytes-like): The content of the WAV file.
+
+    Returns:
+    int: The format tag (PCM, IEEE float...).
+    int: The number of channels.
+    int: The sample rate.
+    int: The number of bits per sample.
+    int: The offset of the audio data in the buffer.
+    int: The size of the audio data in bytes.
+    """
+    view = memoryview(buffer)
+    if len(view) < 12 or bytes(view[0:4]) != b'RIFF' or bytes(view[8:12]) != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size, = struct.unpack_from('<I', view, offset + 4)
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            format_tag, num_channels, sample_rate, _, _, bits_per_sample = struct.unpack_from('<HHIIHH', view, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # the actual format is the first two bytes of the sub-format GUID
+                format_tag, = struct.unpack_from('<H', view, body + 24)
+            if num_channels == 0 or bits_per_sample < 8 or sample_rate == 0:
+                raise ValueError(f"Invalid WAV format: {num_channels} channels, {bits_per_sample} bits per sample at {sample_rate} Hz")
+            fmt = (format_tag, num_channels, sample_rate, bits_per_sample)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk found before the fmt chunk")
+            # streamed WAV files may announce a bogus data size
+            data_size = min(chunk_size, len(view) - body)
+            return (*fmt, body, data_size)
+        # chunks are padded to an even size
+        offset = body + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+def _pcm_view(buffer) -> tuple[np.ndarray, int, int, int]:
+    """
+    Exposes the samples of a WAV file held in memory as a NumPy view, without
+    copying them.
+
+    Args:
+    buffer (bytes-like): The content of the WAV file.
+
+    Returns:
+    np.ndarray: The samples, shaped (frames, channels). 24-bit samples have
+        no NumPy type and are shaped (frames, channels, 3) bytes instead.
+    int: The sample rate of the audio.
+    int: The format tag of the samples.
+    int: The number of bits per sample.
+    """
+    format_tag, num_channels, sample_rate, bits_per_sample, offset, size = _parse_wav_header(buffer)
+    sample_width = bits_per_sample // 8
+    num_frames = size // (sample_width * num_channels)
+    count = num_frames * num_channels
+
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits_per_sample in (32, 64):
+        samples = np.frombuffer(buffer, dtype=f'<f{sample_width}', count=count, offset=offset)
+    elif format_tag == WAVE_FORMAT_PCM and bits_per_sample in (16, 32):
+        samples = np.frombuffer(buffer, dtype=f'<i{sample_width}', count=count, offset=offset)
+    elif format_tag == WAVE_FORMAT_PCM and bits_per_sample == 24:
+        samples = np.frombuffer(buffer, dtype=np.uint8, count=count * 3, offset=offset).reshape(count, 3)
+    elif format_tag == WAVE_FORMAT_PCM and bits_per_sample == 8:
+        samples = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset)
+    else:
+        raise ValueError(f"Unsupported WAV format {format_tag} with {bits_per_sample} bits per sample")
+
+    return samples.reshape(num_frames, num_channels, *samples.shape[1:]), sample_rate, format_tag, bits_per_sample
+
+def _frames_to_mono(frames: np.ndarray, format_tag: int, bits_per_sample: int) -> np.ndarray:
+    """
+    Converts frames returned by `_pcm_view` (or a slice of them) into a mono
+    float32 array in [-1, 1].
+
+    The channels are averaged while converting into the output array, so no
+    intermediate float copy is made.
+    """
+    num_frames, num_channels = frames.shape[:2]
+    bias = 0
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        samples = frames
+        full_scale = 1
+    elif bits_per_sample == 24:
+        # place the 3 bytes of every sample in the upper bytes of an int32,
+        # which keeps the sign and scales the sample by 2**8
+        count = num_frames * num_channels
+        samples = np.empty((num_frames, num_channels), dtype='<i4')
+        unpacked = samples.reshape(count).view(np.uint8).reshape(count, 4)
+        unpacked[:, 0] = 0
+        unpacked[:, 1:] = frames.reshape(count, 3)
+        full_scale = 2 ** 31
+    elif bits_per_sample == 8:
+        # 8-bit PCM is unsigned
+        samples = frames
+        full_scale = 2 ** 7
+        bias = 2 ** 7
+    else:
+        samples = frames
+        full_scale = 2 ** (bits_per_sample - 1)
+
+    audio = np.empty(num_frames, dtype=np.float32)
+    if num_channels == 1:
+        audio[:] = samples[:, 0]
+    else:
+        # average the channels, accumulating directly in float32
+        np.sum(samples, axis=1, dtype=np.float32, out=audio)
+    if bias:
+        audio -= bias * num_channels
+    audio *= np.float32(1 / (full_scale * num_channels))
+    return audio
+
+def _decode_wav(buffer) -> tuple[np.ndarray, int, int, int]:
+    """
+    Decodes a WAV file held in memory into a mono float32 array.
+
+    Supports 8, 16, 24 and 32-bit PCM and 32 or 64-bit float WAV. The samples
+    are read through a view of `buffer`.
+
+    Returns:
+    np.ndarray: The mono audio data, in [-1, 1].
+    int: The sample rate of the audio.
+    int: The number of channels of the file.
+    int: The number of bits per sample of the file.
+    """
+    frames, sample_rate, format_tag, bits_per_sample = _pcm_view(buffer)
+    return _frames_to_mono(frames, format_tag, bits_per_sample), sample_rate, frames.shape[1], bits_per_sample
+
+def map_wav(file_path: str) -> tuple[np.ndarray, int, int, int]:
+    """
+    Memory-maps a WAV file and exposes its samples as a read-only NumPy view.
+
+    Nothing is read until the samples are accessed, and only the pages that
+    are accessed are loaded, so hour-long recordings can be sliced without
+    holding them in memory.
+
+    Args:
+    file_path (str): The path to the WAV file.
+
+    Returns:
+    np.ndarray: The samples, shaped (frames, channels), see `_pcm_view`.
+    int: The sample rate of the audio.
+    int: The format tag of the samples.
+    int: The number of bits per sample.
+    """
+    return _pcm_view(np.memmap(file_path, dtype=np.uint8, mode='r'))
+
+@lru_cache(maxsize=32)
+def _resampling_filter(up: int, down: int) -> np.ndarray:
+    """
+    Designs the polyphase low-pass filter used to resample by `up / down`.
+
+    This is the filter `scipy.signal.resample_poly` designs on every call;
+    designing it once per rate pair makes repeated resampling much cheaper.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    return firwin(2 * half_len + 1, 1 / max_rate, window=('kaiser', 5.0))
+
+register_lru_cache("resampling_filter", _resampling_filter)
+
+def resample(audio: np.ndarray, sample_rate: int, target_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Resamples audio with a polyphase filter cached per rate pair.
+
+    Args:
+    audio (np.ndarray): The mono audio data.
+    sample_rate (int): The sample rate of `audio`.
+    target_rate (int): The wanted sample rate (default is 16000).
+
+    Returns:
+    np.ndarray: The resampled float32 audio data.
+    """
+    if sample_rate == target_rate:
+        return audio
+    divisor = math.gcd(sample_rate, target_rate)
+    up, down = target_rate // divisor, sample_rate // divisor
+    resampled = resample_poly(audio, up, down, window=_resampling_filter(up, down))
+    return resampled.astype(np.float32, copy=False)
+
+def wav_bytes_to_tensor(buffer, target_rate: Optional[int] = None) -> tuple[torch.Tensor, int]:
+    """
+    Decodes a WAV file held in memory into a mono float32 tensor.
+
+    Args:
+    buffer (bytes-like): The content of the WAV file.
+    target_rate (int): Resample the audio to this sample rate, if given.
+
+    Returns:
+    torch.Tensor: A tensor containing the mono audio data, in [-1, 1].
+    int: The sample rate of the audio.
+    """
+    audio, sample_rate, _, _ = _decode_wav(buffer)
+    if target_rate is not None:
+        audio = resample(audio, sample_rate, target_rate)
+        sample_rate = target_rate
+    return torch.from_numpy(audio), sample_rate
+
+def iter_wav_chunks(file: Union[str, bytes], chunk_frames: int = 30 * SAMPLE_RATE, target_rate: Optional[int] = None):
+    """
+    Decodes a WAV file window by window, so long recordings are processed
+    with bounded memory.
+
+    Files on disk are memory-mapped. When resampling, every window is
+    resampled with enough context on both sides that the concatenated chunks
+    are the same as resampling the whole file at once.
+
+    Args:
+    file (Union[str, bytes]): The path to the WAV file, or its content.
+    chunk_frames (int): The number of input frames per window.
+    target_rate (int): Resample the audio to this sample rate, if given.
+
+    Yields:
+    np.ndarray: Chunks of mono float32 audio data, in [-1, 1].
+    """
+    if isinstance(file, (str, os.PathLike)):
+        frames, sample_rate, format_tag, bits_per_sample = map_wav(file)
+    else:
+        frames, sample_rate, format_tag, bits_per_sample = _pcm_view(file)
+    num_frames = len(frames)
+
+    if target_rate is None or target_rate == sample_rate:
+        for start in range(0, num_frames, chunk_frames):
+            yield _frames_to_mono(frames[start:start + chunk_frames], format_tag, bits_per_sample)
+        return
+
+    divisor = math.gcd(sample_rate, target_rate)
+    up, down = target_rate // divisor, sample_rate // divisor
+    window = _resampling_filter(up, down)
+    # windows start on multiples of `down` input frames, where the output
+    # samples line up with the ones of the whole file, and the context covers
+    # the half of the filter that reaches into the neighbouring windows
+    context = math.ceil(math.ceil((len(window) // 2) / up) / down) * down
+    chunk_frames = max(down, chunk_frames // down * down)
+    for start in range(0, num_frames, chunk_frames):
+        end = min(start + chunk_frames, num_frames)
+        low, high = max(0, start - context), min(num_frames, end + context)
+        audio = _frames_to_mono(frames[low:high], format_tag, bits_per_sample)
+        resampled = resample_poly(audio, up, down, window=window)
+        first = (start - low) * up // down
+        count = -(-end * up // down) - start * up // down
+        yield resampled[first:first + count].astype(np.float32, copy=False)
+
+def iter_compressed_audio(data: bytes, target_rate: int = SAMPLE_RATE, chunk_frames: int = SAMPLE_RATE):
+    """
+    Decodes a compressed audio file (ogg, opus, mp3...) with ffmpeg, as a stream.
+
+    ffmpeg downmixes and resamples the audio itself, and the decoded audio is
+    yielded chunk by chunk while ffmpeg is still reading the input.
+
+    Args:
+    data (bytes): The content of the audio file.
+    target_rate (int): The sample rate of the decoded audio (default is 16000).
+    chunk_frames (int): The number of frames per yielded chunk.
+
+    Yields:
+    np.ndarray: Chunks of mono float32 audio data.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ValueError("ffmpeg is required to decode compressed audio")
+    process = subprocess.Popen(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "f32le", "-ac", "1", "-ar", str(target_rate), "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            process.stdin.write(data)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    chunk_bytes = chunk_frames * 4
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_bytes)
+            if not chunk:
+                break
+            yield np.frombuffer(chunk, dtype='<f4', count=len(chunk) // 4)
+    finally:
+        process.stdout.close()
+        feeder.join()
+        error = process.stderr.read().decode(errors="replace").strip()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise ValueError(f"ffmpeg failed to decode the audio: {error}")
+
+def load_audio(data: bytes, target_rate: int = SAMPLE_RATE) -> torch.Tensor:
+    """
+    Decodes an uploaded audio file of any supported format into a mono
+    float32 tensor at `target_rate`.
+
+    WAV files are decoded in process; other formats go through ffmpeg.
+    """
+    if bytes(data[:4]) == b'RIFF':
+        audio, _ = wav_bytes_to_tensor(data, target_rate)
+        return audio
+    chunks = list(iter_compressed_audio(data, target_rate))
+    audio = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+    return torch.from_numpy(audio)
+
+def tensor_to_wav_bytes(tensor: torch.Tensor, sample_rate: int = 16000) -> bytearray:
+    """
+    Encodes an audio tensor as a 16-bit mono WAV file in memory.
+
+    The samples are scaled straight into the WAV buffer, so the buffer is
+    the only copy made.
+
+    Args:
+    tensor (torch.Tensor): The audio waveform, in [-1, 1].
+    sample_rate (int): The sample rate of the audio (default is 16000).
+
+    Returns:
+    bytearray: The content of the WAV file.
+    """
+    samples = tensor.detach().reshape(-1).cpu().numpy()
+    upper = 32767 / 32768
+    if samples.size and (samples.max() > upper or samples.min() < -1):
+        samples = np.clip(samples, -1, upper)
+
+    data_size = samples.size * 2
+    buffer = bytearray(44 + data_size)
+    struct.pack_into(
+        '<4sI4s4sIHHIIHH4sI', buffer, 0,
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, WAVE_FORMAT_PCM, 1, sample_rate, sample_rate * 2, 2, 16,
+        b'data', data_size,
+    )
+    pcm = np.frombuffer(buffer, dtype='<i2', offset=44)
+    np.multiply(samples, 32768, out=pcm, casting='unsafe')
+    return buffer
@@ -128,6 +128,21 @@ LLMS : list[str] = [
     "src.modules.llms.llama",
 ]
 
+# Most new tokens of the LLM answer to each prompt: a story of up to 200 words,
+# then its translation, which takes more tokens in most non-Latin scripts.
+TOKEN_BUDGETS : dict[str, int] = {
+    "GENERATE_INPUT_DATA": 512,
+    "GENERATE_OUTPUT_DATA": 768,
+    "DEFAULT": 400,
+}
+
+# Draft model of each LLM module for assisted generation, sharing its tokenizer.
+# None generates without one, e.g. "meta-llama/Llama-3.2-1B-Instruct" for the Llama 3.1 8B models.
+ASSISTANT_MODELS : dict[str, str | None] = {
+    "src.modules.llms.llama": None,
+    "src.modules.llms.meta_llama": None,
+}
+
 TTS : list[str] = [
     "src.modules.tts.seamless"
 ]
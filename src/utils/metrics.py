@@ -0,0 +1,289 @@
+"""
+Minimal Prometheus metrics, rendered in the text exposition format.
+
+Recording a value is a lock, a bisect and two additions, so the timers can
+stay on the hot path. Metrics holding live values (queue depths, memory) are
+read through callbacks when the metrics are rendered.
+"""
+
+import math
+import resource
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from src.modules.translation.data_models import TARGET_LANGUAGES, TASK_STRINGS
+
+# from 5 ms to 2 minutes, the range of a miner stage
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """
+    A metric family, set by the code or read from `function` when rendered.
+
+    `function` returns a mapping of label values to metric values.
+    """
+
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        registry: Optional["Registry"] = None,
+        function: Optional[Callable[[], dict]] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def set_function(self, function: Callable[[], dict]):
+        self.function = function
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        if self.function is not None:
+            try:
+                values = self.function()
+            except Exception:
+                return []
+            return [(self.name, tuple(labels), value) for labels, value in values.items()]
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+    def collect(self) -> tuple[str, str, str, tuple, list]:
+        return (self.name, self.kind, self.documentation, self.labelnames, self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # one count per bucket plus +Inf, then the sum
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._values.items()]
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", labels + (("le", bound),), cumulative))
+            samples.append((f"{self.name}_count", labels, cumulative))
+            samples.append((f"{self.name}_sum", labels, values[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def collect(self) -> list[tuple]:
+        """
+        The current families as plain tuples, which can be pickled and
+        merged with the families of another process.
+        """
+        return [metric.collect() for metric in self._metrics]
+
+
+def render(*collected: list[tuple], processes: Optional[list[str]] = None) -> str:
+    """
+    Render collected families in the Prometheus text format. Families of
+    the same name collected in several processes are merged; give the name
+    of every process in `processes` to tell their series apart with a
+    `process` label, as Prometheus rejects a scrape repeating a series.
+    """
+    families: dict[str, tuple] = {}
+    for index, families_list in enumerate(collected):
+        for name, kind, documentation, labelnames, samples in families_list:
+            if processes is not None:
+                labelnames = labelnames + ("process",)
+                samples = [_add_label(labels, processes[index], sample_name, value) for sample_name, labels, value in samples]
+            if name in families:
+                families[name][4].extend(samples)
+            else:
+                families[name] = (name, kind, documentation, labelnames, list(samples))
+
+    lines = []
+    for name, kind, documentation, labelnames, samples in families.values():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            extra = ""
+            if labels and isinstance(labels[-1], tuple):
+                # histogram bucket bound
+                extra = f'le="{_format_value(labels[-1][1])}"'
+                labels = labels[:-1]
+            lines.append(f"{sample_name}{_format_labels(labelnames, labels, extra)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _add_label(labels: tuple, label: str, sample_name: str, value: float) -> tuple:
+    if labels and isinstance(labels[-1], tuple):
+        # before the histogram bucket bound
+        return sample_name, labels[:-1] + (label, labels[-1]), value
+    return sample_name, labels + (label,), value
+
+
+REGISTRY = Registry()
+
+_LRU_CACHES: dict[str, Callable] = {}
+
+
+def register_lru_cache(name: str, function: Callable):
+    """
+    Expose the hits and misses of a `functools.lru_cache` function.
+    """
+    _LRU_CACHES[name] = function
+
+
+def _cache_stats(field: str) -> dict:
+    return {(name,): getattr(function.cache_info(), field) for name, function in _LRU_CACHES.items()}
+
+
+def _peak_memory() -> dict:
+    # ru_maxrss is in kilobytes on Linux
+    values = {("host",): resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+        for index in range(torch.cuda.device_count()):
+            values[(f"cuda:{index}",)] = torch.cuda.max_memory_allocated(index)
+    return values
+
+
+# == Miner ==
+STAGE_SECONDS = Histogram(
+    "linguanet_miner_stage_seconds",
+    "Time spent in every stage of a translation request, by task and language pair.",
+    ("stage", "task", "source_language", "target_language"),
+)
+REQUEST_SECONDS = Histogram(
+    "linguanet_miner_request_seconds",
+    "Time to answer a translation request (waiting for a replica included), by task and language pair.",
+    ("task", "source_language", "target_language"),
+)
+REQUESTS = Counter(
+    "linguanet_miner_requests_total",
+    "Translation requests answered, by task and status.",
+    ("task", "status"),
+)
+IN_FLIGHT = Gauge(
+    "linguanet_miner_in_flight_requests",
+    "Translation requests being processed or waiting for a model replica.",
+)
+QUEUE_DEPTH = Gauge(
+    "linguanet_miner_queue_depth",
+    "Requests admitted and not answered yet.",
+)
+REPLICA_OUTSTANDING = Gauge(
+    "linguanet_miner_replica_outstanding_requests",
+    "Requests queued or running on every model replica.",
+    ("replica", "device"),
+)
+CACHE_HITS = Counter(
+    "linguanet_cache_hits_total",
+    "Hits of the in-memory caches.",
+    ("cache",),
+    function=lambda: _cache_stats("hits"),
+)
+CACHE_MISSES = Counter(
+    "linguanet_cache_misses_total",
+    "Misses of the in-memory caches.",
+    ("cache",),
+    function=lambda: _cache_stats("misses"),
+)
+PEAK_MEMORY = Gauge(
+    "linguanet_peak_memory_bytes",
+    "Peak resident memory of the process, and peak memory allocated on every GPU.",
+    ("device",),
+    function=_peak_memory,
+)
+
+
+def request_labels(translation_request: dict) -> tuple:
+    """
+    The task, source language and target language labels of a translation
+    request, with the languages spelled as `Translation` spells them. Values
+    that are not a known task or language are labelled "other", so callers
+    cannot grow the number of series.
+    """
+    task = translation_request.get("task_string")
+    languages = [str(translation_request.get(key)).title() for key in ("source_language", "target_language")]
+    return (
+        task if task in TASK_STRINGS else "other",
+        *(language if language in TARGET_LANGUAGES else "other" for language in languages),
+    )
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels):
+    """
+    Observe the time spent in the `with` block.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, *labels)
@@ -59,4 +59,28 @@ def load_llama(device = torch.device("cuda" if torch.cuda.is_available() else "c
     model = AutoModelForCausalLM.cached_model
     tokenizer = AutoTokenizer.from_pretrained(model_id)
 
-    return model, tokenizer
\ No newline at end of file
+    return model, tokenizer
+
+def load_llama_cpu(quantize: bool = True):
+    """
+    The validator LLM for CPU-only nodes: full precision weights, with the
+    linear layers quantized to int8 (dynamic quantization) unless `quantize`
+    is False. bitsandbytes 4-bit quantization needs CUDA.
+    """
+    model_id = "cognitivecomputations/dolphin-2.9.4-llama3.1-8b"
+
+    model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True).eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+    return model, tokenizer
+
+def load_assistant(model_id: str, device = torch.device("cuda" if torch.cuda.is_available() else "cpu")):
+    """
+    A small draft model for assisted generation, in half precision on CUDA.
+    """
+    dtype = torch.bfloat16 if torch.device(device).type == "cuda" else torch.float32
+    model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=dtype).to(device).eval()
+
+    return model
\ No newline at end of file
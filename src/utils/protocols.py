@@ -16,3 +16,11 @@ class TranslationSynapse(BaseSynapse):
     """
     translation_request: Optional[dict] = None
     miner_response: Optional[str] = None
+
+def synapse_params(synapse: BaseSynapse) -> dict:
+    """
+    The parameters of the miner `forward` endpoint carrying a synapse.
+    """
+    synapse_dict = synapse.dict()
+    synapse_dict['synapse_name'] = synapse.__class__.__name__
+    return {"synapse": synapse_dict}
@@ -12,21 +12,38 @@ import numpy as np
 
 from src.utils.utils import logger
 
+def tfidf_cosine(miner_response: str, sample_output: str) -> float:
+    """
+    Cosine similarity of the TF-IDF vectors of the two texts.
+    """
+    vectorizer = TfidfVectorizer().fit([miner_response, sample_output])
+    vectors = vectorizer.transform([miner_response, sample_output])
+    return cosine_similarity(vectors[0], vectors[1])[0][0]
+
+def bleu(miner_response: str, sample_output: str) -> float:
+    """
+    Sentence BLEU of the miner response against the sample output, on
+    whitespace tokens.
+    """
+    return sentence_bleu([sample_output.split()], miner_response.split())
+
+def sequence_ratio(miner_response: str, sample_output: str) -> float:
+    """
+    Levenshtein-like similarity, as a ratio of matched characters.
+    """
+    return SequenceMatcher(None, miner_response, sample_output).ratio()
+
 def score_text(miner_response: str, sample_output: str) -> float:
     logger.info(f'miner_response : {miner_response}')
     logger.info(f'sample_output : {sample_output}')
     # Compute cosine similarity using TF-IDF vectorization
-    vectorizer = TfidfVectorizer().fit([miner_response, sample_output])
-    vectors = vectorizer.transform([miner_response, sample_output])
-    cosine_sim = cosine_similarity(vectors[0], vectors[1])[0][0]
+    cosine_sim = tfidf_cosine(miner_response, sample_output)
     
     # Compute BLEU score for translation evaluation
-    miner_response_tokens = miner_response.split()
-    sample_output_tokens = sample_output.split()
-    bleu_score = sentence_bleu([sample_output_tokens], miner_response_tokens)
+    bleu_score = bleu(miner_response, sample_output)
     
     # Compute Levenshtein similarity (as a ratio of matched characters)
-    lev_sim = SequenceMatcher(None, miner_response, sample_output).ratio()
+    lev_sim = sequence_ratio(miner_response, sample_output)
     
     # Aggregate the scores (with customizable weights)
     aggregated_score = 0.5 * cosine_sim + 0.3 * bleu_score + 0.2 * lev_sim
@@ -57,16 +74,25 @@ def extract_mfcc_from_array(audio_data: np.ndarray, sample_rate: int, n_mfcc: in
         logger.error(f"Error extracting MFCCs from audio data: {e}")
         return None
 
+def mfcc_features(audio: torch.Tensor) -> np.ndarray:
+    """
+    Mean MFCC vector of a 16 kHz waveform.
+    """
+    return extract_mfcc_from_array(np.array(audio.cpu()), 16000).flatten()
+
+def mfcc_cosine(miner_mfcc: np.ndarray, sample_mfcc: np.ndarray) -> float:
+    return cosine_similarity([miner_mfcc], [sample_mfcc])[0][0]
+
+def mfcc_distance(miner_mfcc: np.ndarray, sample_mfcc: np.ndarray) -> float:
+    return euclidean(miner_mfcc, sample_mfcc)
+
 def score_speech(miner_audio: torch.Tensor, sample_audio: torch.Tensor) -> float:
     logger.info(f'type of miner_audio : {type(miner_audio)}')
     logger.info(f'type of sample_audio : {type(sample_audio)}')
     
     # Extract MFCC features from the audio tensors
-    miner_audio = np.array(miner_audio.cpu())
-    sample_audio = np.array(sample_audio.cpu())
-
-    miner_mfcc = extract_mfcc_from_array(miner_audio, 16000).flatten()
-    sample_mfcc = extract_mfcc_from_array(sample_audio, 16000).flatten()
+    miner_mfcc = mfcc_features(miner_audio)
+    sample_mfcc = mfcc_features(sample_audio)
     
     if miner_mfcc is None or sample_mfcc is None:
         logger.error("Failed to extract MFCCs from one or both audio inputs. Returning 0 similarity score.")
@@ -76,10 +102,10 @@ def score_speech(miner_audio: torch.Tensor, sample_audio: torch.Tensor) -> float
     logger.info(f'sample_mfcc shape: {sample_mfcc.shape}')
     
     # Compute cosine similarity between the MFCC features
-    cosine_sim = cosine_similarity([miner_mfcc], [sample_mfcc])[0][0]
+    cosine_sim = mfcc_cosine(miner_mfcc, sample_mfcc)
     
     # Compute Euclidean distance (or use another distance metric if needed)
-    euclidean_dist = euclidean(miner_mfcc, sample_mfcc)
+    euclidean_dist = mfcc_distance(miner_mfcc, sample_mfcc)
     
     # Aggregate the scores (with customizable weights)
     aggregated_score = 0.7 * cosine_sim + 0.3 * (1 / (1 + euclidean_dist))  # inverse to make it similarity
@@ -87,4 +113,3 @@ def score_speech(miner_audio: torch.Tensor, sample_audio: torch.Tensor) -> float
     logger.info(f'similarity score: {aggregated_score}')
     
     return aggregated_score
-
@@ -3,6 +3,7 @@ import datetime
 import logging
 import time
 import re
+import numpy as np
 from src.validator._config import ValidatorSettings
 from communex.client import CommuneClient  # type: ignore
 from substrateinterface import Keypair  # type: ignore
@@ -68,30 +69,8 @@ def set_weights(
     """
 
     # you can replace with `max_allowed_weights` with the amount your subnet allows
-    score_dict = cut_to_max_allowed_weights(score_dict, settings.max_allowed_weights)
+    uids, weights = normalize_weights(score_dict, settings.max_allowed_weights)
 
-    # Create a new dictionary to store the weighted scores
-    weighted_scores: dict[int, int] = {}
-
-    # Calculate the sum of all inverted scores
-    scores = sum(score_dict.values())
-
-    # process the scores into weights of type dict[int, int] 
-    # Iterate over the items in the score_dict
-    for uid, score in score_dict.items():
-        # Calculate the normalized weight as an integer
-        weight = int(score * 1000 / scores)
-
-        # Add the weighted score to the new dictionary
-        weighted_scores[uid] = weight
-
-
-    # filter out 0 weights
-    weighted_scores = {k: v for k, v in weighted_scores.items() if v != 0}
-
-    uids = list(weighted_scores.keys())
-    weights = list(weighted_scores.values())
-    
     # send the blockchain call
     for attempt in range(max_retry):
         try:
@@ -105,26 +84,44 @@ def set_weights(
             break
 
 
-def cut_to_max_allowed_weights(
-    score_dict: dict[int, float], max_allowed_weights: int
-) -> dict[int, float]:
+def normalize_weights(
+    score_dict: dict[int, float], max_allowed_weights: int, scale: int = 1000
+) -> tuple[list[int], list[int]]:
     """
-    Cut the scores to the maximum allowed weights.
+    Turn scores into the integer weights set on chain.
+
+    Keeps the `max_allowed_weights` highest scores, scales them to sum to about
+    `scale` (rounding down) and drops the weights rounded to 0. Works on NumPy
+    arrays, so it stays fast for subnets of thousands of miners.
 
     Args:
         score_dict: A dictionary mapping miner UIDs to their scores.
-        max_allowed_weights: The maximum allowed weights (default: 420).
+        max_allowed_weights: The maximum number of weights set.
+        scale: The sum of the weights before rounding.
 
     Returns:
-        A dictionary mapping miner UIDs to their scores, where the scores have been cut to the maximum allowed weights.
+        The UIDs and their weights, by decreasing weight.
     """
-    # sort the score by highest to lowest
-    sorted_scores = sorted(score_dict.items(), key=lambda x: x[1], reverse=True)
+    if not score_dict:
+        return [], []
+    uids = np.fromiter(score_dict.keys(), dtype=np.int64, count=len(score_dict))
+    scores = np.fromiter(score_dict.values(), dtype=np.float64, count=len(score_dict))
+
+    # top k without sorting the whole subnet
+    if len(scores) > max_allowed_weights:
+        top = np.argpartition(-scores, max_allowed_weights - 1)[:max_allowed_weights]
+        uids, scores = uids[top], scores[top]
+    order = np.argsort(-scores, kind="stable")
+    uids, scores = uids[order], scores[order]
+
+    total = scores.sum()
+    if total <= 0:
+        return [], []
+    weights = (scores * scale / total).astype(np.int64)
 
-    # cut to max_allowed_weights
-    cut_scores = sorted_scores[:max_allowed_weights]
-
-    return dict(cut_scores)
+    # filter out 0 weights
+    kept = weights > 0
+    return uids[kept].tolist(), weights[kept].tolist()
 
 
 def extract_address(string: str):
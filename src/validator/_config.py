@@ -6,3 +6,21 @@ class ValidatorSettings(BaseSettings):
     iteration_interval: int = 800  # Set, accordingly to your tempo.
     max_allowed_weights: int = 400  # Query dynamically based on your subnet settings.
     foo: int | None = None  # Anything else that you wish to implement.
+    score_interval: float = 0.5  # Pause after scoring each miner, in seconds.
+
+    # == Rolling scores ==
+    scores_path: str = "validator_scores.npz"  # Rolling score of every miner.
+    score_alpha: float = 0.1  # Weight of a new score in the rolling average.
+    sample_size: int = 64  # Miners queried per step, 0 for all of them.
+    score_stale_after: float = 3600.0  # Seconds after which a score is sampled as if never seen.
+
+    # == Weight submission ==
+    weights_min_change: float = 0.01  # Share of the total weight that has to move since the last vote.
+    weights_max_retry: int = 10  # Attempts per weight vector.
+    weights_backoff: float = 0.5  # First retry delay in seconds, doubled after every failure.
+    weights_max_backoff: float = 60.0  # Longest retry delay in seconds.
+
+    # == Step timeline ==
+    timeline_path: str = "validator_timeline.jsonl"  # One JSON record per validation step.
+    timeline_max_bytes: int = 10 * 2**20  # Rolled over at this size.
+    timeline_backups: int = 3  # Number of rolled over files kept.
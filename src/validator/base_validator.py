@@ -10,7 +10,7 @@ Classes:
 
 Functions:
     set_weights: Blockchain call to set weights for miners based on their scores.
-    cut_to_max_allowed_weights: Cut the scores to the maximum allowed weights.
+    normalize_weights: Turn scores into the integer weights set on chain.
     extract_address: Extract an address from a string.
     get_subnet_netuid: Retrieve the network UID of the subnet.
     get_ip_port: Get the IP and port information from module addresses.
@@ -23,19 +23,24 @@ import asyncio
 import concurrent.futures
 import time
 import json
+import numpy as np
 import torch
 from functools import partial
 from pydantic import BaseModel
 
 from communex.client import CommuneClient  # type: ignore
+from communex.errors import NetworkTimeoutError  # type: ignore
 from communex.module.client import ModuleClient  # type: ignore
 from communex.module.module import Module  # type: ignore
 from communex.types import Ss58Address  # type: ignore
 from substrateinterface import Keypair  # type: ignore
 
 from ._config import ValidatorSettings
+from .scores import ScoreState
+from .timeline import StepTimeline, TimelineWriter
+from .weights import WeightSubmitter
 from src.utils.utils import *
-from src.utils.protocols import BaseSynapse
+from src.utils.protocols import BaseSynapse, synapse_params
 
 class BaseValidator(Module):
     """
@@ -70,6 +75,13 @@ class BaseValidator(Module):
         self.netuid = netuid
         self.call_timeout = call_timeout
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # timeline of the current validation step
+        self.timeline = StepTimeline()
+        # votes the weights in the background, created on the first step
+        self.weight_submitter: WeightSubmitter | None = None
+        # rolling scores of the miners, loaded on the first step
+        self.score_state: ScoreState | None = None
+        self.rng = np.random.default_rng()
 
     def get_addresses(self, client: CommuneClient, netuid: int) -> dict[int, str]:
         """
@@ -87,6 +99,12 @@ class BaseValidator(Module):
         module_addreses = client.query_map_address(netuid)
         return module_addreses
 
+    def _module_client(self, module_ip: str, module_port: int) -> ModuleClient:
+        """
+        The client calling the miner module at the given address.
+        """
+        return ModuleClient(module_ip, int(module_port), self.key)
+
     def _get_miner_prediction(
         self,
         synapse: BaseModel,
@@ -104,17 +122,14 @@ class BaseValidator(Module):
         """
         connection, miner_key = miner_info
         module_ip, module_port = connection
-        client = ModuleClient(module_ip, int(module_port), self.key)
+        client = self._module_client(module_ip, module_port)
         try:
             # handles the communication with the miner
-            synapse_dict = synapse.dict()
-            synapse_dict['synapse_name'] = synapse.__class__.__name__
-            
             response = asyncio.run(
                 client.call(
                     f"forward",
                     miner_key,
-                    {"synapse": synapse_dict},
+                    synapse_params(synapse),
                     timeout=self.call_timeout,  #  type: ignore
                 )
             )
@@ -122,7 +137,10 @@ class BaseValidator(Module):
             miner_answer = synapse.__class__(**response)
         except Exception as e:
             logger.error(f"Miner {module_ip}:{module_port} failed to generate an answer")
+            self.timeline.count("timed_out" if isinstance(e, (NetworkTimeoutError, asyncio.TimeoutError)) else "failed")
             miner_answer = None
+        else:
+            self.timeline.count("answered")
         return miner_answer
 
     def _score_miner(self, miner_answer: BaseSynapse | None) -> float:
@@ -171,14 +189,22 @@ class BaseValidator(Module):
         """
         Perform a validation step.
 
-        Generates questions based on the provided settings, prompts modules to generate answers,
-        and scores the generated answers against the validator's own answers.
+        Generates questions based on the provided settings, prompts a sample of the modules to
+        generate answers, scores the generated answers against the validator's own answers and
+        sets the weights from the rolling scores of all the modules.
 
         Args:
             netuid: The network UID of the subnet.
         """
 
-        modules_info = self.get_all_miners(netuid)
+        timeline = self.timeline
+        with timeline.stage("chain"):
+            modules_info = self.get_all_miners(netuid)
+
+        score_state = self.get_score_state(settings)
+        miner_keys = {uid: miner_key for uid, (_, miner_key) in modules_info.items()}
+        sampled = score_state.sample(miner_keys, settings.sample_size, time.time(), self.rng)
+        modules_info = {uid: modules_info[uid] for uid in sampled}
 
         score_dict: dict[int, float] = {}
 
@@ -186,8 +212,9 @@ class BaseValidator(Module):
         get_miner_prediction = partial(self._get_miner_prediction, miner_prompt)
 
         logger.info(f"Selected the following miners: {modules_info.keys()}")
+        timeline.count("queried", len(modules_info))
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        with timeline.stage("fanout"), concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
             it = executor.map(get_miner_prediction, modules_info.values())
             miner_answers = [*it]
 
@@ -198,17 +225,43 @@ class BaseValidator(Module):
                 continue
 
             score = self._score_miner(miner_answer, problem)
-            time.sleep(0.5)
+            timeline.count("scored")
+            time.sleep(settings.score_interval)
             # score has to be lower or eq to 1, as one is the best score, you can implement your custom logic
             assert score <= 1
             score_dict[uid] = score
 
+        # a miner that didn't answer scores 0
+        with timeline.stage("scores"):
+            score_state.update({uid: score_dict.get(uid, 0.0) for uid in modules_info}, miner_keys, time.time())
+            score_state.save(settings.scores_path)
+
         if not score_dict:
             logger.error("No miner managed to give a valid answer")
             return None
 
-        # the blockchain call to set the weights
-        _ = set_weights(settings, score_dict, self.netuid, self.client, self.key)
+        # the blockchain call to set the weights runs in the background
+        with timeline.stage("set_weights"):
+            self.get_weight_submitter(settings).submit(score_state.scores(miner_keys))
+
+    def get_score_state(self, settings: ValidatorSettings) -> ScoreState:
+        if self.score_state is None:
+            self.score_state = ScoreState.load(settings.scores_path, settings.score_alpha, settings.score_stale_after)
+        return self.score_state
+
+    def get_weight_submitter(self, settings: ValidatorSettings) -> WeightSubmitter:
+        if self.weight_submitter is None:
+            self.weight_submitter = WeightSubmitter(
+                self.client,
+                self.key,
+                self.netuid,
+                max_allowed_weights=settings.max_allowed_weights,
+                min_change=settings.weights_min_change,
+                max_retry=settings.weights_max_retry,
+                backoff=settings.weights_backoff,
+                max_backoff=settings.weights_max_backoff,
+            )
+        return self.weight_submitter
 
     def validation_loop(self, settings: ValidatorSettings) -> None:
         """
@@ -218,9 +271,18 @@ class BaseValidator(Module):
             settings: The validator settings to use for the validation loop.
         """
 
+        writer = TimelineWriter(settings.timeline_path, settings.timeline_max_bytes, settings.timeline_backups)
         while True:
             start_time = time.time()
-            _ = asyncio.run(self.validate_step(self.netuid, settings))
+            self.timeline = StepTimeline()
+            error = None
+            try:
+                _ = asyncio.run(self.validate_step(self.netuid, settings))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                writer.write(self.timeline.record(interval_s=settings.iteration_interval, error=error))
 
             elapsed = time.time() - start_time
             if elapsed < settings.iteration_interval:
@@ -18,6 +18,8 @@ def serve(
     netuid: int = typer.Option(35, help="Netuid of the subnet"),
     use_testnet: bool = typer.Option(False, help="Use testnet"),
     call_timeout: int = 65,
+    llm_backend: str = typer.Option("hf", help="Backend generating the challenges: hf (CUDA), cpu or stub"),
+    tts_cache: str = typer.Option(None, help="Directory caching the synthesized speech of the challenges"),
 ):
     password = getpass.getpass(prompt = "Enter the password to decrypt your key:")
     keypair = classic_load_key(commune_key, password=password)  # type: ignore
@@ -28,6 +30,8 @@ def serve(
         netuid,
         c_client,
         call_timeout,
+        llm_backend=llm_backend,
+        tts_cache=tts_cache,
     )
     validator.validation_loop(settings)
 
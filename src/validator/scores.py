@@ -0,0 +1,152 @@
+"""
+Rolling scores of the miners.
+
+Every validation step only queries a sample of the subnet, so the weights
+come from a per-miner exponential moving average of all the scores seen so
+far instead of the scores of one round. `ScoreState` keeps that average, its
+variance, the number of scores and the time of the last one in flat NumPy
+arrays indexed by uid, saved as one compressed `.npz` file. A uid registered
+again under another key starts over.
+
+The miners of each step are drawn by `ScoreState.sample`: the miners never
+scored first, then the others with a probability growing with the
+uncertainty of their score and the time since they were last scored.
+
+Usage:
+    python3 -m src.validator.scores [--path validator_scores.npz] [--top 20]
+"""
+
+import os
+
+import numpy as np
+import typer
+
+# width of an ss58 address, with room to spare
+KEY_DTYPE = "<U64"
+
+
+class ScoreState:
+    """
+    Exponential moving average of the score of every miner.
+
+    Attributes:
+        alpha: Weight of a new score in the average.
+        stale_after: Seconds after which a score counts as fully stale when sampling.
+    """
+
+    FIELDS = ("keys", "mean", "var", "count", "last")
+
+    def __init__(self, alpha: float = 0.1, stale_after: float = 3600.0, size: int = 0) -> None:
+        self.alpha = alpha
+        self.stale_after = stale_after
+        self.keys = np.full(size, "", dtype=KEY_DTYPE)
+        self.mean = np.zeros(size, dtype=np.float32)
+        self.var = np.zeros(size, dtype=np.float32)
+        self.count = np.zeros(size, dtype=np.uint32)
+        self.last = np.zeros(size, dtype=np.float64)
+
+    @classmethod
+    def load(cls, path: str, alpha: float = 0.1, stale_after: float = 3600.0) -> "ScoreState":
+        """
+        The state saved at `path`, or an empty one if there is none.
+        """
+        state = cls(alpha, stale_after)
+        if os.path.exists(path):
+            with np.load(path) as saved:
+                for field in cls.FIELDS:
+                    setattr(state, field, saved[field].astype(getattr(state, field).dtype))
+        return state
+
+    def save(self, path: str) -> None:
+        # written next to the target and renamed, so a crash never leaves half a file
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, **{field: getattr(self, field) for field in self.FIELDS})
+        os.replace(tmp_path, path)
+
+    def _grow(self, size: int) -> None:
+        if size <= len(self.mean):
+            return
+        extra = size - len(self.mean)
+        self.keys = np.concatenate([self.keys, np.full(extra, "", dtype=KEY_DTYPE)])
+        for field in ("mean", "var", "count", "last"):
+            values = getattr(self, field)
+            setattr(self, field, np.concatenate([values, np.zeros(extra, dtype=values.dtype)]))
+
+    def _known(self, uids: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        self._grow(int(uids.max()) + 1)
+        return (self.count[uids] > 0) & (self.keys[uids] == keys)
+
+    def update(self, scores: dict[int, float], keys: dict[int, str], now: float) -> None:
+        """
+        Add one score per uid; a uid whose key changed is reset first.
+        """
+        if not scores:
+            return
+        uids = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+        values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+        uid_keys = np.array([keys[uid] for uid in scores], dtype=KEY_DTYPE)
+        known = self._known(uids, uid_keys)
+
+        # first score: the average is the score itself
+        new = uids[~known]
+        self.keys[new] = uid_keys[~known]
+        self.mean[new] = values[~known]
+        self.var[new] = 0.0
+        self.count[new] = 1
+
+        # incremental exponentially weighted mean and variance
+        seen, value = uids[known], values[known]
+        delta = value - self.mean[seen]
+        self.mean[seen] += self.alpha * delta
+        self.var[seen] = (1 - self.alpha) * (self.var[seen] + self.alpha * delta**2)
+        self.count[seen] += 1
+
+        self.last[uids] = now
+
+    def sample(self, keys: dict[int, str], k: int, now: float, rng: np.random.Generator) -> list[int]:
+        """
+        Up to `k` of the miners of `keys` (uid -> key) to query, every miner
+        never scored first. A `k` of 0 samples them all.
+        """
+        if k <= 0 or k >= len(keys):
+            return list(keys)
+        uids = np.fromiter(keys.keys(), dtype=np.int64, count=len(keys))
+        known = self._known(uids, np.array(list(keys.values()), dtype=KEY_DTYPE))
+
+        unseen = uids[~known]
+        if len(unseen) >= k:
+            return rng.choice(unseen, k, replace=False).tolist()
+
+        seen = uids[known]
+        # the spread of the score, plus a prior shrinking with the number of scores
+        uncertainty = np.sqrt(self.var[seen]) + 1 / np.sqrt(self.count[seen] + 1)
+        staleness = np.clip((now - self.last[seen]) / self.stale_after, 0.0, 1.0)
+        priority = uncertainty + staleness + 1e-6
+        picked = rng.choice(seen, k - len(unseen), replace=False, p=priority / priority.sum())
+        return unseen.tolist() + picked.tolist()
+
+    def scores(self, keys: dict[int, str]) -> dict[int, float]:
+        """
+        The rolling score of the miners of `keys` scored at least once under their current key.
+        """
+        if not keys:
+            return {}
+        uids = np.fromiter(keys.keys(), dtype=np.int64, count=len(keys))
+        known = self._known(uids, np.array(list(keys.values()), dtype=KEY_DTYPE))
+        return dict(zip(uids[known].tolist(), self.mean[uids[known]].astype(float).tolist()))
+
+
+def main(
+    path: str = typer.Option("validator_scores.npz", help="Score state written by the validator"),
+    top: int = typer.Option(20, help="Number of miners to show"),
+):
+    state = ScoreState.load(path)
+    scored = np.flatnonzero(state.count > 0)
+    print(f"{len(scored)} miners scored, {int(state.count.sum())} scores")
+    print(f"{'uid':>6} {'score':>7} {'std':>7} {'count':>6}  key")
+    for uid in scored[np.argsort(-state.mean[scored], kind="stable")][:top]:
+        print(f"{uid:>6} {state.mean[uid]:>7.3f} {np.sqrt(state.var[uid]):>7.3f} {state.count[uid]:>6}  {state.keys[uid]}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
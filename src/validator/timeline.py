@@ -0,0 +1,172 @@
+"""
+Timeline of the validator steps.
+
+Every `validate_step` records how long each of its stages took (chain
+queries, challenge generation, miner fan-out, decoding, scoring, weight
+setting) and how the miners answered. The record of each step is appended
+as one JSON line to a rolling file.
+
+Usage:
+    python3 -m src.validator.timeline [--path validator_timeline.jsonl] [--last 100]
+"""
+
+import glob
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+import typer
+
+
+class StepTimeline:
+    """
+    Durations and counters of one validation step.
+
+    A stage entered several times (e.g. scoring every miner) accumulates its
+    durations. Counters may be incremented from worker threads.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stages: dict[str, float] = defaultdict(float)
+        self.counts: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] += elapsed
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def record(self, **fields) -> dict:
+        return {
+            "ts": round(self.started_at, 3),
+            "total_s": round(time.perf_counter() - self._start, 4),
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            "counts": dict(self.counts),
+            **fields,
+        }
+
+
+class TimelineWriter:
+    """
+    Appends step records to a JSON lines file, rolled over at `max_bytes`
+    with `backups` older files kept.
+    """
+
+    def __init__(self, path: str = "validator_timeline.jsonl", max_bytes: int = 10 * 2**20, backups: int = 3):
+        self.path = path
+        self._logger = logging.getLogger(f"{__name__}.{path}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+    def write(self, record: dict):
+        self._logger.info(json.dumps(record, separators=(",", ":")))
+
+
+def read_records(path: str) -> list[dict]:
+    """
+    Read the records of the file and its backups, oldest first.
+    """
+    backups = sorted(glob.glob(f"{glob.escape(path)}.[0-9]*"), key=lambda name: int(name.rsplit(".", 1)[1]), reverse=True)
+    records = []
+    for name in backups + [path]:
+        try:
+            with open(name, encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+        except FileNotFoundError:
+            continue
+    return records
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(records: list[dict]) -> dict:
+    """
+    Percentiles of every stage over the records, and the share of the step
+    time every stage takes on average.
+    """
+    totals = sorted(record["total_s"] for record in records)
+    stage_names = sorted({name for record in records for name in record["stages"]})
+    summary = {"steps": len(records), "stages": {}, "counts": {}}
+
+    total_time = sum(totals)
+    for name in stage_names + ["(unaccounted)", "(total)"]:
+        if name == "(total)":
+            values = totals
+        elif name == "(unaccounted)":
+            values = sorted(max(0.0, record["total_s"] - sum(record["stages"].values())) for record in records)
+        else:
+            values = sorted(record["stages"].get(name, 0.0) for record in records)
+        summary["stages"][name] = {
+            "p50": _percentile(values, 0.50),
+            "p90": _percentile(values, 0.90),
+            "p99": _percentile(values, 0.99),
+            "max": values[-1],
+            "share": sum(values) / total_time if total_time else 0.0,
+        }
+
+    count_names = sorted({name for record in records for name in record["counts"]})
+    for name in count_names:
+        summary["counts"][name] = statistics.fmean(record["counts"].get(name, 0) for record in records)
+
+    intervals = [record["interval_s"] for record in records if record.get("interval_s")]
+    if intervals:
+        summary["interval_usage_p90"] = _percentile(sorted(record["total_s"] / record["interval_s"] for record in records if record.get("interval_s")), 0.90)
+    summary["errors"] = sum(1 for record in records if record.get("error"))
+    return summary
+
+
+def main(
+    path: str = typer.Option("validator_timeline.jsonl", help="Timeline file written by the validator"),
+    last: Optional[int] = typer.Option(None, help="Only summarize the last N steps"),
+    as_json: bool = typer.Option(False, "--json", help="Print the summary as JSON"),
+):
+    records = read_records(path)
+    if last:
+        records = records[-last:]
+    if not records:
+        print(f"No steps recorded in {path}")
+        raise typer.Exit(1)
+
+    summary = summarize(records)
+    if as_json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"{summary['steps']} steps, {summary['errors']} failed")
+    print(f"{'stage':<16} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9} {'share':>7}")
+    for name, stats in summary["stages"].items():
+        print(
+            f"{name:<16} {stats['p50']:>8.2f}s {stats['p90']:>8.2f}s {stats['p99']:>8.2f}s "
+            f"{stats['max']:>8.2f}s {stats['share']:>6.1%}"
+        )
+    if "interval_usage_p90" in summary:
+        print(f"p90 share of iteration_interval used: {summary['interval_usage_p90']:.1%}")
+    for name, mean in summary["counts"].items():
+        print(f"mean {name} per step: {mean:.1f}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -6,10 +6,19 @@ from src.utils.constants import *
 from src.utils.utils import logger
 from src.utils.serialization import audio_encode, audio_decode
 from src.utils.score import score_text, score_speech
+from src.modules.llms.backends import LLMBackend, load_backends
 
 from .base_validator import BaseValidator
 
 class Validator(BaseValidator):
+    def __init__(self, *args, llm_backend: str = "hf", tts_cache: str | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # "hf", "cpu" or "stub", see `src.modules.llms.backends`
+        self.llm_backend = llm_backend
+        # directory of the synthesized speech, see `src.modules.tts.cache`
+        self.tts_cache = tts_cache
+        self.llm_backends: list[LLMBackend] | None = None
+
     def _score_miner(self, miner_answer: TranslationSynapse | None, original_synapse: dict) -> float:
         """
         Score the generated answer against the validator's own answer.
@@ -24,15 +33,17 @@ class Validator(BaseValidator):
         
         if miner_answer.miner_response is not None:
             if task_string.endswith('speech'):
-                miner_output_data = audio_decode(miner_answer.miner_response)
+                with self.timeline.stage("decode"):
+                    miner_output_data = audio_decode(miner_answer.miner_response)
             else:
                 miner_output_data = miner_answer.miner_response
             
-            return float(self.process_validator_output(
-                miner_output_data,
-                original_synapse['output'],
-                task_string
-            )) # 'numpy.float64' object cannot be interpreted as integer
+            with self.timeline.stage("score"):
+                return float(self.process_validator_output(
+                    miner_output_data,
+                    original_synapse['output'],
+                    task_string
+                )) # 'numpy.float64' object cannot be interpreted as integer
         else:
             return 0
     
@@ -62,7 +73,8 @@ class Validator(BaseValidator):
 
         if task_string.startswith('speech'):
             try:
-                miner_input_data = audio_encode(sample_request['input'])
+                with self.timeline.stage("encode"):
+                    miner_input_data = audio_encode(sample_request['input'])
             except Exception as e:
                 logger.error(f"Error encoding audio: {str(e)}")
                 miner_input_data = None
@@ -78,45 +90,57 @@ class Validator(BaseValidator):
 
         return TranslationSynapse(translation_request = translation_request), sample_request
     
-    def generate_input_data(self, llm, topic, source_language, device):
+    def get_llm_backends(self) -> list[LLMBackend]:
+        if self.llm_backends is None:
+            self.llm_backends = load_backends(self.llm_backend, self.device)
+        return self.llm_backends
+
+    def generate_input_data(self, llm: LLMBackend, topic, source_language):
         messages = [{"role": "system", "content": PROMPTS["GENERATE_INPUT_DATA"].format(topic=topic, source_language=source_language)}]
         logger.debug(f"generate_input_data:prompt:{messages}")
-        return llm.process(messages, device)
+        return llm.generate(messages, TOKEN_BUDGETS["GENERATE_INPUT_DATA"])
 
-    def generate_output_data(self, llm, input_data, source_language, target_language, device):
+    def generate_output_data(self, llm: LLMBackend, input_data, source_language, target_language):
         messages = [
             {"role": "system", "content": PROMPTS["GENERATE_OUTPUT_DATA"].format(source_language=source_language, target_language=target_language)},
             {"role": "user", "content": input_data}
         ]
-        return llm.process(messages, device)
+        return llm.generate(messages, TOKEN_BUDGETS["GENERATE_OUTPUT_DATA"])
     
     def select_random_module(self, modules):
         return import_module(random.choice(modules))
     
     def generate_query(self, target_language: str, source_language: str, task_string: str, topic: str):
-        llm = import_module(LLMS[0])
+        llms = self.get_llm_backends()
         tts = self.select_random_module(TTS)
 
-        logger.debug(f"generate_query:llm:{llm}")
+        logger.debug(f"generate_query:llm:{llms[0]}")
         logger.debug(f"generate_query:tts:{tts}")
-        input_data = self.generate_input_data(llm, topic, source_language, self.device)
+        with self.timeline.stage("llm"):
+            input_data = self.generate_input_data(llms[0], topic, source_language)
         logger.debug(f"generate_query:input_data:{input_data}")
 
         outputs = []
 
-        for llm_module in LLMS:
-            llm = import_module(llm_module)
-            
-            output_data = self.generate_output_data(llm, input_data, source_language, target_language, self.device)
-
-            if task_string.endswith("speech"):
-                output_data = tts.process(output_data, target_language)
-            outputs.append(output_data)
+        for llm in llms:
+            with self.timeline.stage("llm"):
+                outputs.append(self.generate_output_data(llm, input_data, source_language, target_language))
         
         logger.info(f'Generated Query Input Text: {input_data}')
 
+        # every text to speak, synthesized in one batch
+        speech_items = []
+        if task_string.endswith("speech"):
+            speech_items += [(output_data, target_language) for output_data in outputs]
         if task_string.startswith("speech"):
-            input_data = tts.process(input_data, source_language)
+            speech_items.append((input_data, source_language))
+        if speech_items:
+            with self.timeline.stage("tts"):
+                speech = tts.process_batch(speech_items, self.device, cache_dir=self.tts_cache)
+            if task_string.endswith("speech"):
+                outputs = speech[:len(outputs)]
+            if task_string.startswith("speech"):
+                input_data = speech[-1]
         return {
                     "input": input_data,
                     "output": outputs,
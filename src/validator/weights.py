@@ -0,0 +1,170 @@
+"""
+Background submission of the validator weights.
+
+Setting weights is a blocking chain call, slow and failing when the node is
+busy. `WeightSubmitter` takes it off the validation step: the step hands over
+its scores and goes on, while a background thread votes them with
+exponential backoff. A newer vector replaces a pending one, even between two
+retries of the older one, and a vector too close to the last one set is not
+voted again.
+"""
+
+import threading
+
+import numpy as np
+from communex.client import CommuneClient  # type: ignore
+from substrateinterface import Keypair  # type: ignore
+
+from src.utils.utils import logger, normalize_weights
+
+
+def weights_change(
+    previous: tuple[list[int], list[int]] | None, current: tuple[list[int], list[int]]
+) -> float:
+    """
+    Share of the total weight that moved between two weight vectors, from 0
+    (same vectors) to 1 (disjoint miners).
+    """
+    if previous is None:
+        return 1.0
+    (previous_uids, previous_weights), (uids, weights) = previous, current
+    if not previous_weights or not weights:
+        return 0.0 if previous_weights == weights else 1.0
+    all_uids = np.union1d(previous_uids, uids)
+
+    def distribution(uids, weights):
+        dense = np.zeros(len(all_uids))
+        dense[np.searchsorted(all_uids, uids)] = weights
+        return dense / dense.sum()
+
+    return 0.5 * float(np.abs(distribution(previous_uids, previous_weights) - distribution(uids, weights)).sum())
+
+
+class WeightSubmitter:
+    """
+    Votes the weights of the validator from a background thread.
+
+    Attributes:
+        min_change: Share of the total weight that has to move since the last
+            vote for a new vector to be voted (see `weights_change`).
+        max_retry: Attempts per vector before it is dropped.
+        backoff: Delay before the first retry, in seconds, doubled after every
+            failed attempt up to `max_backoff`.
+    """
+
+    def __init__(
+        self,
+        client: CommuneClient,
+        key: Keypair,
+        netuid: int,
+        max_allowed_weights: int = 400,
+        min_change: float = 0.01,
+        max_retry: int = 10,
+        backoff: float = 0.5,
+        max_backoff: float = 60.0,
+    ) -> None:
+        self.client = client
+        self.key = key
+        self.netuid = netuid
+        self.max_allowed_weights = max_allowed_weights
+        self.min_change = min_change
+        self.max_retry = max_retry
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.last_voted: tuple[list[int], list[int]] | None = None
+        self.stats = {"submitted": 0, "coalesced": 0, "skipped": 0, "voted": 0, "failed_attempts": 0, "dropped": 0}
+        self._pending: tuple[list[int], list[int]] | None = None
+        self._condition = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+    def submit(self, score_dict: dict[int, float]) -> None:
+        """
+        Queue the weights of `score_dict` for voting, replacing any vector
+        not voted yet. Returns immediately.
+        """
+        vector = normalize_weights(score_dict, self.max_allowed_weights)
+        if not vector[0]:
+            logger.warning("No miner has a positive weight, not voting")
+            return
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The weight submitter is closed")
+            if self._pending is not None:
+                self.stats["coalesced"] += 1
+            self._pending = vector
+            self.stats["submitted"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="weight-submitter", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Wait until no vector is pending or being voted. Returns False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending is None and not self._busy, timeout)
+
+    def close(self, timeout: float | None = None) -> None:
+        """
+        Vote the pending vector, if any, and stop the thread.
+        """
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _take(self) -> tuple[list[int], list[int]] | None:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending is not None or self._closed)
+            vector, self._pending = self._pending, None
+            self._busy = vector is not None
+            return vector
+
+    def _run(self) -> None:
+        while (vector := self._take()) is not None:
+            try:
+                self._vote(vector)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _vote(self, vector: tuple[list[int], list[int]]) -> None:
+        delay = self.backoff
+        attempt = 0
+        while True:
+            change = weights_change(self.last_voted, vector)
+            if change < self.min_change:
+                logger.info(f"Weights moved by {change:.2%} only since the last vote, not voting")
+                self.stats["skipped"] += 1
+                return
+
+            uids, weights = vector
+            try:
+                self.client.vote_encrypted(key=self.key, uids=uids, weights=weights, netuid=self.netuid)
+            except Exception as e:
+                attempt += 1
+                self.stats["failed_attempts"] += 1
+                if attempt >= self.max_retry:
+                    logger.error(f"Failed to vote after {attempt} attempts, dropping the weights: {e}")
+                    self.stats["dropped"] += 1
+                    return
+                logger.error(f"Failed to vote: Attempt {attempt}... Retrying in {delay:.1f}s")
+                with self._condition:
+                    # a newer vector arriving during the backoff is voted instead
+                    self._condition.wait_for(lambda: self._pending is not None, delay)
+                    if self._pending is not None:
+                        vector, self._pending = self._pending, None
+                        self.stats["coalesced"] += 1
+                        attempt = 0
+                delay = min(delay * 2, self.max_backoff)
+            else:
+                logger.info(f"Success to vote on chain for {len(uids)} miners")
+                self.last_voted = vector
+                self.stats["voted"] += 1
+                return